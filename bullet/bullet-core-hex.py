@@ -7,30 +7,40 @@
 import gmsh
 import sys
 import os
-import math
-import pygmsh
-import numpy as np
-import time
+
+# size callbacks are compiled into native gmsh settings by meshtools/sizing.py,
+# the imported STEP is cached as XAO by meshtools/geocache.py and the meshing
+# stages are checkpointed by meshtools/pipeline.py and timed by meshtools/report.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, cache, geocache, sizing, threads
+from meshtools.options import option
+from meshtools.pipeline import Pipeline
+from meshtools.report import Report
 
 gmsh.initialize(sys.argv)
 
 model = gmsh.model 
-option = gmsh.option
 mesh = model.mesh
 
 gmsh.model.add("bullet")
 
-writeFile = '../meshes/bullet-core-hex-lc11.msh'
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+writeFile = os.path.join(args.string("outdir", '../meshes'), 'bullet-core-hex-lc11.' + args.string("format", "msh"))
+
+# time, memory and mesh counts of each stage
+report = Report("bullet-core-hex")
 
-# start timer
-start_time = time.perf_counter()
+# thread count from the measured scaling curve and the other jobs on the host
+# (-nt <n> on the command line overrides it, see meshtools/threads.py)
+threads.auto("bullet-core-hex")
 
 # ----------------------------------------------------------------------------- #
 # 
 # MESHING OPTIONS
 
 # mesh size options
-lc = 1.1
+# (-setnumber lc <value> on the command line overrides it, see meshtools/args.py)
+lc = args.number("lc", 1.1)
 lcmin = lc - 0.1
 
 # algorithms:
@@ -106,9 +116,13 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # import the bullet STEP file
-step_file_path = os.path.abspath('/Users/adminuser/Documents/PhD/bullet models/step files/bullet-core.step')
-v = gmsh.model.occ.importShapes(step_file_path)
+# (-setstring step <file> on the command line, e.g. the bundled bullet-core-standin.step)
+step_file_path = os.path.abspath(args.string("step", '/Users/adminuser/Documents/PhD/bullet models/step files/bullet-core.step'))
+# (translated once, later runs load the cached copy; heal=True to heal it first)
+v = geocache.import_step(step_file_path)
 
 # get the bounding box of the volume:
 # xmin, ymin, zmin, xmax, ymax, zmax = gmsh.model.occ.getBoundingBox(
@@ -185,38 +199,40 @@ gmsh.model.occ.synchronize()
 
 # gmsh.model.occ.synchronize()
 
+report.start("sizing")
+
 # specify a global mesh size and mesh the partitioned model:
 option.setNumber("Mesh.MeshSizeMin", lcmin)
 option.setNumber("Mesh.MeshSizeMax", lc)
 
 # mesh constraints
 # function loops through all elements and adjusts the min size
-def meshSizeCallback(dim, tag, x, y, z, lc):
-    return max(0.5, lc)
-
-gmsh.model.mesh.setSizeCallback(meshSizeCallback)
+# (folded into MeshSizeMin above when possible)
+sizing.apply("max(0.5, lc)")
 
 gmsh.model.geo.synchronize()
 
-gmsh.model.mesh.generate(3)
+# generate, optimise and refine the mesh as stages; each one is checkpointed,
+# so a killed run (or a change to the later stages) resumes from the last one
+pipeline = Pipeline("bullet-core-hex", geometry=cache.file_hash(step_file_path),
+                    callback="max(0.5, lc)")
+pipeline.generate(3)
 
-# optimise and refine the mesh
-mesh.optimize("Relocate3D") # added no extra run time
-mesh.optimize("Laplace2D", niter=1) # smooths a lot but 30 mins extra run time
-mesh.optimize("UntangleMeshGeometry", force=True, niter=1) # 1 min extra run time
-# mesh.optimize("QuadCavityRemeshing", force=True) # doesn't work; no error?
-# mesh.optimize("QuadQuasiStructured", force=True, niter=1) # throws an error
+pipeline.optimize("Relocate3D") # added no extra run time
+pipeline.optimize("Laplace2D", niter=1) # smooths a lot but 30 mins extra run time
+pipeline.optimize("UntangleMeshGeometry", force=True, niter=1) # 1 min extra run time
+# pipeline.optimize("QuadCavityRemeshing", force=True) # doesn't work; no error?
+# pipeline.optimize("QuadQuasiStructured", force=True, niter=1) # throws an error
 
-mesh.refine()
+pipeline.refine()
 
 # Save the mesh
-gmsh.write(writeFile)
+pipeline.write(writeFile)
+
+pipeline.run(run_report=report)
 
-# End timer
-end_time = time.perf_counter()
-# Calculate elapsed time
-elapsed_time = end_time - start_time
-print("Elapsed time: ", elapsed_time)
+# print the time per stage and write it all to a -report.json next to the mesh
+report.finish()
 
 # Finalize Gmsh
 gmsh.finalize()
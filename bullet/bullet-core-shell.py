@@ -7,10 +7,13 @@
 import gmsh
 import sys
 import os
-import math
-import pygmsh
-import numpy as np
-import time
+
+# size callbacks are compiled into native gmsh settings by meshtools/sizing.py,
+# the imported STEP is cached as XAO by meshtools/geocache.py and each stage is
+# timed by meshtools/report.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import geocache, sizing, threads
+from meshtools.report import Report
 
 gmsh.initialize(sys.argv)
 
@@ -20,8 +23,12 @@ mesh = model.mesh
 
 gmsh.model.add("bullet")
 
-# Start timer
-start_time = time.perf_counter()
+# time, memory and mesh counts of each stage
+report = Report("bullet-core-shell")
+
+# thread count from the measured scaling curve and the other jobs on the host
+# (-nt <n> on the command line overrides it, see meshtools/threads.py)
+threads.auto("bullet-core-shell")
 
 # ----------------------------------------------------------------------------- #
 # 
@@ -102,9 +109,12 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # import the bullet STEP file
 step_file_path = os.path.abspath('/Users/adminuser/Documents/PhD/bullet models/step files/bullet-core.step')
-v = gmsh.model.occ.importShapes(step_file_path)
+# (translated once, later runs load the cached copy; heal=True to heal it first)
+v = geocache.import_step(step_file_path)
 
 # get the bounding box of the volume:
 # xmin, ymin, zmin, xmax, ymax, zmax = gmsh.model.occ.getBoundingBox(
@@ -181,20 +191,21 @@ gmsh.model.occ.synchronize()
 
 # gmsh.model.occ.synchronize()
 
+report.start("sizing")
+
 # specify a global mesh size and mesh the partitioned model:
 option.setNumber("Mesh.MeshSizeMin", lcmin)
 option.setNumber("Mesh.MeshSizeMax", lc)
 
 # mesh constraints
 # function loops through all elements and adjusts the min size
-def meshSizeCallback(dim, tag, x, y, z, lc):
-    return max(0.5, lc)
-
-mesh.setSizeCallback(meshSizeCallback)
+# (folded into MeshSizeMin above when possible)
+sizing.apply("max(0.5, lc)")
 
-mesh.generate(3)
+report.generate(3)
 
 # get and delete all volume entities
+report.start("remove volumes")
 volumes = gmsh.model.getEntities(dim=3)
 
 for volume in volumes:
@@ -209,16 +220,13 @@ for volume in volumes:
 
 # try re-building with lines down the quarters 
 
-mesh.refine()
+report.refine()
 
 # Save the mesh
-gmsh.write('../meshes/bullet-shell-trial.msh')
+report.write('../meshes/bullet-shell-trial.msh')
 
-# End timer
-end_time = time.perf_counter()
-# Calculate elapsed time
-elapsed_time = end_time - start_time
-print("Elapsed time: ", elapsed_time)
+# print the time per stage and write it all to a -report.json next to the mesh
+report.finish()
 
 # Finalize Gmsh
 gmsh.finalize()
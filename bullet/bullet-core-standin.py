@@ -0,0 +1,58 @@
+# Maisie E-M, Jul 23
+
+# ------------------------------------------------------------------------------
+#         stand-in STEP file for the AP bullet core (for benchmarks)
+# ------------------------------------------------------------------------------
+
+# the real bullet-core.step isn't in the repo, so the bullet benchmarks mesh
+# this instead: a revolved core of roughly the same size and shape (flat base,
+# straight body, tangent ogive nose with a small flat tip). it meshes to about
+# the same number of elements at the same lc.
+#
+# writes bullet-core-standin.step next to this file:
+#   python bullet-core-standin.py
+
+import gmsh
+import sys
+import os
+import math
+
+gmsh.initialize(sys.argv)
+
+occ = gmsh.model.occ
+
+gmsh.model.add("bullet-standin")
+
+# core dimensions [mm]
+r = 3.1         # body radius
+body = 18.0     # length of the straight part
+nose = 12.0     # length of the ogive
+tip = 0.4       # radius of the flat tip (a sharp point upsets the hex recombination)
+
+# ogive radius, tangent to the body
+R = (nose**2 + (r - tip)**2) / (2*(r - tip))
+
+# half profile in the xz plane
+p1 = occ.addPoint(0, 0, 0)
+p2 = occ.addPoint(r, 0, 0)
+p3 = occ.addPoint(r, 0, body)
+p4 = occ.addPoint(tip, 0, body + nose)
+p5 = occ.addPoint(0, 0, body + nose)
+centre = occ.addPoint(r - R, 0, body)
+
+base = occ.addLine(p1, p2)
+side = occ.addLine(p2, p3)
+ogive = occ.addCircleArc(p3, centre, p4)
+flat = occ.addLine(p4, p5)
+axis = occ.addLine(p5, p1)
+
+profile = occ.addPlaneSurface([occ.addCurveLoop([base, side, ogive, flat, axis])])
+
+# revolve the profile about the z axis
+occ.revolve([(2, profile)], 0, 0, 0, 0, 0, 1, 2*math.pi)
+
+occ.synchronize()
+
+gmsh.write(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bullet-core-standin.step'))
+
+gmsh.finalize()
@@ -7,10 +7,13 @@
 import gmsh
 import sys
 import os
-import math
-import pygmsh
-import numpy as np
-import time
+
+# size callbacks are compiled into native gmsh settings by meshtools/sizing.py,
+# the imported STEP is cached as XAO by meshtools/geocache.py and each stage is
+# timed by meshtools/report.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, geocache, sizing, threads
+from meshtools.report import Report
 
 gmsh.initialize(sys.argv)
 
@@ -20,16 +23,22 @@ mesh = model.mesh
 
 gmsh.model.add("bullet-tet")
 
-writeFile = '../meshes/bullet-core-tet-lc095.msh'
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+writeFile = os.path.join(args.string("outdir", '../meshes'), 'bullet-core-tet-lc095.' + args.string("format", "msh"))
+
+# time, memory and mesh counts of each stage
+report = Report("bullet-core-tet")
 
-# Start timer
-start_time = time.perf_counter()
+# thread count from the measured scaling curve and the other jobs on the host
+# (-nt <n> on the command line overrides it, see meshtools/threads.py)
+threads.auto("bullet-core-tet")
 
 # ----------------------------------------------------------------------------- #
 # 
 # MESHING OPTIONS
 
-lc = 0.95
+# (-setnumber lc <value> on the command line overrides it, see meshtools/args.py)
+lc = args.number("lc", 0.95)
 lcmin = lc - 0.2
 
 # recombination tet -> hex algorithm specification
@@ -64,14 +73,20 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # Load a STEP file (using `importShapes' instead of `merge' allows to directly
 # # retrieve the tags of the highest dimensional imported entities):
 # path = os.path.dirname(os.path.abspath(__file__))
 # v = gmsh.model.occ.importShapes(os.path.join(path, os.pardir, 'bullet-outer.step'))
 
 # import the bullet STEP file
-step_file_path = os.path.abspath('/Users/adminuser/Documents/PhD/bullet models/step files/bullet-core.step')
-v = gmsh.model.occ.importShapes(step_file_path)
+# (-setstring step <file> on the command line, e.g. the bundled bullet-core-standin.step)
+step_file_path = os.path.abspath(args.string("step", '/Users/adminuser/Documents/PhD/bullet models/step files/bullet-core.step'))
+# (translated once, later runs load the cached copy; heal=True to heal it first)
+v = geocache.import_step(step_file_path)
+
+report.start("sizing")
 
 # specify a global mesh size and mesh the partitioned model:
 option.setNumber("Mesh.MeshSizeMin", lc)
@@ -79,32 +94,26 @@ option.setNumber("Mesh.MeshSizeMax", lcmin)
 
 # mesh constraints
 # function loops through all elements and adjusts the min size
-def meshSizeCallback(dim, tag, x, y, z, lc):
-    return max(0.5, lc)
-
-# Register the callback function
-mesh.setSizeCallback(meshSizeCallback)
+# (folded into MeshSizeMin above when possible)
+sizing.apply("max(0.5, lc)")
 
 gmsh.model.occ.synchronize()
 
-gmsh.model.mesh.generate(3)
+report.generate(3)
 
 # optimise and refine the mesh
-mesh.optimize("Relocate3D")  # added no extra run time
-mesh.optimize("Netgen")# added no extra run time
-mesh.optimize("Laplace2D", niter=1)
+report.optimize("Relocate3D")  # added no extra run time
+report.optimize("Netgen")# added no extra run time
+report.optimize("Laplace2D", niter=1)
 # mesh.optimize("UntangleMeshGeometry", force=True, niter=1) # 1 min extra run time
 
-mesh.refine()
+report.refine()
 
 # Save the mesh
-gmsh.write(writeFile)
+report.write(writeFile)
 
-# End timer
-end_time = time.perf_counter()
-# Calculate elapsed time
-elapsed_time = end_time - start_time
-print("Elapsed time: ", elapsed_time)
+# print the time per stage and write it all to a -report.json next to the mesh
+report.finish()
 
 # Finalize Gmsh
 gmsh.finalize()
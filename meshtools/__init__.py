@@ -0,0 +1,12 @@
+# ----------------------------------------------------------------------------- #
+#  shared helpers for the target plate and bullet gmsh scripts
+# ----------------------------------------------------------------------------- #
+#
+# the scripts in `target plate/` and `bullet/` add the repository root to
+# sys.path and import what they need from here, e.g.
+#
+#   from meshtools import targets
+#
+# tools with a command line are run as modules from the repository root, e.g.
+#
+#   python -m meshtools.sweep plate grid.json -j 32
@@ -0,0 +1,30 @@
+# ----------------------------------------------------------------------------- #
+#  script parameters from gmsh's own -setnumber / -setstring arguments
+# ----------------------------------------------------------------------------- #
+#
+# the scripts pass sys.argv to gmsh.initialize, so the usual gmsh way of
+# overriding a parameter works for them too:
+#
+#   python plate-ustruct-hex.py -setnumber lc 0.2 -setstring outdir /tmp/meshes
+#
+# in the script, after gmsh.initialize(sys.argv):
+#
+#   lc = args.number("lc", 1e-1)
+#
+# gives 0.2 here and the default 1e-1 when it isn't on the command line. the
+# benchmark suite (bench.py) runs the scripts at other resolutions this way.
+
+import gmsh
+
+
+def number(name, default):
+    """-setnumber name value from the command line, or default"""
+    value = gmsh.parser.getNumber(name)
+    # a numpy array when numpy is installed, which has no truth value
+    return float(value[0]) if len(value) else default
+
+
+def string(name, default):
+    """-setstring name value from the command line, or default"""
+    value = gmsh.parser.getString(name)
+    return value[0] if len(value) else default
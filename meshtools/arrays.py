@@ -0,0 +1,242 @@
+# ----------------------------------------------------------------------------- #
+#  the current mesh as numpy arrays, and as memory-mapped .npy files
+# ----------------------------------------------------------------------------- #
+#
+# every tool downstream of the scripts parses the .msh again. after generate /
+# refine, the mesh can instead be taken as arrays:
+#
+#   m = arrays.extract()                    # elements of the highest dimension
+#   m.nodes                                 # (n, 3) float64
+#   m.elements["hexahedra"]                 # (k, 8) int32, rows of m.nodes
+#   m.node_tags[m.elements["hexahedra"]]    # gmsh's node tags, if needed
+#
+# and dumped as one .npy file per array, which numpy opens memory-mapped
+# without parsing anything (and without gmsh):
+#
+#   arrays.dump(m, "ustruct-refined")
+#   m = arrays.load("ustruct-refined")      # np.load(..., mmap_mode="r")
+#
+# the scripts write it with -setstring format npy (lsdyna.save), or from a
+# mesh file:
+#
+#   python -m meshtools.arrays dump ustruct-refined.msh [--float32]
+#   python -m meshtools.arrays info ustruct-refined
+#
+# gmsh's python API hands back numpy arrays over its own buffers, so the
+# coordinates are used as they come (reshaped, not copied) unless float32 is
+# asked for. node tags are remapped to dense 0-based row numbers in the order
+# of m.nodes through a lookup table, and the connectivity of each element
+# type is written straight into an array of the smallest index dtype that
+# holds them (int32 below 2^31 nodes), one entity at a time, so gmsh's
+# uint64 connectivity is never held for more than one entity at once. per
+# element there is also its gmsh tag and the tag of its entity; the physical
+# groups of the entities are in m.physicals.
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+
+# element type -> array name (the linear types, others are "type<n>")
+NAMES = {15: "points", 1: "lines", 2: "triangles", 3: "quadrangles", 4: "tetrahedra",
+         5: "hexahedra", 6: "prisms", 7: "pyramids"}
+
+# the description of a dump, next to its arrays
+META = "mesh.json"
+
+
+def index_dtype(count):
+    """smallest signed integer dtype for row numbers up to count"""
+    return np.dtype(np.int32) if count < 2**31 else np.dtype(np.int64)
+
+
+def tag_dtype(largest):
+    """smallest unsigned integer dtype for gmsh tags up to largest"""
+    return np.dtype(np.uint32) if largest < 2**32 else np.dtype(np.uint64)
+
+
+class MeshArrays:
+    """nodes, node tags and per-type connectivity of a mesh as numpy arrays
+
+    elements, element_tags and entities are dicts by array name (NAMES),
+    physicals is {entity tag: [physical group tags]} of the element entities,
+    and fields are any other values per element, {field: {array name: values}}
+    """
+
+    def __init__(self, nodes, node_tags, elements, element_tags, entities, dim, physicals=None,
+                 fields=None):
+        self.nodes = nodes
+        self.node_tags = node_tags
+        self.elements = elements
+        self.element_tags = element_tags
+        self.entities = entities
+        self.dim = dim
+        self.physicals = physicals or {}
+        self.fields = fields or {}
+
+    def counts(self):
+        counts = {"nodes": len(self.nodes)}
+        counts.update({name: len(block) for name, block in self.elements.items()})
+        return counts
+
+    def nbytes(self):
+        groups = [self.elements, self.element_tags, self.entities] + list(self.fields.values())
+        blocks = [self.nodes, self.node_tags] + [block for group in groups for block in group.values()]
+        return sum(block.nbytes for block in blocks)
+
+    def __repr__(self):
+        return "MeshArrays(%s)" % ", ".join("%s=%d" % item for item in self.counts().items())
+
+# ----------------------------------------------------------------------------- #
+#
+# EXTRACT
+
+def _element_dim(model):
+    for dim in (3, 2, 1, 0):
+        if any(len(model.mesh.getElementTypes(dim, tag)) for _, tag in model.getEntities(dim)):
+            return dim
+    raise ValueError("the mesh has no elements")
+
+
+def extract(dim=None, float32=False):
+    """the nodes and the elements of dimension `dim` (default: the highest
+    there are) of the current mesh as a MeshArrays"""
+    import gmsh
+
+    model = gmsh.model
+    mesh = model.mesh
+    dim = _element_dim(model) if dim is None else dim
+
+    # every node once, in gmsh's order, which is the row order
+    node_tags, coords, _ = mesh.getNodes(-1, -1, includeBoundary=False, returnParametricCoord=False)
+    nodes = coords.reshape(-1, 3)
+    if float32:
+        nodes = nodes.astype(np.float32)
+    index = index_dtype(len(node_tags))
+    rows = np.zeros(int(node_tags.max()) + 1 if len(node_tags) else 1, dtype=index)
+    rows[node_tags] = np.arange(len(node_tags), dtype=index)
+    tags = node_tags.astype(tag_dtype(mesh.getMaxNodeTag()))
+    element_tag_dtype = tag_dtype(mesh.getMaxElementTag())
+
+    entities = model.getEntities(dim)
+    blocks = {}
+    for _, tag in entities:
+        for element_type in mesh.getElementTypes(dim, tag):
+            element_tags, node_blocks = mesh.getElementsByType(element_type, tag)
+            blocks.setdefault(int(element_type), []).append((tag, element_tags, node_blocks))
+
+    elements, element_tags, element_entities = {}, {}, {}
+    for element_type, parts in sorted(blocks.items()):
+        name = NAMES.get(element_type, "type%d" % element_type)
+        total = sum(len(t) for _, t, _ in parts)
+        per_element = len(parts[0][2]) // max(len(parts[0][1]), 1)
+        connectivity = np.empty((total, per_element), dtype=index)
+        tags_out = np.empty(total, dtype=element_tag_dtype)
+        entity_out = np.empty(total, dtype=np.int32)
+        start = 0
+        for entity, t, n in parts:
+            end = start + len(t)
+            # gmsh's node tags -> rows, written in place in the compact dtype
+            np.take(rows, n.reshape(-1, per_element), out=connectivity[start:end])
+            tags_out[start:end] = t
+            entity_out[start:end] = entity
+            start = end
+        # the list held gmsh's arrays of each entity until here
+        parts.clear()
+        elements[name], element_tags[name], element_entities[name] = connectivity, tags_out, entity_out
+
+    physicals = {tag: [int(group) for group in model.getPhysicalGroupsForEntity(dim, tag)]
+                 for _, tag in entities}
+    return MeshArrays(nodes, tags, elements, element_tags, element_entities, dim,
+                      {tag: groups for tag, groups in physicals.items() if groups})
+
+# ----------------------------------------------------------------------------- #
+#
+# .NPY FILES
+
+def _files(m):
+    """{file name: array} of a MeshArrays"""
+    files = {"nodes.npy": m.nodes, "node_tags.npy": m.node_tags}
+    for name in m.elements:
+        files[name + ".npy"] = m.elements[name]
+        files[name + "-tags.npy"] = m.element_tags[name]
+        files[name + "-entities.npy"] = m.entities[name]
+    return files
+
+
+def dump(m, folder):
+    """one .npy file per array of `m` in folder, and a mesh.json describing them"""
+    os.makedirs(folder, exist_ok=True)
+    files = _files(m)
+    for name, block in files.items():
+        np.save(os.path.join(folder, name), np.ascontiguousarray(block))
+    meta = {"dim": m.dim, "counts": m.counts(), "types": list(m.elements),
+            "physicals": {str(tag): groups for tag, groups in m.physicals.items()},
+            "files": {name: {"dtype": str(block.dtype), "shape": list(block.shape)}
+                      for name, block in files.items()}}
+    with open(os.path.join(folder, META), "w") as f:
+        json.dump(meta, f, indent=1)
+    return folder
+
+
+def load(folder, mmap_mode="r"):
+    """a MeshArrays of the .npy files dump() wrote, memory-mapped by default"""
+    with open(os.path.join(folder, META)) as f:
+        meta = json.load(f)
+
+    def array(name):
+        return np.load(os.path.join(folder, name), mmap_mode=mmap_mode)
+
+    return MeshArrays(array("nodes.npy"), array("node_tags.npy"),
+                      {name: array(name + ".npy") for name in meta["types"]},
+                      {name: array(name + "-tags.npy") for name in meta["types"]},
+                      {name: array(name + "-entities.npy") for name in meta["types"]},
+                      meta["dim"], {int(tag): groups for tag, groups in meta["physicals"].items()})
+
+
+def save(path, float32=False):
+    """the current mesh dumped to `path` without its extension, e.g.
+    ustruct-refined.npy -> ustruct-refined/"""
+    return dump(extract(float32=float32), os.path.splitext(path)[0])
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.arrays",
+                                     description="mesh files as memory-mapped numpy arrays")
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump_parser = commands.add_parser("dump", help="write a mesh file as .npy arrays")
+    dump_parser.add_argument("mesh")
+    dump_parser.add_argument("-o", "--out", help="folder (default: the mesh without its extension)")
+    dump_parser.add_argument("--float32", action="store_true", help="float32 coordinates")
+    dump_parser.add_argument("--dim", type=int, help="element dimension (default: the highest)")
+    info_parser = commands.add_parser("info", help="the arrays of a dump")
+    info_parser.add_argument("folder")
+    args = parser.parse_args(argv)
+
+    if args.command == "dump":
+        import gmsh
+
+        gmsh.initialize()
+        gmsh.option.setNumber("General.Terminal", 0)
+        try:
+            gmsh.open(args.mesh)
+            m = extract(args.dim, args.float32)
+            folder = dump(m, args.out or os.path.splitext(args.mesh)[0])
+        finally:
+            gmsh.finalize()
+        print("%r (%.1f MB) written to %s" % (m, m.nbytes() / 2**20, folder))
+    else:
+        m = load(args.folder)
+        print(m)
+        for name, block in _files(m).items():
+            print("  %-24s %-8s %s" % (name, block.dtype, "x".join(map(str, block.shape))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
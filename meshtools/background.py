@@ -0,0 +1,139 @@
+# ----------------------------------------------------------------------------- #
+#  numpy-sampled background size field for the refined targets
+# ----------------------------------------------------------------------------- #
+#
+# the impact-zone size is normally the field chain
+#
+#   Distance(line l) -> MathEval(F) , Cylinder(r1) , Cylinder(r2) -> Min
+#
+# which gmsh evaluates point by point while meshing. with
+# background="sampled" the same function is evaluated once, vectorised, on a
+# structured grid over the target, loaded as a post-processing view and used
+# as the background mesh through a PostView field.
+#
+# the sampled grid is cached (see cache.py) under a hash of the parameters the
+# size function depends on, so repeated runs and sweeps over e.g. the optimise
+# passes only load it.
+
+import math
+import os
+import time
+
+import gmsh
+import numpy as np
+
+from meshtools import cache
+
+# parameters the size function depends on, for the cache key
+_KEYS = ("lc", "lcsmaller", "lcsmallest", "r1", "r2", "F", "h", "l", "rcyl", "zaxis", "spacing")
+
+# MathEval functions that may appear in F
+_NUMPY = {"sqrt": np.sqrt, "exp": np.exp, "log": np.log, "abs": np.abs,
+          "sin": np.sin, "cos": np.cos, "min": np.minimum, "max": np.maximum}
+
+# corners of a gmsh hexahedron as (i, j, k) offsets
+_HEX = [(0, 0, 0), (1, 0, 0), (1, 1, 0), (0, 1, 0),
+        (0, 0, 1), (1, 0, 1), (1, 1, 1), (0, 1, 1)]
+
+
+def bounds(kind, p):
+    """bounding box of the target as (xmin, ymin, zmin), (xmax, ymax, zmax)"""
+    if kind == "plate":
+        return (0, 0, 0), (p["l"], p["l"], p["h"])
+    r = p["rcyl"]
+    return (-r, -r, 0), (r, r, p["h"])
+
+
+def size(p, centre, x, y, z):
+    """the Min of the MathEval and Cylinder fields in targets.add_impact_fields
+
+    x, y, z are arrays; line l runs through the whole thickness, so the
+    Distance field is the distance from the axis. the cylinders reach
+    p["zaxis"] (default 1, their ZAxis) either side of z = 0.
+    """
+    xc, yc = centre
+    r = np.hypot(x - xc, y - yc)
+
+    # MathEval: F(F1) + lcsmallest
+    formula = p["F"].replace("^", "**")
+    namespace = {"__builtins__": {}}
+    namespace.update(_NUMPY)
+    value = eval(formula, namespace, {"F1": r}) + p["lcsmallest"]
+    value = np.broadcast_to(value, r.shape)
+
+    # Cylinder fields: VIn for r < Radius and |z - ZCenter| < |ZAxis|
+    axial = np.abs(z) < p.get("zaxis", 1)
+    for radius, vin in ((p["r1"], p["lcsmaller"]), (p["r2"], p["lcsmallest"])):
+        value = np.minimum(value, np.where((r < radius) & axial, vin, p["lc"]))
+    return value
+
+
+def sample(kind, p, centre):
+    """size on a structured grid, from the cache when possible
+
+    returns (origin, steps, values, cached) with values[i, j, k] the size at
+    origin + (i, j, k) * steps.
+    """
+    path = os.path.join(cache.directory("background"),
+                        cache.key(kind, {k: p.get(k) for k in _KEYS}) + ".npz")
+    if os.path.exists(path):
+        with np.load(path) as data:
+            return data["origin"], data["steps"], data["values"], True
+
+    lo, hi = np.array(bounds(kind, p)[0], float), np.array(bounds(kind, p)[1], float)
+    spacing = p.get("spacing") or p["lcsmallest"]/2
+    # pad by a cell so points on the boundary are always found in the view
+    lo[:2] -= spacing
+    hi[:2] += spacing
+    counts = [max(1, math.ceil((b - a)/spacing)) for a, b in zip(lo, hi)]
+    # everything inside the target is within the cylinders' axial extent, so
+    # the size doesn't change through the thickness and one layer is enough
+    if p["h"] < p.get("zaxis", 1):
+        counts[2] = 1
+    steps = (hi - lo)/counts
+
+    axes = [a + s*np.arange(n + 1) for a, s, n in zip(lo, steps, counts)]
+    x, y, z = np.meshgrid(*axes, indexing="ij")
+    values = size(p, centre, x, y, z)
+
+    with cache.atomic(path) as tmp:
+        with open(tmp, "wb") as f:
+            np.savez(f, origin=lo, steps=steps, values=values)
+    return lo, steps, values, False
+
+
+def add_view(origin, steps, values, name="background size"):
+    """scalar hexahedra view ("SH" list data) of a structured grid"""
+    nx, ny, nz = (n - 1 for n in values.shape)
+    i, j, k = np.meshgrid(np.arange(nx), np.arange(ny), np.arange(nz), indexing="ij")
+    i, j, k = i.ravel(), j.ravel(), k.ravel()
+
+    corners = [(i + a, j + b, k + c) for a, b, c in _HEX]
+    coords = [np.stack([origin[d] + steps[d]*corner[d] for corner in corners], axis=1)
+              for d in range(3)]
+    sizes = np.stack([values[corner] for corner in corners], axis=1)
+
+    # per element: 8 x, 8 y, 8 z, then the 8 nodal values
+    data = np.hstack(coords + [sizes])
+
+    view = gmsh.view.add(name)
+    gmsh.view.addListData(view, "SH", len(data), data.ravel())
+    return view
+
+
+def apply(kind, p, centre):
+    """sample the size function, load it and set it as the background mesh
+
+    returns (field tag, info) with info on the grid and whether it was cached
+    """
+    start_time = time.perf_counter()
+    origin, steps, values, cached = sample(kind, p, centre)
+    view = add_view(origin, steps, values)
+
+    field = gmsh.model.mesh.field.add("PostView")
+    gmsh.model.mesh.field.setNumber(field, "ViewTag", view)
+    gmsh.model.mesh.field.setAsBackgroundMesh(field)
+
+    info = {"cached": cached, "grid": [n - 1 for n in values.shape], "view": view,
+            "seconds": round(time.perf_counter() - start_time, 3)}
+    return field, info
@@ -0,0 +1,439 @@
+# ----------------------------------------------------------------------------- #
+#  local batch of mesh jobs, admitted by memory and thread demand
+# ----------------------------------------------------------------------------- #
+#
+# two production plates running side by side on one node can need more memory
+# than it has, and then the OOM killer takes both. instead of starting the
+# scripts by hand, queue them in a job directory:
+#
+#   python -m meshtools.batch submit jobs "target plate/plate-ustruct-hex.py" -setnumber lc 0.05
+#   python -m meshtools.batch submit jobs bullet/bullet-core-hex.py --threads 4 --memory-mb 6000
+#   python -m meshtools.batch run jobs
+#   python -m meshtools.batch status jobs
+#
+# every job is a json file in the directory with its script, arguments,
+# memory reservation and threads, and the time, cpu and peak memory of each
+# of its runs. `run` starts the queued jobs, each as its own process, as long
+# as the reservations of the running jobs plus the new one fit in the memory
+# budget (default: MEMORY_FRACTION of the memory available when it starts),
+# the new one fits in the memory available right now (less what the running
+# jobs still have to grow to their reservations), and the threads fit in the
+# cores. jobs that don't fit wait, while the later ones that do fit run.
+#
+# the reservation of a job is, first found:
+#   --memory-mb given to submit
+#   the prediction of the script's dry run (-setnumber dry_run 1, the scripts
+#     that call predict.guard, see predict.py)
+#   the largest peak memory of earlier runs of the same job in the directory,
+#     or of the script in the run history (~/.cache/meshtools/runs)
+#   DEFAULT_MEMORY_MB
+# times MARGIN. --threads 0 (the default) takes the thread count of the
+# script's scaling curve for the free cores of the batch (see threads.py).
+#
+# a job that is killed with SIGKILL (e.g. by the OOM killer) is queued again,
+# up to --attempts times, with its reservation raised to GROWTH times the old
+# one or MARGIN times the peak it reached, whichever is more; a job that exits
+# with an error or dies of any other signal (a segfault) is marked failed. the runs of a job are appended to its file,
+# and its output goes to <job directory>/<job>/ (with a log.txt) unless its
+# arguments give -setstring outdir. `run` can be stopped and started again:
+# the running jobs are stopped and queued again, and the jobs of a run that
+# died are picked up where they were.
+
+import argparse
+import datetime
+import glob
+import json
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+import time
+
+from meshtools import cache, predict, stats, threads
+
+# share of the memory available at the start that the batch reserves
+MEMORY_FRACTION = 0.9
+
+# reservation of a job nothing is known about
+DEFAULT_MEMORY_MB = 2048
+
+# safety factor on predicted and observed peaks, and on the reservation of a
+# job that was killed
+MARGIN = 1.2
+GROWTH = 1.5
+
+# runs of a job before it is given up
+ATTEMPTS = 3
+
+# seconds between checks of the running jobs
+POLL = 1.0
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+# ----------------------------------------------------------------------------- #
+#
+# JOB FILES
+
+def _now():
+    return datetime.datetime.now().isoformat(timespec="seconds")
+
+
+def load(folder):
+    """every job of a job directory, in order of submission"""
+    jobs = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.json"))):
+        # skip the files cache.atomic is still writing
+        if ".tmp" in os.path.basename(path):
+            continue
+        try:
+            with open(path) as f:
+                jobs.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return jobs
+
+
+def save(folder, job):
+    with cache.atomic(os.path.join(folder, job["id"] + ".json")) as tmp:
+        with open(tmp, "w") as f:
+            json.dump(job, f, indent=1)
+
+
+def report_name(script):
+    """the run report name of a script, which its history is kept under"""
+    try:
+        with open(script, encoding="utf-8") as f:
+            found = re.search(r'Report\("([^"]+)"', f.read())
+    except OSError:
+        found = None
+    return found.group(1) if found else os.path.splitext(os.path.basename(script))[0]
+
+
+def dry_run(script, script_args):
+    """the prediction printed by the script's dry run, None if it has none"""
+    with open(script, encoding="utf-8") as f:
+        if "predict.guard" not in f.read():
+            return None
+    # the prediction is printed even when the guard rejects the run
+    result = subprocess.run([sys.executable, os.path.basename(script)] + list(script_args)
+                            + ["-setnumber", "dry_run", "1", "-nt", "1"],
+                            cwd=os.path.dirname(script) or ".", capture_output=True, text=True)
+    found = re.search(r"predicted: (\d+) elements, (\d+) nodes, (\d+) MB peak, (\d+) s", result.stdout)
+    if not found:
+        return None
+    elements, nodes, peak, wall = (int(value) for value in found.groups())
+    return {"elements": elements, "nodes": nodes, "peak_rss_mb": peak, "wall_s": wall}
+
+
+def observed_mb(folder, job):
+    """largest peak of earlier runs of the same job, else of the script's history"""
+    peaks = [run["peak_rss_mb"] for other in load(folder)
+             if other["script"] == job["script"] and other["args"] == job["args"]
+             for run in other["runs"] if run.get("peak_rss_mb") and run["state"] == DONE]
+    if not peaks:
+        peaks = [run["peak_rss_mb"] for run in predict.history(job["name"])]
+    return max(peaks) if peaks else None
+
+
+def estimate(folder, job):
+    """(memory MB to reserve, where it comes from)"""
+    prediction = dry_run(job["script"], job["args"])
+    if prediction:
+        job["prediction"] = prediction
+        return MARGIN * prediction["peak_rss_mb"], "prediction"
+    observed = observed_mb(folder, job)
+    if observed:
+        return MARGIN * observed, "observed"
+    return MARGIN * DEFAULT_MEMORY_MB, "default"
+
+
+def submit(folder, script, script_args, memory_mb=None, thread_count=0):
+    """add a job to the job directory, returns it"""
+    os.makedirs(folder, exist_ok=True)
+    script = os.path.abspath(script)
+    if "-nt" in script_args:
+        thread_count = int(script_args[list(script_args).index("-nt") + 1])
+    job = {"script": script, "args": list(script_args), "name": report_name(script),
+           "threads": thread_count, "state": QUEUED, "attempts": 0, "submitted": _now(), "runs": []}
+    if memory_mb:
+        job["memory_mb"], job["memory_source"] = float(memory_mb), "given"
+    else:
+        memory_mb, job["memory_source"] = estimate(folder, job)
+        job["memory_mb"] = round(memory_mb)
+
+    # numbered in order of submission, the number is taken by creating the file
+    number = len(glob.glob(os.path.join(folder, "*.json")))
+    while True:
+        number += 1
+        job["id"] = "%04d-%s" % (number, job["name"])
+        try:
+            os.close(os.open(os.path.join(folder, job["id"] + ".json"), os.O_CREAT | os.O_EXCL))
+            break
+        except FileExistsError:
+            continue
+    save(folder, job)
+    return job
+
+# ----------------------------------------------------------------------------- #
+#
+# PROCESSES
+
+def _group_rss_mb(pgid):
+    """resident memory of every process in a process group"""
+    total = 0
+    for stat in glob.glob("/proc/[0-9]*/stat"):
+        try:
+            with open(stat) as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+            if int(fields[2]) == pgid:
+                # rss in pages is field 24, the 22nd after the name
+                total += int(fields[21])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total * resource.getpagesize() / 2**20
+
+
+def _run_report(outdir, since):
+    """the run report the job wrote, None if there isn't one"""
+    reports = [path for path in glob.glob(os.path.join(outdir, "*-report.json"))
+               if os.path.getmtime(path) >= since]
+    if not reports:
+        return None
+    with open(max(reports, key=os.path.getmtime)) as f:
+        return json.load(f)
+
+
+class Running:
+    """a job's process, its peak memory sampled while it runs"""
+
+    def __init__(self, folder, job, thread_count):
+        self.job = job
+        self.threads = thread_count
+        self.outdir = os.path.join(folder, job["id"])
+        os.makedirs(self.outdir, exist_ok=True)
+        argv = [sys.executable, os.path.basename(job["script"])] + job["args"]
+        if "outdir" not in job["args"]:
+            argv += ["-setstring", "outdir", self.outdir]
+        if "-nt" not in job["args"]:
+            argv += ["-nt", str(thread_count)]
+        self.started = time.time()
+        self.start_wall = time.perf_counter()
+        with open(os.path.join(self.outdir, "log.txt"), "a") as log:
+            # a session of its own, so the job and its workers are one group
+            self.process = subprocess.Popen(argv, cwd=os.path.dirname(job["script"]), stdout=log,
+                                            stderr=subprocess.STDOUT, start_new_session=True)
+        self.pid = self.process.pid
+        self.rss_mb = 0.0
+        self.peak_mb = 0.0
+
+    def sample(self):
+        self.rss_mb = _group_rss_mb(self.pid)
+        self.peak_mb = max(self.peak_mb, self.rss_mb)
+
+    def reserved_mb(self):
+        return max(self.job["memory_mb"], self.rss_mb)
+
+    def wait(self):
+        """the row of the finished run, None while it runs"""
+        pid, status, usage = os.wait4(self.pid, os.WNOHANG)
+        if not pid:
+            return None
+        self.process.returncode = code = os.waitstatus_to_exitcode(status)
+        row = {"started": datetime.datetime.fromtimestamp(self.started).isoformat(timespec="seconds"),
+               "threads": self.threads, "memory_mb": self.job["memory_mb"], "returncode": code,
+               "wall_s": round(time.perf_counter() - self.start_wall, 3),
+               "cpu_s": round(usage.ru_utime + usage.ru_stime, 3),
+               # ru_maxrss of the job itself, the sampled peak of its whole group
+               "peak_rss_mb": round(max(self.peak_mb, stats.maxrss_mb(usage.ru_maxrss)), 1)}
+        if code < 0:
+            row["signal"] = signal.Signals(-code).name
+        run_report = _run_report(self.outdir, self.started)
+        if run_report is not None:
+            counts = run_report["stages"][-1]["counts"] if run_report["stages"] else {}
+            row.update(report_wall_s=run_report["wall_s"], report_peak_rss_mb=run_report["peak_rss_mb"],
+                       elements=counts.get("elements", 0), nodes=counts.get("nodes", 0))
+        # only SIGKILL is taken for the OOM killer, more memory won't help a segfault
+        row["state"] = DONE if code == 0 else (QUEUED if code == -signal.SIGKILL else FAILED)
+        return row
+
+    def stop(self):
+        try:
+            os.killpg(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+        self.process.wait()
+
+# ----------------------------------------------------------------------------- #
+#
+# SCHEDULER
+
+def _fits(job, running, others, budget_mb, cpus, waiting=1):
+    """(fits, threads) of a queued job next to the running ones"""
+    free_cpus = cpus - sum(r.threads for r in running) - sum(other["threads"] or 1 for other in others)
+    # the free cores are shared by the jobs waiting for them
+    thread_count = job["threads"] or threads.choose(job["name"], max(free_cpus // max(waiting, 1), 1))[0]
+    if not (running or others):
+        return True, thread_count
+    if thread_count > free_cpus:
+        return False, thread_count
+    reserved = sum(r.reserved_mb() for r in running) + sum(other["memory_mb"] for other in others)
+    if reserved + job["memory_mb"] > budget_mb:
+        return False, thread_count
+    # what the running jobs may still grow by is not available to this one
+    available = predict.available_mb()
+    growing = sum(max(0.0, r.job["memory_mb"] - r.rss_mb) for r in running)
+    if available is not None and available - growing < job["memory_mb"]:
+        return False, thread_count
+    return True, thread_count
+
+
+def _finish(folder, job, row, attempts):
+    job["runs"].append(row)
+    job["state"] = row["state"]
+    job.pop("pid", None)
+    if row["state"] == QUEUED:
+        if job["attempts"] >= attempts:
+            job["state"] = FAILED
+        else:
+            # killed, most likely for memory: ask for more next time
+            job["memory_mb"] = round(max(GROWTH * job["memory_mb"], MARGIN * row["peak_rss_mb"]))
+            job["memory_source"] = "requeued"
+    save(folder, job)
+    print("%s %s: %s, %.0f s, %.0f MB peak%s" % (
+        _now(), job["id"], job["state"], row["wall_s"], row["peak_rss_mb"],
+        ", " + row["signal"] if "signal" in row else ""))
+
+
+def _orphan(folder, job):
+    """True while a job started by an earlier run of the scheduler is still
+    running; once it isn't, it is done if it wrote its run report, else queued"""
+    if job.get("pid") and threads._alive(job["pid"]):
+        return True
+    run_report = _run_report(os.path.join(folder, job["id"]), job.get("started_at", 0))
+    job.pop("pid", None)
+    if run_report is None:
+        job["state"] = QUEUED
+    else:
+        job["state"] = DONE
+        job["runs"].append({"state": DONE, "threads": run_report["threads"],
+                            "wall_s": run_report["wall_s"], "peak_rss_mb": run_report["peak_rss_mb"]})
+    save(folder, job)
+    return False
+
+
+def run(folder, budget_mb=None, cpus=None, attempts=ATTEMPTS, watch=False):
+    """run the queued jobs of a job directory until none are left"""
+    if budget_mb is None:
+        available = predict.available_mb()
+        budget_mb = MEMORY_FRACTION * available if available else DEFAULT_MEMORY_MB
+    cpus = cpus or os.cpu_count() or 1
+    print("%s batch of %s: %.0f MB, %d cores" % (_now(), folder, budget_mb, cpus))
+    running = []
+    try:
+        while True:
+            ours = set(r.job["id"] for r in running)
+            others = [job for job in load(folder)
+                      if job["state"] == RUNNING and job["id"] not in ours and _orphan(folder, job)]
+            queued = [job for job in load(folder) if job["state"] == QUEUED]
+            if not (running or others or queued or watch):
+                break
+
+            for runner in running:
+                runner.sample()
+            for k, job in enumerate(queued):
+                if job["memory_mb"] > budget_mb and not (running or others):
+                    job["state"], job["reason"] = FAILED, "needs %.0f MB of a %.0f MB budget" % (
+                        job["memory_mb"], budget_mb)
+                    save(folder, job)
+                    print("%s %s: %s" % (_now(), job["id"], job["reason"]))
+                    continue
+                fits, thread_count = _fits(job, running, others, budget_mb, cpus, len(queued) - k)
+                if not fits:
+                    continue
+                job["state"], job["attempts"] = RUNNING, job["attempts"] + 1
+                runner = Running(folder, job, thread_count)
+                job["pid"], job["started_at"] = runner.pid, runner.started
+                save(folder, job)
+                running.append(runner)
+                runner.sample()
+                print("%s %s: started, %d thread%s, %.0f MB reserved (%s)" % (
+                    _now(), job["id"], thread_count, "" if thread_count == 1 else "s",
+                    job["memory_mb"], job["memory_source"]))
+
+            time.sleep(POLL)
+            for runner in list(running):
+                row = runner.wait()
+                if row is not None:
+                    running.remove(runner)
+                    _finish(folder, runner.job, row, attempts)
+    except KeyboardInterrupt:
+        # stopping the batch isn't the job's fault: it is queued again as it was
+        for runner in running:
+            runner.stop()
+            runner.job["state"], runner.job["attempts"] = QUEUED, runner.job["attempts"] - 1
+            runner.job.pop("pid", None)
+            save(folder, runner.job)
+        print("stopped, %d running jobs queued again" % len(running))
+        return 1
+    return 0
+
+
+def table(jobs):
+    lines = ["%-32s %-8s %4s %4s %10s %10s %10s" % (
+        "job", "state", "runs", "nt", "memory MB", "peak MB", "wall s")]
+    for job in jobs:
+        last = job["runs"][-1] if job["runs"] else {}
+        lines.append("%-32s %-8s %4d %4s %10.0f %10s %10s" % (
+            job["id"], job["state"], len(job["runs"]), job["threads"] or "auto", job["memory_mb"],
+            "%.0f" % last["peak_rss_mb"] if last else "-", "%.1f" % last["wall_s"] if last else "-"))
+    return "\n".join(lines)
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.batch",
+                                     description="local batch of mesh jobs, admitted by memory and threads")
+    commands = parser.add_subparsers(dest="command", required=True)
+    submit_parser = commands.add_parser("submit", help="queue a script with its arguments")
+    submit_parser.add_argument("folder", help="job directory")
+    submit_parser.add_argument("--memory-mb", type=float, help="memory to reserve (default: predicted or observed)")
+    submit_parser.add_argument("--threads", type=int, default=0, help="threads of the job (0: from its scaling curve)")
+    submit_parser.add_argument("script")
+    submit_parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments of the script")
+    run_parser = commands.add_parser("run", help="run the queued jobs")
+    run_parser.add_argument("folder", help="job directory")
+    run_parser.add_argument("--memory-mb", type=float, help="memory budget (default: %d%% of the available memory)"
+                            % (100 * MEMORY_FRACTION))
+    run_parser.add_argument("--cpus", type=int, help="cores of the batch (default: all)")
+    run_parser.add_argument("--attempts", type=int, default=ATTEMPTS, help="runs of a job that is killed")
+    run_parser.add_argument("--watch", action="store_true", help="keep waiting for new jobs")
+    status_parser = commands.add_parser("status", help="the jobs and their last run")
+    status_parser.add_argument("folder", help="job directory")
+    requeue_parser = commands.add_parser("requeue", help="queue failed jobs again")
+    requeue_parser.add_argument("folder", help="job directory")
+    requeue_parser.add_argument("jobs", nargs="*", help="job ids (default: every failed job)")
+    args = parser.parse_args(argv)
+
+    if args.command == "submit":
+        job = submit(args.folder, args.script, args.args, args.memory_mb, args.threads)
+        print("%s: %.0f MB (%s)" % (job["id"], job["memory_mb"], job["memory_source"]))
+    elif args.command == "run":
+        return run(args.folder, args.memory_mb, args.cpus, args.attempts, args.watch)
+    elif args.command == "status":
+        print(table(load(args.folder)))
+    else:
+        for job in load(args.folder):
+            if job["state"] == FAILED and (not args.jobs or job["id"] in args.jobs):
+                job["state"], job["attempts"] = QUEUED, 0
+                job.pop("reason", None)
+                save(args.folder, job)
+                print("%s: queued" % job["id"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,316 @@
+# ----------------------------------------------------------------------------- #
+#  benchmark suite: every mesh script at small, medium and production sizes
+# ----------------------------------------------------------------------------- #
+#
+# runs the scripts themselves, each in a fresh process with a cold cache, at
+# the mesh sizes in CASES (passed as -setnumber, see args.py), and records
+# the run time, peak memory, element count and element quality percentiles
+# of each run:
+#
+#   python -m meshtools.bench                         # small and medium runs
+#   python -m meshtools.bench plate-ustruct-hex --sizes production
+#   python -m meshtools.bench --save-baseline         # store as the baseline
+#   python -m meshtools.bench -t wall_s=0.5           # compare with 50% slack
+#
+# the results are written to bench.json in the -k folder, or in the cache
+# (~/.cache/meshtools/bench) without one, unless -o is given. they are
+# compared with the baseline json (bench-baseline.json unless --baseline is
+# given) and the command exits with 1 if anything regressed:
+#
+#   wall_s, peak_rss_mb   slower / bigger than baseline * (1 + threshold)
+#   elements              more than threshold (relative) away from baseline
+#   quality               a quality percentile dropped by more than threshold
+#
+# thresholds default to THRESHOLDS, can be stored in the baseline under
+# "thresholds" and are overridden by -t. wall time differences below
+# wall_abs_s seconds are never counted, small runs are too noisy for that.
+#
+# the bullet scripts mesh bullet/bullet-core-standin.step, so the suite runs
+# on any machine with gmsh.
+
+import argparse
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import gmsh
+import numpy as np
+
+from meshtools import cache
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STANDIN = os.path.join(REPO, "bullet", "bullet-core-standin.step")
+
+# script, -setnumber values per size, -setstring values; production is what
+# the scripts use by default
+CASES = {
+    "plate-ustruct-hex": {
+        "script": "target plate/plate-ustruct-hex.py",
+        "sizes": {"small": {"lc": 0.4}, "medium": {"lc": 0.2}, "production": {"lc": 0.1}},
+    },
+    "plate-decomposed": {
+        "script": "target plate/plate-ustruct-hex.py",
+        "sizes": {"small": {"lc": 0.4, "parts": 8}, "medium": {"lc": 0.2, "parts": 8},
+                  "production": {"lc": 0.1, "parts": 8}},
+    },
+    "plate-local": {
+        "script": "target plate/plate-ustruct-hex.py",
+        "sizes": {"small": {"lc": 0.4, "refine_within": 0.0125}, "medium": {"lc": 0.2, "refine_within": 0.0125},
+                  "production": {"lc": 0.1, "refine_within": 0.0125}},
+    },
+    "plate-symmetric": {
+        "script": "target plate/plate-ustruct-hex.py",
+        "sizes": {"small": {"lc": 0.4, "symmetry": 4}, "medium": {"lc": 0.2, "symmetry": 4},
+                  "production": {"lc": 0.1, "symmetry": 4}},
+    },
+    "ustruc-cyl": {
+        "script": "target plate/ustruc-cyl.py",
+        "sizes": {"small": {"lc": 0.4}, "medium": {"lc": 0.2}, "production": {"lc": 0.1}},
+    },
+    "transfinite-plate": {
+        "script": "target plate/transfinite-plate.py",
+        "sizes": {"small": {"nl": 10, "nh": 2}, "medium": {"nl": 15, "nh": 2},
+                  "production": {"nl": 20, "nh": 3}},
+    },
+    "multiblock-hex-plate": {
+        "script": "target plate/multiblock-hex-plate.py",
+        "sizes": {"small": {"lc": 0.2}, "medium": {"lc": 0.1}, "production": {"lc": 0.05}},
+    },
+    "ogrid-hex-cyl": {
+        "script": "target plate/ogrid-hex-cyl.py",
+        "sizes": {"small": {"lc": 0.2}, "medium": {"lc": 0.1}, "production": {"lc": 0.05}},
+    },
+    "extruded-ustruct-quad-plate": {
+        "script": "target plate/extruded-ustruct-quad-plate.py",
+        "sizes": {"small": {"lc": 0.4}, "medium": {"lc": 0.2}, "production": {"lc": 0.1}},
+    },
+    "bullet-core-hex": {
+        "script": "bullet/bullet-core-hex.py",
+        "sizes": {"small": {"lc": 2.2}, "medium": {"lc": 1.6}, "production": {"lc": 1.1}},
+        "strings": {"step": STANDIN},
+    },
+    "bullet-core-tet": {
+        "script": "bullet/bullet-core-tet.py",
+        "sizes": {"small": {"lc": 2.0}, "medium": {"lc": 1.4}, "production": {"lc": 0.95}},
+        "strings": {"step": STANDIN},
+    },
+}
+
+SIZES = ["small", "medium", "production"]
+
+THRESHOLDS = {"wall_s": 0.25, "wall_abs_s": 1.0, "peak_rss_mb": 0.2,
+              "elements": 0.05, "quality": 0.05}
+
+# percentiles of the minSICN element quality that are recorded
+PERCENTILES = [0, 1, 5, 50]
+
+# ----------------------------------------------------------------------------- #
+#
+# RUN
+
+def command(case, size, outdir, threads=1):
+    spec = CASES[case]
+    # -nt pins the thread count, the scripts would pick their own (threads.py)
+    argv = [sys.executable, os.path.join(REPO, spec["script"]), "-nopopup", "-nt", str(threads)]
+    for name, value in spec["sizes"][size].items():
+        argv += ["-setnumber", name, repr(value)]
+    for name, value in dict(spec.get("strings", {}), outdir=outdir).items():
+        argv += ["-setstring", name, value]
+    return argv
+
+
+def quality(path):
+    """minSICN percentiles of the highest dimensional elements in a mesh file"""
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    try:
+        gmsh.open(path)
+        for dim in (3, 2):
+            types, tags, _ = gmsh.model.mesh.getElements(dim)
+            if types:
+                break
+        tags = np.concatenate(tags) if types else np.array([])
+        if not len(tags):
+            return {}
+        q = gmsh.model.mesh.getElementQualities(tags, "minSICN")
+    finally:
+        gmsh.finalize()
+    return {"q_p%d" % p: round(float(v), 4) for p, v in zip(PERCENTILES, np.percentile(q, PERCENTILES))}
+
+
+def run(case, size, keep=None, threads=1):
+    """run one case in a fresh process and cache, returns its results"""
+    work = tempfile.mkdtemp(prefix="meshtools-bench-")
+    outdir = os.path.join(work, "out")
+    os.makedirs(outdir)
+    env = dict(os.environ, MESHTOOLS_CACHE=os.path.join(work, "cache"))
+    log = os.path.join(work, "log.txt")
+
+    result = {"status": "ok", "params": CASES[case]["sizes"][size]}
+    start_time = time.perf_counter()
+    try:
+        with open(log, "w") as f:
+            returncode = subprocess.call(command(case, size, outdir, threads), cwd=os.path.dirname(
+                os.path.join(REPO, CASES[case]["script"])), env=env, stdout=f, stderr=subprocess.STDOUT)
+        result["process_s"] = round(time.perf_counter() - start_time, 3)
+
+        reports = glob.glob(os.path.join(outdir, "*-report.json"))
+        if returncode or not reports:
+            with open(log) as f:
+                result.update(status="failed", returncode=returncode, log=f.read()[-2000:])
+            return result
+
+        with open(reports[0]) as f:
+            report = json.load(f)
+        counts = report["stages"][-1]["counts"] if report["stages"] else {}
+        result.update(wall_s=report["wall_s"], cpu_s=report["cpu_s"],
+                      peak_rss_mb=report["peak_rss_mb"],
+                      elements=counts.get("elements", 0), nodes=counts.get("nodes", 0),
+                      stages={row["stage"]: row["wall_s"] for row in report["stages"]})
+        phases = result["phases"] = {}
+        for row in report["stages"]:
+            for phase in row.get("phases", []):
+                phases[phase["phase"]] = round(phases.get(phase["phase"], 0) + phase["wall_s"], 3)
+        # loading the mesh here would grow this process, and the scripts
+        # started after it would inherit its peak memory
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            result.update(pool.apply(quality, (os.path.join(outdir, report["outputs"][-1]),)))
+    finally:
+        if keep:
+            shutil.copytree(outdir, os.path.join(keep, "%s-%s" % (case, size)), dirs_exist_ok=True)
+        shutil.rmtree(work, ignore_errors=True)
+    return result
+
+
+def best(results):
+    """the fastest of repeated runs, with the largest peak memory seen"""
+    ok = [r for r in results if r["status"] == "ok"]
+    if not ok:
+        return results[-1]
+    result = dict(min(ok, key=lambda r: r["wall_s"]))
+    result["peak_rss_mb"] = max(r["peak_rss_mb"] for r in ok)
+    result["repeats"] = len(results)
+    return result
+
+
+def bench(cases, sizes, repeat=1, keep=None):
+    results = {}
+    for case in cases:
+        for size in sizes:
+            runs = []
+            for _ in range(repeat):
+                runs.append(run(case, size, keep))
+                print("%-28s %-10s %s" % (case, size, _summary(runs[-1])), flush=True)
+            results.setdefault(case, {})[size] = best(runs)
+    return {"started": datetime.datetime.now().isoformat(timespec="seconds"),
+            "gmsh": gmsh.__version__, "python": platform.python_version(),
+            "host": platform.node(), "machine": platform.machine(),
+            "cpus": os.cpu_count(), "results": results}
+
+
+def _summary(result):
+    if result["status"] != "ok":
+        return "FAILED (exit %s)" % result.get("returncode")
+    return "%8.2f s %8.1f MB %9d elements  q_p5 %s" % (
+        result["wall_s"], result["peak_rss_mb"], result["elements"], result.get("q_p5"))
+
+
+# ----------------------------------------------------------------------------- #
+#
+# COMPARE
+
+def compare(results, baseline, thresholds):
+    """list of (case, size, metric, baseline value, new value) regressions"""
+    regressions = []
+    for case, sizes in results["results"].items():
+        for size, new in sizes.items():
+            old = baseline.get("results", {}).get(case, {}).get(size)
+            if not old or old.get("status") != "ok":
+                continue
+            if new["status"] != "ok":
+                regressions.append((case, size, "status", old["status"], new["status"]))
+                continue
+            if (new["wall_s"] > old["wall_s"]*(1 + thresholds["wall_s"])
+                    and new["wall_s"] - old["wall_s"] > thresholds["wall_abs_s"]):
+                regressions.append((case, size, "wall_s", old["wall_s"], new["wall_s"]))
+            if new["peak_rss_mb"] > old["peak_rss_mb"]*(1 + thresholds["peak_rss_mb"]):
+                regressions.append((case, size, "peak_rss_mb", old["peak_rss_mb"], new["peak_rss_mb"]))
+            if abs(new["elements"] - old["elements"]) > thresholds["elements"]*old["elements"]:
+                regressions.append((case, size, "elements", old["elements"], new["elements"]))
+            for key in old:
+                if key.startswith("q_p") and key in new and old[key] - new[key] > thresholds["quality"]:
+                    regressions.append((case, size, key, old[key], new[key]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.bench",
+                                     description="benchmark the mesh scripts against a baseline")
+    parser.add_argument("cases", nargs="*", metavar="CASE",
+                        help="cases to run (default all): " + ", ".join(CASES))
+    parser.add_argument("--sizes", default="small,medium",
+                        help="comma separated, from %s or 'all'" % ", ".join(SIZES))
+    parser.add_argument("-r", "--repeat", type=int, default=1, help="runs per case, the fastest counts")
+    parser.add_argument("-o", "--out",
+                        help="results json (default: bench.json in the -k folder, else in the cache)")
+    parser.add_argument("-b", "--baseline", default="bench-baseline.json")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store the results as the baseline instead of comparing")
+    parser.add_argument("-t", "--threshold", action="append", default=[], metavar="NAME=VALUE",
+                        help="regression threshold, names: " + ", ".join(THRESHOLDS))
+    parser.add_argument("-k", "--keep", metavar="DIR", help="keep the meshes and reports in DIR")
+    args = parser.parse_args(argv)
+
+    cases = args.cases or list(CASES)
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error("unknown case(s): " + ", ".join(unknown))
+    sizes = SIZES if args.sizes == "all" else args.sizes.split(",")
+
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    thresholds = dict(THRESHOLDS, **baseline.get("thresholds", {}))
+    for item in args.threshold:
+        name, value = item.split("=", 1)
+        if name not in THRESHOLDS:
+            parser.error("unknown threshold " + name)
+        thresholds[name] = float(value)
+
+    results = bench(cases, sizes, args.repeat, args.keep)
+    results["thresholds"] = thresholds
+    if args.out is None:
+        folder = args.keep or cache.directory("bench")
+        os.makedirs(folder, exist_ok=True)
+        args.out = os.path.join(folder, "bench.json")
+    with open(args.out, "w") as f:
+        json.dump(results, f, indent=1)
+    print("results: " + args.out)
+
+    if args.save_baseline:
+        shutil.copyfile(args.out, args.baseline)
+        print("baseline saved to " + args.baseline)
+        return 0
+    if not baseline:
+        print("no baseline at %s (run with --save-baseline to create one)" % args.baseline)
+        return 0
+
+    regressions = compare(results, baseline, thresholds)
+    for case, size, metric, old, new in regressions:
+        print("REGRESSION %s %s %s: %s -> %s" % (case, size, metric, old, new))
+    if not regressions:
+        print("no regressions against " + args.baseline)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
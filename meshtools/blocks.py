@@ -0,0 +1,249 @@
+# ----------------------------------------------------------------------------- #
+#  multi-block structured all-hex target plate and cylinder
+# ----------------------------------------------------------------------------- #
+#
+# transfinite-plate.py gives a structured hex plate in seconds, but grades it
+# with one global Bump. here the plate is split into 3 x 3 blocks:
+#
+#     +-----+-----------+-----+
+#     |     |     ^     |     |
+#     +-----+-----------+-----+      the centre block, 2 r2 wide around the
+#     |  <- |  centre   | ->  |      impact axis, has uniform lcsmallest cells;
+#     |     |  block    |     |      the transition blocks grow geometrically
+#     +-----+-----------+-----+      (by at most `growth` per cell) from
+#     |     |     v     |     |      lcsmallest to lcedge at the plate edges
+#     +-----+-----------+-----+
+#
+# every block is a transfinite, recombined surface, and the surfaces are
+# extruded through h in `layers` layers (default h / lcsmallest), so the mesh
+# is all hexahedra without any 3D meshing or recombination:
+#
+#   p = blocks.resolve(dict(lc=0.1))
+#   tags = blocks.build_plate(p)
+#   mesh.generate(3)
+#
+# the centre block has an even no. of cells, so there is a column of nodes on
+# the impact axis at (l/2, l/2). the strips between the corner blocks keep the
+# centre block's cells across, so their cells are long and thin towards the
+# edges (lcedge / lcsmallest at most).
+#
+# the cylinder of ustruc-cyl.py is an O-grid (butterfly) of five blocks:
+#
+#            .-~~~~~~~-.
+#         .'  \       /  '.       a square centre block, 2 r2 wide, with
+#        /     +-----+     \      uniform lcsmallest cells around the axis,
+#       |  <-  |     |  ->  |     and four curved blocks between its sides
+#        \     +-----+     /      and the quarter arcs of the rim, graded
+#         '.  /       \  .'       radially from lcsmallest
+#            '-._____.-'
+#
+#   p = blocks.resolve(dict(lc=0.1), "cylinder")
+#   tags = blocks.build_cylinder(p)
+#
+# each quarter arc has as many cells as a side of the centre block, so the
+# radial cells stop growing at the cell size along the rim (or lcedge).
+
+import math
+
+import gmsh
+
+from meshtools import targets
+
+model = gmsh.model
+geo = model.geo
+
+# parameters, as in targets.py:
+#   lc = generic mesh size
+#   lcsmallest = cell size in the centre block
+#   lcedge = largest cell size of the transition blocks, at the plate edges
+#   growth = largest ratio of neighbouring cell sizes in the transition blocks
+#   layers = elements through the thickness (None: h / lcsmallest)
+#   h = height; l = plate length; r2 = half width of the centre block
+PLATE = {
+    "lc": 1e-1,
+    "lcsmallest": "lc/100",
+    "lcedge": "lc/20",
+    "growth": 1.2,
+    "layers": None,
+    "h": 0.005,
+    "l": 0.1,
+    "r2": "l/10",
+}
+
+# as PLATE, with rcyl = cylinder radius and r2 = half width of the centre block
+CYLINDER = {
+    "lc": 1e-1,
+    "lcsmallest": "lc/140",
+    "lcedge": "lc/20",
+    "growth": 1.2,
+    "layers": None,
+    "h": 0.005,
+    "rcyl": 0.03025,
+    "r2": "rcyl/3",
+}
+
+DEFAULTS = {"plate": PLATE, "cylinder": CYLINDER}
+
+
+def resolve(overrides=None, kind="plate"):
+    """the defaults of `kind` updated with overrides, strings evaluated to numbers"""
+    return targets.evaluate(dict(DEFAULTS[kind], **(overrides or {})))
+
+# ----------------------------------------------------------------------------- #
+#
+# GRADING
+
+def _length(first, ratio, cells):
+    """length of `cells` cells growing by `ratio` from `first`"""
+    if abs(ratio - 1) < 1e-12:
+        return first * cells
+    return first * (ratio**cells - 1) / (ratio - 1)
+
+
+def grading(length, first, last, growth):
+    """(cells, ratio) of a geometric progression over `length` that starts
+    with a `first` cell and grows by at most `growth` towards `last`"""
+    if length <= first * 1.5:
+        return 1, 1.0
+    # the ratio that ends exactly at `last`, if that is within the growth
+    ratio = min((length - first) / (length - last), growth) if length > last else growth
+    if ratio <= 1:
+        return math.ceil(length / first), 1.0
+    cells = max(1, round(math.log(1 + length * (ratio - 1) / first) / math.log(ratio)))
+    if first * cells >= length:
+        return cells, 1.0
+    # the ratio for a whole no. of cells starting at `first`
+    lo, hi = 1.0, max(ratio, 1.0) * 2
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if _length(first, mid, cells) < length:
+            lo = mid
+        else:
+            hi = mid
+    return cells, (lo + hi) / 2
+
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY AND TRANSFINITE BLOCKS
+
+def build_plate(p):
+    """3 x 3 transfinite blocks of the plate extruded through h
+
+    returns the tags of the volumes, the bottom and top surfaces and the impact
+    axis end points as "line" (a curve isn't needed here, see verify.py)
+    """
+    lc, h, l, a = p["lc"], p["h"], p["l"], p["r2"]
+    c = l/2
+    if not 0 < a < c:
+        raise ValueError("the centre block needs 0 < r2 < l/2, got r2 = %g" % a)
+    xs = [0, c - a, c + a, l]
+
+    points = {(i, j): geo.addPoint(xs[i], xs[j], 0, lc) for i in range(4) for j in range(4)}
+
+    # cells per block along x and y: uniform in the centre, graded outside
+    centre = 2 * math.ceil(a / p["lcsmallest"])
+    outer, ratio = grading(c - a, 2 * a / centre, p["lcedge"], p["growth"])
+
+    # the transition lines run from the centre block out, so the progression
+    # grows towards the edges
+    lines = {}
+
+    def add_line(start, end, block):
+        if block == 0:
+            start, end = end, start
+        tag = geo.addLine(points[start], points[end])
+        lines[start, end] = tag
+        if block == 1:
+            geo.mesh.setTransfiniteCurve(tag, centre + 1)
+        else:
+            geo.mesh.setTransfiniteCurve(tag, outer + 1, "Progression", ratio)
+
+    for i in range(3):
+        for j in range(4):
+            add_line((i, j), (i + 1, j), i)
+            add_line((j, i), (j, i + 1), i)
+
+    surfaces = []
+    for i in range(3):
+        for j in range(3):
+            corners = [(i, j), (i + 1, j), (i + 1, j + 1), (i, j + 1)]
+            surfaces.append(_block(lines, corners))
+
+    volumes, tops, layers = _extrude(p, surfaces)
+    geo.synchronize()
+    return {"volumes": volumes, "bottom": surfaces, "top": tops,
+            "line": ((c, c, 0), (c, c, h)), "centre": (c, c),
+            "cells": {"centre": centre, "outer": outer, "ratio": ratio, "layers": layers}}
+
+
+def build_cylinder(p):
+    """O-grid of a centre block and four curved blocks extruded through h
+
+    returns the tags as build_plate does, the impact axis is the z axis
+    """
+    lc, h, rcyl, a = p["lc"], p["h"], p["rcyl"], p["r2"]
+    if not 0 < a * math.sqrt(2) < rcyl:
+        raise ValueError("the centre block needs 0 < r2 < rcyl/sqrt(2), got r2 = %g" % a)
+    diagonals = [(1, -1), (1, 1), (-1, 1), (-1, -1)]
+
+    # k = 0..3 anticlockwise: corner ("s", k) of the centre block and ("r", k)
+    # on the rim, on the same diagonal
+    axis = geo.addPoint(0, 0, 0, lc)
+    points = {}
+    for k, (x, y) in enumerate(diagonals):
+        points["s", k] = geo.addPoint(a * x, a * y, 0, lc)
+        points["r", k] = geo.addPoint(rcyl * x / math.sqrt(2), rcyl * y / math.sqrt(2), 0, lc)
+
+    # cells along each side and quarter arc, then radially along the diagonals
+    centre = 2 * math.ceil(a / p["lcsmallest"])
+    rim = math.pi / 2 * rcyl / centre
+    outer, ratio = grading(rcyl - a * math.sqrt(2), 2 * a / centre, min(p["lcedge"], rim), p["growth"])
+
+    lines = {}
+    for k in range(4):
+        s, r = ("s", k), ("r", k)
+        s_next, r_next = ("s", (k + 1) % 4), ("r", (k + 1) % 4)
+        lines[s, s_next] = geo.addLine(points[s], points[s_next])
+        lines[r, r_next] = geo.addCircleArc(points[r], axis, points[r_next])
+        # the radial lines run from the centre block out
+        lines[s, r] = geo.addLine(points[s], points[r])
+        geo.mesh.setTransfiniteCurve(lines[s, s_next], centre + 1)
+        geo.mesh.setTransfiniteCurve(lines[r, r_next], centre + 1)
+        geo.mesh.setTransfiniteCurve(lines[s, r], outer + 1, "Progression", ratio)
+
+    surfaces = [_block(lines, [("s", k) for k in range(4)])]
+    for k in range(4):
+        surfaces.append(_block(lines, [("s", k), ("s", (k + 1) % 4), ("r", (k + 1) % 4), ("r", k)]))
+
+    volumes, tops, layers = _extrude(p, surfaces)
+    geo.synchronize()
+    # the centre of the arcs, and its copy on the top face, would be stray
+    # nodes on the axis next to the column of nodes of the centre block
+    model.removeEntities([(0, tag) for _, tag in model.getEntities(0)
+                          if not len(model.getAdjacencies(0, tag)[0])])
+    return {"volumes": volumes, "bottom": surfaces, "top": tops,
+            "line": ((0, 0, 0), (0, 0, h)), "centre": (0, 0),
+            "cells": {"centre": centre, "outer": outer, "ratio": ratio, "layers": layers}}
+
+
+def _block(lines, corners):
+    """transfinite, recombined surface of the lines round the four corners"""
+    def edge(start, end):
+        return lines[start, end] if (start, end) in lines else -lines[end, start]
+
+    loop = geo.addCurveLoop([edge(corners[k], corners[(k + 1) % 4]) for k in range(4)])
+    surface = geo.addPlaneSurface([loop])
+    geo.mesh.setTransfiniteSurface(surface)
+    geo.mesh.setRecombine(2, surface)
+    return surface
+
+
+def _extrude(p, surfaces):
+    """(volumes, top surfaces, layers) of the surfaces extruded through h"""
+    layers = int(p["layers"] or max(1, round(p["h"] / p["lcsmallest"])))
+    extruded = geo.extrude([(2, s) for s in surfaces], 0, 0, p["h"], [layers], recombine=True)
+
+    # extrude returns the top surface, then the volume, then the sides of each
+    volumes = [tag for dim, tag in extruded if dim == 3]
+    tops = [extruded[k - 1][1] for k, (dim, _) in enumerate(extruded) if dim == 3]
+    return volumes, tops, layers
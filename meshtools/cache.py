@@ -0,0 +1,54 @@
+# ----------------------------------------------------------------------------- #
+#  on-disk cache location and keys
+# ----------------------------------------------------------------------------- #
+#
+# everything meshtools caches lives under one directory, ~/.cache/meshtools by
+# default or $MESHTOOLS_CACHE if set, with a subdirectory per kind of data.
+# entries are named by a hash of everything that went into them, so changing
+# any parameter simply gives a new entry.
+
+import contextlib
+import hashlib
+import json
+import os
+
+ROOT = os.environ.get("MESHTOOLS_CACHE",
+                      os.path.join(os.path.expanduser("~"), ".cache", "meshtools"))
+
+
+def directory(*sub):
+    path = os.path.join(ROOT, *sub)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def key(*parts):
+    """stable hash of json-able parts (dict order doesn't matter)"""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()[:20]
+
+
+def file_hash(path, chunk=2**20):
+    """hash of a file's contents"""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            digest.update(block)
+    return digest.hexdigest()[:20]
+
+
+@contextlib.contextmanager
+def atomic(path):
+    """yield a temporary name to write to and move it to `path` when done
+
+    several sweep workers may produce the same entry at once; this way a
+    reader never sees a half written file.
+    """
+    root, ext = os.path.splitext(path)
+    tmp = "%s.tmp%d%s" % (root, os.getpid(), ext)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
@@ -0,0 +1,325 @@
+# ----------------------------------------------------------------------------- #
+#  calibration of lcsmaller, lcsmallest, r1, r2 and F to a target impact zone
+#  element size and an element budget
+# ----------------------------------------------------------------------------- #
+#
+# finding a combination of the refinement parameters that gives the element
+# size wanted in the impact zone takes a bit of trial and error with full 3D
+# runs (MeshSizeMax takes the minimum of the fields, see the README). this
+# searches a grid of them instead, cheapest estimate first:
+#
+#   python -m meshtools.calibrate plate 0.0005 2000000
+#   python -m meshtools.calibrate cylinder 0.0004 1e6 -s lc=0.1 -a r1=rcyl/2,rcyl/3
+#
+# i.e. mean element size 0.5 mm within --zone of line l (default: r2 of the
+# target's defaults) and at most 2 million elements.
+#
+#   analytic   every candidate of the grid: predict.py's integral of the size
+#              field over the radial profile of the target. well under a
+#              millisecond per candidate
+#   surrogate  the best --surrogates of those: the surfaces of the target are
+#              meshed and refined in 2D with the same fields and options, the
+#              zone size is measured on the top face and the element count is
+#              the sum of its elements times the layers under each one
+#   confirm    the best --confirm of those are meshed in full 3D (sweep.py's
+#              mesh_once) and the zone size measured with verify.py. the ratio
+#              of measured to predicted corrects the surrogate estimates, and
+#              if no run is within --tolerance of the size and under the budget
+#              the next best are confirmed, up to --rounds times
+#
+# the grid is GRIDS[kind] with -a NAME=V1,V2 replacing an axis and -s NAME=V
+# fixing a parameter; the values are expressions in the parameters before them
+# as in the README tables and the sweep. the best confirmed candidate is
+# printed as -s options for the sweep and, with -o, every row goes to a json.
+# the estimates are for the uniform refine of the scripts, not refine_within.
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+
+import gmsh
+import numpy as np
+
+from meshtools import predict, sweep, targets
+from meshtools.threads import apply as set_threads
+
+model = gmsh.model
+mesh = model.mesh
+
+# 3D element size in the impact zone / size on the refined surfaces, and 3D
+# elements per element of the top face and layer through the thickness (at
+# least LAYERS however coarse the surfaces) of the surrogate. the cylinder's
+# hexahedra are flatter than the plate's. fitted to full runs of both targets
+# at lc 0.1 and 0.2; the confirm runs print the measured ratios
+SIZE = 0.54
+ELEMENTS = {"plate": 4.0, "cylinder": 2.05}
+LAYERS = 8
+
+# candidates are within the tolerance when their zone size is within this
+# fraction of the target; between those the fewest elements wins
+TOLERANCE = 0.1
+
+# estimated elements allowed over the budget to pass on to the next stage,
+# as the estimates are only within tens of per cent
+SLACK = {"analytic": 1.5, "surrogate": 1.25}
+
+# the default search grid of each target, around the values in the README
+GRIDS = {
+    "plate": {
+        "lcsmaller": ["lc/30", "lc/40", "lc/50", "lc/70", "lc/100", "lc/140"],
+        "lcsmallest": ["lc/50", "lc/70", "lc/100", "lc/140", "lc/200", "lc/280"],
+        "r1": ["l/4", "l/5", "l/6.66", "l/8", "l/10"],
+        "r2": ["l/5", "l/6.66", "l/8", "l/10", "l/13.33", "l/16"],
+        "F": ["1*F1^2", "2.5*F1^2", "5*F1^2", "8.8*F1^2", "15*F1^2"],
+    },
+    "cylinder": {
+        "lcsmaller": ["lc/40", "lc/50", "lc/60", "lc/80", "lc/100", "lc/140"],
+        "lcsmallest": ["lc/70", "lc/100", "lc/140", "lc/200", "lc/280"],
+        "r1": ["rcyl/1.5", "rcyl/2", "rcyl/2.5", "rcyl/3"],
+        "r2": ["rcyl/2", "rcyl/3", "rcyl/4", "rcyl/5"],
+        "F": ["2.5*F1^2", "5*F1^2", "8.8*F1^2", "15*F1^2", "25*F1^2"],
+    },
+}
+
+# ----------------------------------------------------------------------------- #
+#
+# CANDIDATES
+
+def candidates(kind, grid, fixed=None):
+    """the override dicts of the grid, with the fixed values, that make sense:
+    lcsmallest <= lcsmaller and r2 <= r1"""
+    runs = []
+    for overrides in sweep.expand(grid):
+        overrides.update(fixed or {})
+        p = targets.resolve(kind, overrides)
+        if p["lcsmallest"] <= p["lcsmaller"] and p["r2"] <= p["r1"]:
+            runs.append(overrides)
+    return runs
+
+
+def _error(row, target):
+    """relative error of the estimated zone size"""
+    return abs(row["zone_size"] / target - 1)
+
+
+def rank(rows, target, budget, slack=1.0, tolerance=TOLERANCE):
+    """rows within slack * budget elements, closest zone size first, and
+    between those within the tolerance the fewest elements first"""
+    rows = [row for row in rows if row.get("zone_size") and row["elements"] <= slack * budget]
+    return sorted(rows, key=lambda row: (max(_error(row, target), tolerance), row["elements"]))
+
+# ----------------------------------------------------------------------------- #
+#
+# ANALYTIC ESTIMATE
+
+def analytic(kind, p, zone, rings=None):
+    """estimated zone size and element count of one parameter set from the
+    size field on the radial profile `rings` (see predict.py)"""
+    estimate = predict.elements(kind, p, rings=rings, zone=zone)
+    return {"zone_size": estimate["zone_size"], "elements": estimate["elements"]}
+
+# ----------------------------------------------------------------------------- #
+#
+# SURROGATE: THE SURFACES IN 2D
+
+def _surfaces(kind, p, zone, centre):
+    """zone size and estimated 3D element count from the top face of the
+    current 2D mesh"""
+    tags, coords, _ = mesh.getNodes(returnParametricCoord=False)
+    xyz = np.zeros((int(tags.max()) + 1, 3))
+    xyz[tags] = coords.reshape(-1, 3)
+    sizes, distances = [], []
+    for element_type in mesh.getElementTypes(2):
+        corners = mesh.getElementProperties(element_type)[3]
+        _, node_tags = mesh.getElementsByType(element_type)
+        points = xyz[node_tags.reshape(-1, corners)]
+        points = points[np.all(np.isclose(points[:, :, 2], p["h"]), axis=1)]
+        sizes.append(np.linalg.norm(points - np.roll(points, 1, axis=1), axis=2).mean(axis=1))
+        distances.append(np.hypot(points[:, :, 0].mean(axis=1) - centre[0],
+                                  points[:, :, 1].mean(axis=1) - centre[1]))
+    size, distance = SIZE * np.concatenate(sizes), np.concatenate(distances)
+    inside = distance <= zone
+    return {"zone_size": float(size[inside].mean()) if inside.any() else None,
+            "elements": int(ELEMENTS[kind] * np.maximum(LAYERS, p["h"] / size).sum()),
+            "surface_elements": int(len(size))}
+
+
+def surrogate(kind, overrides, zone, threads=1):
+    """mesh the surfaces of one parameter set in 2D in a fresh gmsh session,
+    refine them like the 3D mesh and estimate from the top face"""
+    p = targets.resolve(kind, overrides)
+    row = {"status": "ok"}
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    set_threads(threads)
+    start_time = time.perf_counter()
+    try:
+        model.add(kind)
+        targets.set_options(targets.RECOMBINE_OPTIONS)
+        tags = targets.build(kind, p)
+        mesh.generate(2)
+        mesh.refine()
+        row.update(_surfaces(kind, p, zone, tags["centre"]))
+    except Exception as e:
+        row["status"] = "%s: %s" % (type(e).__name__, e)
+    finally:
+        row["wall_s"] = round(time.perf_counter() - start_time, 3)
+        gmsh.finalize()
+    return row
+
+# ----------------------------------------------------------------------------- #
+#
+# SEARCH
+
+def _surrogate_job(job):
+    kind, overrides, zone, threads = job
+    return surrogate(kind, overrides, zone, threads)
+
+
+def _confirm_job(job):
+    kind, overrides, zone, threads = job
+    row = sweep.mesh_once(kind, overrides, threads, zone=zone)
+    return row
+
+
+def _run(function, kind, runs, zone, workers, threads):
+    """function(job) on a fresh process per run"""
+    jobs = [(kind, overrides, zone, threads) for overrides in runs]
+    with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+        return pool.map(function, jobs, chunksize=1)
+
+
+def _log(stage, count, start_time):
+    print("%-10s %5d candidates  %8.2f s" % (stage, count, time.perf_counter() - start_time), file=sys.stderr)
+
+
+def calibrate(kind, target, budget, grid=None, fixed=None, zone=None, surrogates=12, confirm=2,
+              rounds=2, tolerance=TOLERANCE, workers=None, threads=1):
+    """search the grid for the parameters whose impact zone size is closest to
+    `target` with at most `budget` elements
+
+    returns the best confirmed row (None if no run was under the budget) and
+    every row of every stage
+    """
+    grid = dict(GRIDS[kind], **(grid or {}))
+    if zone is None:
+        zone = targets.resolve(kind, fixed)["r2"]
+    rows = []
+
+    start_time = time.perf_counter()
+    runs = candidates(kind, grid, fixed)
+    rings = predict.profile(kind, targets.resolve(kind, fixed))
+    estimates, seen = [], set()
+    for overrides in runs:
+        row = {"stage": "analytic", "params": overrides}
+        row.update(analytic(kind, targets.resolve(kind, overrides), zone, rings))
+        rows.append(row)
+        # e.g. r1 makes no difference while lcsmaller is above the MathEval
+        # field: mesh only one of the candidates with the same size field
+        if (row["zone_size"], row["elements"]) not in seen:
+            seen.add((row["zone_size"], row["elements"]))
+            estimates.append(row)
+    _log("analytic", len(runs), start_time)
+
+    start_time = time.perf_counter()
+    best = rank(estimates, target, budget, SLACK["analytic"], tolerance)[:surrogates]
+    estimates = []
+    for row, result in zip(best, _run(_surrogate_job, kind, [row["params"] for row in best],
+                                      zone, workers, threads)):
+        result.update(stage="surrogate", params=row["params"])
+        estimates.append(result)
+    rows += estimates
+    _log("surrogate", len(estimates), start_time)
+
+    # measured / surrogate ratios of the confirm runs so far
+    size_ratio, count_ratio = [], []
+    confirmed = []
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        corrected = [dict(row, zone_size=row["zone_size"] * np.median(size_ratio or [1]),
+                          elements=row["elements"] * np.median(count_ratio or [1]))
+                     for row in estimates if row["status"] == "ok" and row.get("zone_size")]
+        tried = [row["params"] for row in confirmed]
+        best = [row for row in rank(corrected, target, budget, SLACK["surrogate"], tolerance)
+                if row["params"] not in tried][:confirm]
+        if not best:
+            break
+        for row, result in zip(best, _run(_confirm_job, kind, [row["params"] for row in best],
+                                          zone, workers, threads)):
+            source = next(e for e in estimates if e["params"] == row["params"])
+            result.update(stage="confirm", params=row["params"], predicted_size=source["zone_size"],
+                          predicted_elements=source["elements"])
+            if result["status"] == "ok" and result.get("zone_size"):
+                size_ratio.append(result["zone_size"] / source["zone_size"])
+                count_ratio.append(result["elements"] / source["elements"])
+            confirmed.append(result)
+            rows.append(result)
+        _log("confirm", len(best), start_time)
+        done = rank([row for row in confirmed if row["status"] == "ok"], target, budget, 1.0, tolerance)
+        if done and _error(done[0], target) <= tolerance:
+            break
+
+    done = rank([row for row in confirmed if row["status"] == "ok"], target, budget, 1.0, tolerance)
+    if size_ratio:
+        print("measured / surrogate: zone size %.3f, elements %.3f"
+              % (np.median(size_ratio), np.median(count_ratio)), file=sys.stderr)
+    return (done[0] if done else None), rows
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def _table(rows):
+    lines = ["%-10s %10s %12s %12s %10s  %s" % ("stage", "zone size", "elements", "predicted", "wall s",
+                                                "parameters")]
+    for row in rows:
+        if row["stage"] == "analytic":
+            continue
+        predicted = row.get("predicted_elements")
+        lines.append("%-10s %10s %12s %12s %10s  %s" % (
+            row["stage"], "%.3g" % row["zone_size"] if row.get("zone_size") else row["status"],
+            row.get("elements", ""), "" if predicted is None else int(predicted), row.get("wall_s", ""),
+            " ".join("%s=%s" % item for item in row["params"].items())))
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.calibrate",
+                                     description="refinement parameters for a target impact zone "
+                                                 "element size and element budget")
+    parser.add_argument("kind", choices=sorted(targets.DEFAULTS))
+    parser.add_argument("size", type=float, help="mean element size wanted within --zone of line l")
+    parser.add_argument("budget", type=float, help="most 3D elements allowed")
+    parser.add_argument("--zone", type=float, help="radius of the impact zone (default: r2 of the defaults)")
+    parser.add_argument("-s", "--set", action="append", metavar="NAME=V", help="fix a parameter")
+    parser.add_argument("-a", "--axis", action="append", metavar="NAME=V1,V2",
+                        help="replace a parameter axis of the grid")
+    parser.add_argument("--surrogates", type=int, default=12, help="candidates meshed in 2D (default: 12)")
+    parser.add_argument("--confirm", type=int, default=2, help="candidates meshed in 3D per round (default: 2)")
+    parser.add_argument("--rounds", type=int, default=2, help="rounds of 3D runs at most (default: 2)")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="relative zone size error that is good enough (default: %g)" % TOLERANCE)
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="gmsh threads per worker (default: 1)")
+    parser.add_argument("-o", "--out", help="write every row of every stage to this json")
+    args = parser.parse_args(argv)
+
+    best, rows = calibrate(args.kind, args.size, args.budget, sweep.parse_set(args.axis),
+                           sweep.parse_overrides(args.set), args.zone, args.surrogates, args.confirm,
+                           args.rounds, args.tolerance, args.workers, args.threads)
+    print(_table(rows))
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(rows, f, indent=1)
+    if best is None:
+        print("no candidate was meshed under the budget", file=sys.stderr)
+        return 1
+    print("\nbest: zone size %.3g, %d elements" % (best["zone_size"], best["elements"]))
+    print(" ".join("-s %s=%s" % item for item in best["params"].items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
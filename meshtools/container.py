@@ -0,0 +1,389 @@
+# ----------------------------------------------------------------------------- #
+#  chunked, compressed mesh container for fast and partial reloads
+# ----------------------------------------------------------------------------- #
+#
+# the ASCII .msh of a refined plate is hundreds of MB, and gmsh has to read
+# all of it to look at any of it. a .meshz file holds the arrays of
+# arrays.py, plus the quality (minSICN) and physical group of every element,
+# as a zip of .npy chunks of CHUNK rows each, deflated one by one:
+#
+#   container.write("ustruct-refined.meshz", line=tags["line"])
+#   m = container.read("ustruct-refined.meshz")                 # arrays.MeshArrays
+#   zone = container.read("ustruct-refined.meshz", within=r2)   # the impact zone
+#   zone.fields["quality"]["hexahedra"]
+#
+# or -setstring format meshz in the scripts (report.write, with line l of the
+# last verify), and from a mesh file:
+#
+#   python -m meshtools.container convert ustruct-refined.msh --axis 0.05,0.05,0,0.05,0.05,0.005
+#   python -m meshtools.container info ustruct-refined.meshz
+#   python -m meshtools.container bench ustruct-refined.msh --axis ... --within 0.01
+#
+# with line l, the elements of each type are stored in order of the distance
+# of their centre to it, and the nodes in the order the elements first use
+# them, so the elements within a distance of line l are the first chunks of
+# the element arrays and their nodes nearly all in the first node chunks.
+# the index lists the distance range of every element chunk, and
+# read(within=d) only inflates the chunks it needs. --float32 stores the
+# coordinates as float32, half the size of the nodes in memory and on disk.
+#
+# bench times writing and reading binary MSH4 through gmsh (and reading it
+# into the arrays read() gives) against writing and reading the container,
+# in full and the zone within --within only.
+
+import argparse
+import json
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+from meshtools import arrays
+
+# rows per chunk of each array
+CHUNK = 2**16
+
+# zlib level of every chunk: for the plate at lc 0.1, 1 writes in 2.3 s and
+# 20 MB, the default 6 in 6.3 s and 19 MB (0, stored, in 1.7 s and 45 MB)
+LEVEL = 1
+
+# per element values stored next to the connectivity, tags and entities
+FIELDS = ["physical", "quality", "distance"]
+
+INDEX = "index.json"
+
+# ----------------------------------------------------------------------------- #
+#
+# WRITE
+
+def _order(m, a, b):
+    """sort the elements of m by the distance of their centres to the
+    segment a-b, and the nodes by their first use; adds the distances"""
+    from meshtools import localrefine
+
+    distance = {}
+    for name, connectivity in m.elements.items():
+        centres = np.empty((len(connectivity), 3))
+        for start in range(0, len(connectivity), CHUNK):
+            centres[start:start + CHUNK] = m.nodes[connectivity[start:start + CHUNK]].mean(axis=1)
+        d = localrefine.segment_distance(centres, a, b).astype(np.float32)
+        order = np.argsort(d, kind="stable")
+        m.elements[name] = connectivity[order]
+        m.element_tags[name] = m.element_tags[name][order]
+        m.entities[name] = m.entities[name][order]
+        for field in m.fields.values():
+            field[name] = field[name][order]
+        distance[name] = d[order]
+    m.fields["distance"] = distance
+
+    # the first element (over the element arrays in order) using each node:
+    # assigned last to first, so the first one is written last; nodes no
+    # element uses go last
+    n = len(m.nodes)
+    first = np.full(n, np.iinfo(np.int64).max)
+    offset = sum(len(connectivity) for connectivity in m.elements.values())
+    for connectivity in reversed(list(m.elements.values())):
+        offset -= len(connectivity)
+        ranks = np.arange(offset, offset + len(connectivity))
+        first[connectivity[::-1].ravel()] = np.repeat(ranks[::-1], connectivity.shape[1])
+    order = np.argsort(first, kind="stable")
+    rows = np.empty(n, dtype=arrays.index_dtype(n))
+    rows[order] = np.arange(n, dtype=rows.dtype)
+    m.nodes = m.nodes[order]
+    m.node_tags = m.node_tags[order]
+    for name, connectivity in m.elements.items():
+        m.elements[name] = rows[connectivity]
+
+
+def _fields(m, mesh):
+    """minSICN and the physical group (0: none) of every element of m"""
+    quality, physical = {}, {}
+    for name, tags in m.element_tags.items():
+        quality[name] = mesh.getElementQualities(tags.astype(np.uint64), "minSICN").astype(np.float32)
+        groups = np.zeros(int(m.entities[name].max()) + 1 if len(tags) else 1, dtype=np.int32)
+        for entity, physicals in m.physicals.items():
+            groups[entity] = physicals[0]
+        physical[name] = groups[m.entities[name]]
+    m.fields["quality"], m.fields["physical"] = quality, physical
+
+
+def _ends(line):
+    """a curve tag or a pair of end points as two arrays"""
+    if np.isscalar(line):
+        from meshtools import localrefine
+
+        return localrefine.curve_ends(line)
+    return tuple(np.asarray(end, dtype=float) for end in line)
+
+
+def write(path, line=None, float32=False, chunk=CHUNK, level=LEVEL):
+    """the current mesh as a .meshz container at `path`, elements in order of
+    their distance to `line` (a curve tag or end points) when given"""
+    import gmsh
+
+    m = arrays.extract(float32=float32)
+    _fields(m, gmsh.model.mesh)
+    a = b = None
+    if line is not None:
+        a, b = _ends(line)
+        _order(m, a, b)
+    return _write(path, m, chunk, level, a, b)
+
+
+def _write(path, m, chunk, level, a=None, b=None):
+    index = {"version": 1, "dim": m.dim, "chunk": chunk, "counts": m.counts(),
+             "types": list(m.elements), "fields": [f for f in FIELDS if f in m.fields],
+             "line": None if a is None else [list(map(float, a)), list(map(float, b))],
+             "physicals": {str(tag): groups for tag, groups in m.physicals.items()},
+             "arrays": {}, "zones": {}}
+    blocks = {"nodes": m.nodes, "node_tags": m.node_tags}
+    for name in m.elements:
+        blocks[name + "/connectivity"] = m.elements[name]
+        blocks[name + "/tags"] = m.element_tags[name]
+        blocks[name + "/entities"] = m.entities[name]
+        for field in index["fields"]:
+            blocks[name + "/" + field] = m.fields[field][name]
+        if "distance" in m.fields:
+            d = m.fields["distance"][name]
+            index["zones"][name] = [[float(d[start:start + chunk].min()), float(d[start:start + chunk].max())]
+                                    for start in range(0, len(d), chunk)]
+
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=level, allowZip64=True) as f:
+        for name, block in blocks.items():
+            index["arrays"][name] = {"dtype": str(block.dtype), "shape": list(block.shape)}
+            for k, start in enumerate(range(0, max(len(block), 1), chunk)):
+                with f.open("%s/%06d.npy" % (name, k), "w", force_zip64=True) as member:
+                    np.lib.format.write_array(member, np.ascontiguousarray(block[start:start + chunk]),
+                                              allow_pickle=False)
+        f.writestr(INDEX, json.dumps(index, indent=1))
+    return path
+
+# ----------------------------------------------------------------------------- #
+#
+# READ
+
+class Container:
+    """an open .meshz file, reading chunks of its arrays on demand"""
+
+    def __init__(self, path):
+        self.zip = zipfile.ZipFile(path)
+        self.index = json.loads(self.zip.read(INDEX))
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def chunks(self, name):
+        shape = self.index["arrays"][name]["shape"]
+        return max(1, -(-shape[0] // self.index["chunk"]))
+
+    def chunk(self, name, k):
+        with self.zip.open("%s/%06d.npy" % (name, k)) as member:
+            return np.lib.format.read_array(member, allow_pickle=False)
+
+    def array(self, name, chunks=None):
+        """the whole array, or the rows of the given chunks, in one allocation"""
+        spec = self.index["arrays"][name]
+        size = self.index["chunk"]
+        chunks = range(self.chunks(name)) if chunks is None else chunks
+        rows = [(k, min(size, spec["shape"][0] - k * size)) for k in chunks]
+        out = np.empty([sum(n for _, n in rows)] + spec["shape"][1:], dtype=spec["dtype"])
+        start = 0
+        for k, n in rows:
+            out[start:start + n] = self.chunk(name, k)
+            start += n
+        return out
+
+
+def read(path, within=None, types=None, fields=None):
+    """the mesh of a .meshz file as an arrays.MeshArrays, with the fields
+    (quality, physical, distance) in m.fields
+
+    with `within`, only the elements whose centre is within that distance of
+    line l, and the nodes they use, renumbered from 0
+    """
+    with Container(path) as c:
+        index = c.index
+        types = [name for name in index["types"] if types is None or name in types]
+        fields = [field for field in index["fields"] if fields is None or field in fields]
+        if within is not None and not index["zones"]:
+            raise ValueError("%s was written without line l, it has no zones to read" % path)
+
+        elements, element_tags, entities = {}, {}, {}
+        element_fields = {field: {} for field in fields}
+        for name in types:
+            chunks = None
+            if within is not None:
+                chunks = [k for k, (low, _) in enumerate(index["zones"][name]) if low <= within]
+            block = {key: c.array(name + "/" + key, chunks)
+                     for key in ["connectivity", "tags", "entities"] + fields}
+            if within is not None:
+                inside = (c.array(name + "/distance", chunks) if "distance" not in block
+                          else block["distance"]) <= within
+                block = {key: values[inside] for key, values in block.items()}
+            elements[name], element_tags[name], entities[name] = (
+                block["connectivity"], block["tags"], block["entities"])
+            for field in fields:
+                element_fields[field][name] = block[field]
+
+        if within is None:
+            nodes, node_tags = c.array("nodes"), c.array("node_tags")
+        else:
+            # only the node chunks the zone uses, and only its nodes of those
+            mask = np.zeros(index["counts"]["nodes"], dtype=bool)
+            for connectivity in elements.values():
+                mask[connectivity.ravel()] = True
+            used = np.flatnonzero(mask)
+            size = index["chunk"]
+            chunks = np.unique(used // size).tolist()
+            # the row of each used node in the chunks read, one after the other
+            starts = np.asarray(chunks, dtype=np.int64) * size
+            offsets = np.cumsum([0] + [min(size, index["counts"]["nodes"] - start) for start in starts])
+            rows = offsets[np.searchsorted(starts, used, side="right") - 1] + used % size
+            nodes = c.array("nodes", chunks)[rows]
+            node_tags = c.array("node_tags", chunks)[rows]
+            renumber = np.zeros(int(used[-1]) + 1 if len(used) else 1, dtype=arrays.index_dtype(len(used)))
+            renumber[used] = np.arange(len(used))
+            for name in elements:
+                elements[name] = renumber[elements[name]]
+
+    return arrays.MeshArrays(nodes, node_tags, elements, element_tags, entities, index["dim"],
+                             {int(tag): groups for tag, groups in index["physicals"].items()},
+                             element_fields)
+
+# ----------------------------------------------------------------------------- #
+#
+# THROUGHPUT
+
+def throughput(line=None, within=None, repeat=1, outdir="."):
+    """write the current mesh as binary .msh and .meshz (float64 and
+    float32) and read each back, `repeat` times each; returns the fastest
+    run of each with its rate, and the zone within `within` of line l"""
+    import gmsh
+
+    from meshtools.report import Report
+
+    msh = os.path.join(outdir, "bench-binary.msh")
+    meshz = os.path.join(outdir, "bench.meshz")
+    meshz32 = os.path.join(outdir, "bench-float32.meshz")
+    stages = [("write msh4 binary", msh), ("write meshz", meshz), ("write meshz float32", meshz32),
+              ("read msh4 binary", msh), ("read msh4 binary to arrays", msh), ("read meshz", meshz), ("read meshz float32", meshz32)]
+    if within is not None:
+        stages.append(("read meshz zone", meshz))
+    elements = sum(int(gmsh.option.getNumber(name)) for name in (
+        "Mesh.NbTetrahedra", "Mesh.NbHexahedra", "Mesh.NbPrisms", "Mesh.NbPyramids"))
+
+    run_report = Report("container-bench")
+    binary = gmsh.option.getNumber("Mesh.Binary")
+    zone = None
+    try:
+        gmsh.option.setNumber("Mesh.Binary", 1)
+        for _ in range(repeat):
+            with run_report.stage("write msh4 binary"):
+                gmsh.write(msh)
+            with run_report.stage("write meshz"):
+                write(meshz, line)
+            with run_report.stage("write meshz float32"):
+                write(meshz32, line, float32=True)
+            # as gmsh.open, which the mesh is left loaded by for the next run
+            gmsh.clear()
+            with run_report.stage("read msh4 binary"):
+                gmsh.merge(msh)
+            # what it takes to have the arrays read() returns
+            gmsh.clear()
+            with run_report.stage("read msh4 binary to arrays"):
+                gmsh.merge(msh)
+                arrays.extract()
+            with run_report.stage("read meshz"):
+                read(meshz)
+            with run_report.stage("read meshz float32"):
+                read(meshz32)
+            if within is not None:
+                with run_report.stage("read meshz zone"):
+                    zone = read(meshz, within)
+    finally:
+        gmsh.option.setNumber("Mesh.Binary", binary)
+    run_report.finish(os.devnull, quiet=True)
+
+    results = []
+    for stage, path in stages:
+        row = min((row for row in run_report.stages if row["stage"] == stage), key=lambda row: row["wall_s"])
+        count = sum(len(block) for block in zone.elements.values()) if stage.endswith("zone") else elements
+        mb = os.path.getsize(path) / 2**20
+        wall = max(row["wall_s"], 1e-3)
+        results.append({"stage": stage, "wall_s": row["wall_s"], "file_mb": round(mb, 1),
+                        "mb_s": round(mb / wall, 1), "elements_s": round(count / wall),
+                        "peak_rss_mb": row["peak_rss_mb"]})
+    for path in (msh, meshz, meshz32):
+        os.remove(path)
+    return results, zone
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def _floats(text):
+    return [float(value) for value in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.container",
+                                     description="chunked, compressed mesh container (.meshz)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="write a mesh file as .meshz")
+    bench_parser = commands.add_parser("bench", help="time binary .msh against .meshz writes and reads")
+    for sub in (convert_parser, bench_parser):
+        sub.add_argument("mesh")
+        sub.add_argument("--axis", type=_floats, metavar="X0,Y0,Z0,X1,Y1,Z1",
+                         help="end points of line l, to order the elements by distance to it")
+    convert_parser.add_argument("-o", "--out", help="container (default: the mesh with .meshz)")
+    convert_parser.add_argument("--float32", action="store_true", help="float32 coordinates")
+    bench_parser.add_argument("--within", type=float, help="also time reading the zone within this of line l")
+    bench_parser.add_argument("-r", "--repeat", type=int, default=3, help="runs of each, the fastest counts")
+    bench_parser.add_argument("-d", "--dir", default=".", help="where the files are written (and removed)")
+    info_parser = commands.add_parser("info", help="the arrays and zones of a container")
+    info_parser.add_argument("path")
+    info_parser.add_argument("--within", type=float, help="read the zone within this of line l")
+    args = parser.parse_args(argv)
+
+    if args.command == "info":
+        m = read(args.path, args.within)
+        print(m)
+        with Container(args.path) as c:
+            for name, spec in c.index["arrays"].items():
+                print("  %-24s %-8s %-12s %d chunks" % (name, spec["dtype"], "x".join(map(str, spec["shape"])),
+                                                       c.chunks(name)))
+        return 0
+
+    import gmsh
+
+    line = (args.axis[:3], args.axis[3:]) if args.axis else None
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    try:
+        gmsh.open(args.mesh)
+        if args.command == "convert":
+            out = args.out or os.path.splitext(args.mesh)[0] + ".meshz"
+            write(out, line, args.float32)
+            print("%s: %.1f MB" % (out, os.path.getsize(out) / 2**20))
+        else:
+            results, zone = throughput(line, args.within, args.repeat, args.dir)
+            print("%-26s %10s %10s %10s %14s %10s" % ("stage", "wall s", "file MB", "MB/s", "elements/s", "peak MB"))
+            for row in results:
+                print("%(stage)-26s %(wall_s)10.2f %(file_mb)10.1f %(mb_s)10.1f %(elements_s)14d "
+                      "%(peak_rss_mb)10.1f" % row)
+            if zone is not None:
+                print("the zone within %g of line l: %r" % (args.within, zone))
+    finally:
+        gmsh.finalize()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
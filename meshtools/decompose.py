@@ -0,0 +1,336 @@
+# ----------------------------------------------------------------------------- #
+#  domain-decomposed plate: sub-domains meshed in parallel processes and merged
+# ----------------------------------------------------------------------------- #
+#
+# nearly all elements of the refined plate are inside the r1 cylinder, but
+# generate(3) meshes the whole box as one volume, and the recombination and
+# the optimise passes run on one core whatever General.NumThreads is. here the plate is built as an outer
+# coarse region and an inner impact cylinder of radius `split` (default r1),
+# itself cut into `parts` equal sectors around line l:
+#
+#          +-----------------+
+#          |      outer      |
+#          |     .-----.     |
+#          |    / \ 1 / \    |      parts = 4
+#          |   | 4  x  2 |   |      x = line l, the common edge of the sectors
+#          |    \ / 3 \ /    |
+#          |     '-----'     |
+#          +-----------------+
+#
+# the sub-domains share their interface surfaces. those are meshed once,
+# here, and saved; each volume is then meshed in its own process from that
+# surface mesh, so both sides of every interface start from the same
+# triangles and the mesh stays conforming. the volume meshes come back as
+# numpy arrays and are added to the model, and the nodes the sub-domains
+# have in common are merged by position (the hex subdivision of a shared face
+# comes out the same on both sides):
+#
+#   tags = decompose.build(params, parts=8, run_report=report)
+#   decompose.generate(params, tags, workers=8, run_report=report)
+#
+# in place of targets.build and targets.generate. the optimise passes that
+# only move nodes inside a volume (Relocate3D, Netgen) run in the workers
+# too; the others and refine run on the merged mesh, except the surface
+# smoothing (Laplace2D), which is skipped: on the merged mesh it inverted
+# hexahedra at the interfaces (15 on the plate at lc 0.5 in 4 parts) and
+# took longer than meshing the volumes, and run in the workers it left
+# near-flat ones. the merged and refined mesh is checked for inverted
+# elements (verify.inverted), any are reported.
+#
+# the sector interfaces are planes through line l, which the size field is
+# symmetric about, so the sectors come out about the same size. the mesh is
+# not the same as the single volume one: elements line up with the r1
+# cylinder and the sector planes.
+
+import concurrent.futures
+import math
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import gmsh
+import numpy as np
+
+from meshtools import options, report, targets, verify
+from meshtools.threads import apply as set_threads
+
+model = gmsh.model
+mesh = model.mesh
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# optimise passes that only move the nodes inside a volume
+VOLUME_PASSES = ("Relocate3D", "Netgen", "Gmsh")
+
+# surface smoothing passes, not run on a decomposed plate
+SURFACE_PASSES = ("Laplace2D",)
+
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY
+
+def build_plate(p, parts):
+    """l x l x h plate cut into an outer region and `parts` sectors of the impact cylinder
+
+    built with the built-in kernel like targets.build_plate (Laplace2D can't
+    project nodes onto the faces of an OCC box with a hole in it). returns the
+    tags of line l, the outer volume and the sector volumes.
+    """
+    geo = model.geo
+    lc, h, l = p["lc"], p["h"], p["l"]
+    ll = l/2
+    radius = p.get("split") or p["r1"]
+
+    # lower square
+    corners = [geo.addPoint(x, y, 0, lc) for x, y in ((0, 0), (l, 0), (l, l), (0, l))]
+    square = geo.addCurveLoop([geo.addLine(corners[i], corners[(i + 1) % 4]) for i in range(4)])
+
+    # circle of radius `split` around the centre, in arcs of less than pi,
+    # `per` arcs to a sector
+    centre = geo.addPoint(ll, ll, 0, lc)
+    per = -(-3 // parts)
+    rim = [geo.addPoint(ll + radius*math.cos(2*math.pi*i/(parts*per)),
+                        ll + radius*math.sin(2*math.pi*i/(parts*per)), 0, lc)
+           for i in range(parts*per)]
+    arcs = [geo.addCircleArc(rim[i], centre, rim[(i + 1) % len(rim)]) for i in range(len(rim))]
+
+    if parts > 1:
+        spokes = [geo.addLine(centre, rim[j*per]) for j in range(parts)]
+        sectors = [geo.addPlaneSurface([geo.addCurveLoop(
+            [spokes[j]] + arcs[j*per:(j + 1)*per] + [-spokes[(j + 1) % parts]])]) for j in range(parts)]
+    else:
+        sectors = [geo.addPlaneSurface([geo.addCurveLoop(arcs)])]
+    outer = geo.addPlaneSurface([square, geo.addCurveLoop(arcs)])
+
+    # extruding them together makes neighbours share their side surfaces
+    extruded = geo.extrude([(2, tag) for tag in sectors + [outer]], 0, 0, h)
+    volumes = [tag for dim, tag in extruded if dim == 3]
+
+    if parts == 1:
+        # line l is inside the cylinder, embedded as in targets.build_plate
+        top = extruded[0][1]
+        pf = geo.addPoint(ll, ll, h, lc)
+        line = geo.addLine(centre, pf)
+        geo.synchronize()
+        mesh.embed(0, [centre], 2, sectors[0])
+        mesh.embed(0, [centre], 3, volumes[0])
+        mesh.embed(0, [pf], 2, top)
+        mesh.embed(0, [pf], 3, volumes[0])
+        mesh.embed(1, [line], 3, volumes[0])
+    else:
+        # the extruded centre point, where the sectors meet
+        geo.synchronize()
+        eps = 1e-3*radius
+        line = model.getEntitiesInBoundingBox(ll - eps, ll - eps, -eps, ll + eps, ll + eps, h + eps, 1)[0][1]
+
+    return {"outer": volumes[-1], "sectors": volumes[:-1], "line": line, "centre": (ll, ll)}
+
+
+def build(p, parts, run_report=None):
+    """geometry, refinement fields and size limits of the decomposed plate"""
+    with report.stage(run_report, "geometry", parts=parts):
+        tags = build_plate(p, parts)
+    with report.stage(run_report, "fields"):
+        tags["field"] = targets.add_impact_fields(p, tags["line"], tags["centre"])
+        tags["sizing"] = targets.set_size_limits(p, tags["field"])
+    tags["parts"] = parts
+    return tags
+
+
+# ----------------------------------------------------------------------------- #
+#
+# VOLUME MESHES
+
+def _closure(volume):
+    """the volume, everything on its boundary and everything embedded in it"""
+    todo = [(3, volume)] + mesh.getEmbedded(3, volume)
+    seen = set()
+    while todo:
+        dim, tag = todo.pop()
+        if (dim, tag) in seen:
+            continue
+        seen.add((dim, tag))
+        if dim > 0:
+            todo += [(d, abs(t)) for d, t in model.getBoundary([(dim, tag)], combined=False, oriented=False)]
+    return sorted(seen)
+
+
+def mesh_volume(job):
+    """generate and optimise one volume from the shared surface mesh
+
+    runs in a worker process with its own gmsh (see _run), the volume's
+    nodes and elements go to an .npz file
+    """
+    surface, p, parts, volume, passes, out, settings, threads = job
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    set_threads(threads)
+    try:
+        start_time = time.perf_counter()
+        for name, value in settings.items():
+            if isinstance(value, str):
+                gmsh.option.setString(name, value)
+            else:
+                gmsh.option.setNumber(name, value)
+        build(p, parts)
+        gmsh.merge(surface)
+        # only this volume gets a 3D mesh
+        model.removeEntities([(3, tag) for _, tag in model.getEntities(3) if tag != volume])
+        mesh.generate(3)
+        targets.optimize(passes)
+
+        arrays = {}
+        for dim, tag in _closure(volume):
+            node_tags, coords, parametric = mesh.getNodes(dim, tag)
+            # the subdivision's new nodes on curves and surfaces have no
+            # parametric coordinates, then there are none for the entity
+            if len(parametric) != dim*len(node_tags) or dim == 3:
+                parametric = []
+            arrays["nodes %d %d" % (dim, tag)] = node_tags.astype(np.int64)
+            arrays["coords %d %d" % (dim, tag)] = coords
+            arrays["parametric %d %d" % (dim, tag)] = np.asarray(parametric)
+            for element_type, _, element_nodes in zip(*mesh.getElements(dim, tag)):
+                arrays["elements %d %d %d" % (dim, tag, element_type)] = element_nodes.astype(np.int64)
+        np.savez(out, **arrays)
+        return {"volume": volume, "wall_s": round(time.perf_counter() - start_time, 3)}
+    finally:
+        gmsh.finalize()
+
+
+def _run(job):
+    """mesh_volume(job) in a fresh python, returns its result
+
+    not a multiprocessing pool: a spawned worker imports the main module
+    again, which for the flat scripts means running the whole script
+    """
+    path = os.path.splitext(job[5])[0] + ".job"
+    with open(path, "wb") as f:
+        pickle.dump(job, f)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+        [REPO] + [part for part in [os.environ.get("PYTHONPATH")] if part]))
+    process = subprocess.run([sys.executable, "-m", "meshtools.decompose", path], env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    if process.returncode:
+        raise RuntimeError("meshing volume %d failed:\n%s" % (job[3], process.stdout[-2000:]))
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def _add(path, offset, owned):
+    """add a worker's nodes and elements to the model, returns the next offset
+
+    node tags are shifted by `offset` so the workers' tags don't collide.
+    lower dimensional elements are only added by the first worker that has
+    them, `owned` keeps track of those entities.
+    """
+    arrays = np.load(path)
+    largest = 0
+    added = set()
+    for name in arrays.files:
+        kind, *numbers = name.split()
+        if kind == "nodes" and len(arrays[name]):
+            dim, tag = map(int, numbers)
+            mesh.addNodes(dim, tag, arrays[name] + offset, arrays["coords %d %d" % (dim, tag)],
+                          arrays["parametric %d %d" % (dim, tag)])
+            largest = max(largest, int(arrays[name].max()))
+    for name in arrays.files:
+        kind, *numbers = name.split()
+        if kind == "elements":
+            dim, tag, element_type = map(int, numbers)
+            if dim < 3 and (dim, tag) in owned:
+                continue
+            mesh.addElementsByType(tag, element_type, [], arrays[name] + offset)
+            added.add((dim, tag))
+    owned |= added
+    return offset + largest
+
+
+def split_passes(passes):
+    """the leading optimise passes that only move nodes inside a volume, and the rest
+
+    the first ones can run on each sub-domain on its own, the others on the
+    merged mesh
+    """
+    passes = list(passes)
+    n = 0
+    while n < len(passes) and passes[n][0] in VOLUME_PASSES:
+        n += 1
+    return passes[:n], passes[n:]
+
+
+def generate(p, tags, workers=None, threads=1, run_report=None):
+    """the generate -> optimise -> refine sequence of targets.generate, decomposed
+
+    the surfaces are meshed here, the volumes in `workers` processes (with
+    the volume-only optimise passes), then merged, and the remaining passes
+    but SURFACE_PASSES and the refinement run on the whole mesh. returns the
+    workers' results and the no. of inverted elements of the final mesh
+    """
+    if p["refine_within"] is not None:
+        raise ValueError("refine_within isn't supported with a decomposed plate")
+    if p["symmetry"] != 1:
+        raise ValueError("symmetry isn't supported with a decomposed plate")
+    volumes = tags["sectors"] + [tags["outer"]]
+    workers = min(workers or os.cpu_count() or 1, len(volumes))
+    local, rest = split_passes(p["optimize"])
+    skipped = [step for step in rest if step[0] in SURFACE_PASSES]
+    rest = [step for step in rest if step[0] not in SURFACE_PASSES]
+    if skipped:
+        print("not run on the merged mesh: " + ", ".join(step[0] for step in skipped))
+
+    with report.stage(run_report, "generate", dim=2):
+        mesh.generate(2)
+
+    work = tempfile.mkdtemp(prefix="meshtools-decompose-")
+    try:
+        surface = os.path.join(work, "surface.msh")
+        saved = gmsh.option.getNumber("Mesh.SaveParametric")
+        gmsh.option.setNumber("Mesh.SaveParametric", 1)
+        gmsh.write(surface)
+        gmsh.option.setNumber("Mesh.SaveParametric", saved)
+        # the sectors first, they hold nearly all the elements
+        jobs = [(surface, p, tags["parts"], volume, local, os.path.join(work, "%d.npz" % volume),
+                 options.snapshot(), threads) for volume in volumes]
+        with report.stage(run_report, "mesh volumes", volumes=len(volumes), workers=workers,
+                          optimize=[step[0] for step in local]):
+            with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+                results = list(pool.map(_run, jobs))
+        for result in results:
+            print("volume %(volume)d meshed in %(wall_s).2f s" % result)
+
+        with report.stage(run_report, "merge"):
+            mesh.clear()
+            offset, owned = 0, set()
+            for job in jobs:
+                offset = _add(job[5], offset, owned)
+            # the sub-domains' copies of the interface nodes
+            mesh.removeDuplicateNodes()
+            mesh.removeDuplicateElements()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    targets.optimize(rest, run_report)
+    if run_report is None:
+        mesh.refine()
+    else:
+        run_report.refine()
+
+    with report.stage(run_report, "check inverted"):
+        inverted = verify.inverted()
+    if run_report is not None:
+        run_report.info["inverted"] = inverted
+    if inverted:
+        print("warning: %d inverted elements in the merged mesh" % inverted)
+    return results, inverted
+
+
+if __name__ == "__main__":
+    # a worker started by _run: job in, result out, through the same file
+    with open(sys.argv[1], "rb") as f:
+        result = mesh_volume(pickle.load(f))
+    with open(sys.argv[1], "wb") as f:
+        pickle.dump(result, f)
@@ -0,0 +1,104 @@
+# ----------------------------------------------------------------------------- #
+#  refined quad surface mesh of the plate extruded in graded layers
+# ----------------------------------------------------------------------------- #
+#
+# the fast route to an all-hex plate: mesh the bottom face in quadrangles with
+# the impact refinement of plate-ustruct-hex.py and extrude it through h, so
+# there is no 3D meshing and no 3D recombination at all.
+#
+#   p = extrude.resolve(dict(lc=0.1, layers=8, layer_growth=1.2))
+#   tags = extrude.build_plate(p)
+#   mesh.generate(3)
+#
+# the parameters are targets.PLATE (lc, lcsmaller, lcsmallest, r1, r2, F, h,
+# l, lcmin, lcmax, callback) and the same Distance -> MathEval and Cylinder
+# fields, with the distance taken from the impact point embedded in the bottom
+# face, which in the plane is the distance to line l. the extrusion puts a
+# column of nodes on the impact axis. on top of those:
+#
+#   layers        elements through the thickness (None: h / lcsmallest), or a
+#                 list of the layer thicknesses as fractions of h, bottom up
+#   layer_growth  thickness ratio of neighbouring layers, from the top face
+#                 (z = h) down, e.g. 1.2 for thin layers at the impact face
+#
+# Frontal-Delaunay for quads with blossom full-quad recombination leaves no
+# triangles, so every element is a hexahedron.
+
+import gmsh
+
+from meshtools import report, targets
+
+model = gmsh.model
+geo = model.geo
+mesh = model.mesh
+
+# the surface meshing options, on top of the size options of targets.py
+OPTIONS = {
+    # 8: Frontal-Delaunay for Quads
+    "Mesh.Algorithm": 8,
+    # 3: blossom full-quad
+    "Mesh.RecombinationAlgorithm": 3,
+    "Mesh.RecombineAll": 1,
+    "Mesh.MeshSizeExtendFromBoundary": 0,
+    "Mesh.MeshSizeFromPoints": 0,
+    "Mesh.MeshSizeFromCurvature": 0,
+}
+
+# parameters on top of targets.PLATE, see above
+LAYERS = {"layers": None, "layer_growth": 1.0}
+
+
+def resolve(overrides=None):
+    """targets.PLATE and LAYERS updated with overrides, strings evaluated"""
+    params = dict(targets.PLATE, **LAYERS)
+    params.update(overrides or {})
+    return targets.evaluate(params)
+
+
+def layer_heights(p):
+    """cumulative heights of the layers as fractions of h, for geo.extrude"""
+    layers = p["layers"] or max(1, round(p["h"] / p["lcsmallest"]))
+    if isinstance(layers, (list, tuple)):
+        thickness = [float(t) for t in layers]
+    else:
+        # geometric from the top face down, listed bottom up
+        thickness = [p["layer_growth"]**k for k in range(int(layers))][::-1]
+    total = sum(thickness)
+    heights, z = [], 0.0
+    for t in thickness:
+        z += t / total
+        heights.append(z)
+    heights[-1] = 1.0
+    return heights
+
+
+def build_plate(p, run_report=None):
+    """l x l bottom face refined around the impact point, extruded through h
+
+    returns the tags as targets.build does, with the end points of the impact
+    axis as "line" (see verify.py)
+    """
+    with report.stage(run_report, "geometry"):
+        lc, h, l = p["lc"], p["h"], p["l"]
+        corners = [geo.addPoint(x, y, 0, lc) for x, y in ((0, 0), (l, 0), (l, l), (0, l))]
+        edges = [geo.addLine(corners[k], corners[(k + 1) % 4]) for k in range(4)]
+        bottom = geo.addPlaneSurface([geo.addCurveLoop(edges)])
+        impact = geo.addPoint(l/2, l/2, 0, lc)
+        geo.synchronize()
+        mesh.embed(0, [impact], 2, bottom)
+        geo.mesh.setRecombine(2, bottom)
+
+        heights = layer_heights(p)
+        extruded = geo.extrude([(2, bottom)], 0, 0, h, [1] * len(heights), heights,
+                               recombine=True)
+        geo.synchronize()
+
+    with report.stage(run_report, "fields"):
+        targets.set_options(OPTIONS)
+        field = targets.add_impact_fields(p, impact, (l/2, l/2), dim=0)
+        sizing = targets.set_size_limits(p, field)
+
+    # extrude returns the top face, then the volume, then the sides
+    top, volume = extruded[0][1], extruded[1][1]
+    return {"volume": volume, "line": ((l/2, l/2, 0), (l/2, l/2, h)), "centre": (l/2, l/2),
+            "bottom": bottom, "top": top, "field": field, "sizing": sizing, "layers": len(heights)}
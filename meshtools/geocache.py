@@ -0,0 +1,131 @@
+# ----------------------------------------------------------------------------- #
+#  cache of imported and OpenCascade-built geometry as XAO (or BREP)
+# ----------------------------------------------------------------------------- #
+#
+# translating a STEP file is the slow part of importShapes, and the bullet
+# scripts do it on every run. instead
+#
+#   v = geocache.import_step(step_file_path)
+#
+# imports (and optionally heals) the STEP once, writes the OCC model in gmsh's
+# native XAO form under a hash of the file's contents and the import
+# options, and loads that on later runs. XAO is used rather than BREP because
+# BREP export drops free entities, e.g. the separate cap surfaces that
+# ustruc-cyl.py creates next to its volume.
+#
+# OCC geometry built in code (e.g. the addThruSections + fragment cylinder of
+# ustruc-cyl.py) is cached the same way with
+#
+#   tags = geocache.build("cylinder", params, build_function)
+#
+# where build_function() creates the geometry and returns a dict of named
+# (dim, tag) pairs. entity tags are not guaranteed to survive the round trip,
+# so the named entities are found again on reload by their bounding boxes.
+#
+# both expect the current model to be empty: the whole model is written out,
+# and on a miss the model is emptied again and reloaded from the cache, so
+# the first run meshes exactly the same geometry as the later ones (a fresh
+# STEP import and its reloaded copy can give slightly different meshes).
+
+import json
+import os
+
+import gmsh
+
+from meshtools import cache
+
+occ = gmsh.model.occ
+
+# relative tolerance when matching bounding boxes after a reload
+_TOL = 1e-6
+
+
+def _path(key, fmt):
+    return os.path.join(cache.directory("geometry"), "%s.%s" % (key, fmt))
+
+
+def _load(path):
+    """load a cached model, returns the dimTags of its highest dimension"""
+    if path.endswith(".brep"):
+        dimtags = occ.importShapes(path)
+        occ.synchronize()
+        return dimtags
+    # XAO can only be merged, which also synchronizes the model
+    gmsh.merge(path)
+    for dim in (3, 2, 1, 0):
+        if occ.getEntities(dim):
+            return occ.getEntities(dim)
+    return []
+
+
+def _save(path):
+    with cache.atomic(path) as tmp:
+        gmsh.write(tmp)
+
+
+def _reload(path):
+    """replace the current model by the cached one, keeping its name"""
+    name = gmsh.model.getCurrent()
+    gmsh.model.remove()
+    gmsh.model.add(name)
+    return _load(path)
+
+
+def import_step(path, heal=False, fmt="xao", **options):
+    """importShapes(path) through the geometry cache, returns the dimTags
+
+    `options` are passed on to importShapes (e.g. highestDimOnly) and are part
+    of the cache key, as are `heal` and the gmsh version. with heal=True the
+    imported shapes are healed with occ.healShapes() before caching.
+    """
+    key = cache.key("step", cache.file_hash(path), heal, options, gmsh.__version__)
+    cached = _path(key, fmt)
+    if os.path.exists(cached):
+        return _load(cached)
+
+    dimtags = occ.importShapes(path, **options)
+    if heal:
+        dimtags = occ.healShapes(dimtags)
+    occ.synchronize()
+    _save(cached)
+    return _reload(cached)
+
+
+def _bounds(dimtag):
+    return list(gmsh.model.getBoundingBox(*dimtag))
+
+
+def _find(dim, box):
+    """entity of dimension `dim` whose bounding box matches `box`"""
+    scale = max(abs(v) for v in box) or 1
+    for dimtag in gmsh.model.getEntities(dim):
+        if all(abs(a - b) <= _TOL*scale for a, b in zip(_bounds(dimtag), box)):
+            return dimtag
+    raise LookupError("no %dD entity with bounding box %s in cached geometry" % (dim, box))
+
+
+def build(name, params, build_function, fmt="xao"):
+    """geometry from build_function(), cached under `name` and `params`
+
+    build_function() builds OCC geometry, synchronizes and returns a dict of
+    {name: (dim, tag)}; the same dict is returned, with the tags as they are
+    in the model loaded from the cache.
+    """
+    key = cache.key("build", name, params, gmsh.__version__)
+    cached = _path(key, fmt)
+    index = cached + ".json"
+
+    if os.path.exists(cached) and os.path.exists(index):
+        with open(index) as f:
+            boxes = json.load(f)
+        _load(cached)
+    else:
+        entities = build_function()
+        boxes = {entity: (dim, _bounds((dim, tag))) for entity, (dim, tag) in entities.items()}
+        _save(cached)
+        with cache.atomic(index) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(boxes, f)
+        _reload(cached)
+
+    return {entity: _find(dim, box) for entity, (dim, box) in boxes.items()}
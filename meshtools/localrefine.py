@@ -0,0 +1,307 @@
+# ----------------------------------------------------------------------------- #
+#  conforming refinement of the tetrahedra in a region only
+# ----------------------------------------------------------------------------- #
+#
+# mesh.refine() splits every element, so the far field, where VOut = lc is
+# already fine enough, gets 8 times the elements too. here only the
+# tetrahedra inside a region are split, before the hex subdivision:
+#
+#   generate(3) with Mesh.SubdivisionAlgorithm 0      -> tetrahedra
+#   localrefine.refine(localrefine.near_curve(l, r1)) -> tets near l split in 8
+#   mesh.refine() with Mesh.SubdivisionAlgorithm 2    -> every tet into 4 hexes
+#
+# which gives the same element size near l as generate + refine and one
+# level coarser elsewhere, all hexahedra. targets.generate does this when
+# the parameter refine_within is set.
+#
+# every edge of a tet in the region is marked, and so are all the edges of
+# the tets around it whose marked edges are anything but
+#
+#   one edge, or two on a face   bisected at them, longest first
+#   the three edges of one face  that face split in 4, joined to the 4th node
+#   all six                      split in 8, along the octahedron's shortest diagonal
+#
+# until no such tet is left. a face with all three edges marked is then split
+# in 4 from both sides, any other one is bisected in the same global order
+# from both sides, so the mesh stays conforming without hanging nodes: the
+# tets next to the region become the transition elements. triangles and
+# lines are split the same way, and new nodes on curves and surfaces are put
+# on the geometry.
+#
+# this works on a mesh of tetrahedra only, as gmsh makes it with
+# Mesh.SubdivisionAlgorithm, Mesh.RecombineAll and Mesh.Recombine3DAll at 0.
+
+import gmsh
+import numpy as np
+
+model = gmsh.model
+mesh = model.mesh
+
+# nodes per element of the gmsh element types here
+_NODES = {15: 1, 1: 2, 2: 3, 4: 4}
+
+# and their edges as pairs of local nodes
+_EDGES = {
+    1: np.array([[0, 1]]),                                              # line
+    2: np.array([[0, 1], [1, 2], [2, 0]]),                              # triangle
+    4: np.array([[0, 1], [1, 2], [2, 0], [0, 3], [1, 3], [2, 3]]),      # tetrahedron
+}
+
+# the faces of a tetrahedron as its local nodes, the edges of each face
+# (positions in _EDGES[4]) and the node opposite it
+_FACES = np.array([[0, 1, 2], [0, 1, 3], [1, 2, 3], [2, 0, 3]])
+_FACE_EDGES = np.array([[0, 1, 2], [0, 4, 3], [1, 5, 4], [2, 3, 5]])
+_OPPOSITE = np.array([3, 2, 0, 1])
+
+# pairs of opposite edges of a tetrahedron
+_OPPOSITE_EDGES = np.array([[0, 5], [1, 3], [2, 4]])
+
+
+# ----------------------------------------------------------------------------- #
+#
+# REGIONS
+
+def curve_ends(tag):
+    """the end points of curve `tag` as two arrays"""
+    ends = [model.getValue(0, abs(point), []) for _, point in model.getBoundary([(1, tag)])]
+    return np.array(ends[0]), np.array(ends[-1])
+
+
+def segment_distance(points, a, b):
+    """distance of (n, 3) points to the segment from a to b"""
+    t = np.clip((points - a) @ (b - a) / ((b - a) @ (b - a)), 0, 1)
+    return np.linalg.norm(points - a - t[:, None]*(b - a), axis=1)
+
+
+def near_curve(tag, distance):
+    """points within `distance` of the straight curve `tag` (e.g. line l)
+
+    for a line through the plate that is the impact cylinder of that radius
+    """
+    a, b = curve_ends(tag)
+
+    def inside(points):
+        return segment_distance(points, a, b) <= distance
+
+    return inside
+
+
+def cylinder(xc, yc, radius):
+    """points within `radius` of the vertical axis through (xc, yc)"""
+    def inside(points):
+        return np.hypot(points[:, 0] - xc, points[:, 1] - yc) <= radius
+    return inside
+
+
+# ----------------------------------------------------------------------------- #
+#
+# REFINE
+
+def _keys(a, b):
+    """edges as single integers, the same for (a, b) and (b, a)"""
+    return np.minimum(a, b) << 32 | np.maximum(a, b)
+
+
+def _find(keys, wanted):
+    """positions of `wanted` in the sorted `keys`, and which were found"""
+    pos = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    return pos, keys[pos] == wanted
+
+
+def _bisect(elements, edges, keys, priority, middles):
+    """split elements at their marked edges, highest priority first
+
+    keys (sorted), priority and middles describe the marked edges. a child
+    replaces one end of the split edge by its middle node, which keeps the
+    orientation of the element.
+    """
+    done = [elements[:0]]
+    while len(elements):
+        pos, marked = _find(keys, _keys(elements[:, edges[:, 0]], elements[:, edges[:, 1]]))
+        ranks = np.where(marked, priority[pos], -1)
+        split = ranks.max(axis=1) >= 0
+        done.append(elements[~split])
+
+        elements, pos, first = elements[split], pos[split], ranks[split].argmax(axis=1)
+        rows = np.arange(len(elements))
+        middle = middles[pos[rows, first]]
+        left, right = elements.copy(), elements.copy()
+        left[rows, edges[first, 1]] = middle
+        right[rows, edges[first, 0]] = middle
+        elements = np.concatenate([left, right])
+    return np.concatenate(done)
+
+
+def _red_triangles(a, b, c, ab, bc, ca):
+    """a triangle split in 4 at its edge middles, same orientation"""
+    return np.concatenate([np.stack(corners, axis=1) for corners in
+                           ((a, ab, ca), (ab, b, bc), (ca, bc, c), (ab, bc, ca))])
+
+
+def _orient(tets, xyz):
+    """swap two nodes of the tets with a negative volume"""
+    p = xyz[tets]
+    negative = np.einsum("ij,ij->i", np.cross(p[:, 1] - p[:, 0], p[:, 2] - p[:, 0]), p[:, 3] - p[:, 0]) < 0
+    tets[negative] = tets[negative][:, [1, 0, 2, 3]]
+    return tets
+
+
+def _red(tets, middle, xyz):
+    """tetrahedra split in 8, the inner octahedron along its shortest diagonal"""
+    n0, n1, n2, n3 = tets.T
+    m01, m12, m20, m03, m13, m23 = middle.T
+    children = [np.stack(corners, axis=1) for corners in
+                ((n0, m01, m20, m03), (m01, n1, m12, m13), (m20, m12, n2, m23), (m03, m13, m23, n3))]
+    # the octahedron's diagonals join the middles of opposite edges; the
+    # four tets around the shortest one, each with one edge of its equator
+    diagonals = middle[:, _OPPOSITE_EDGES]
+    lengths = np.linalg.norm(xyz[diagonals[:, :, 0]] - xyz[diagonals[:, :, 1]], axis=2)
+    shortest = lengths.argmin(axis=1)
+    rows = np.arange(len(tets))
+    a, b = diagonals[rows, shortest, 0], diagonals[rows, shortest, 1]
+    # the equator: the other four middles, in order around the diagonal
+    rings = np.array([[1, 2, 3, 4], [0, 2, 5, 4], [0, 1, 5, 3]])
+    ring = middle[rows[:, None], rings[shortest]]
+    for i in range(4):
+        children.append(np.stack([a, b, ring[:, i], ring[:, (i + 1) % 4]], axis=1))
+    return _orient(np.concatenate(children), xyz)
+
+
+def _face_red(tets, middle, face, xyz):
+    """tetrahedra with the three edges of one face marked: that face split in
+    4 and joined to the opposite node"""
+    rows = np.arange(len(tets))
+    a, b, c = (tets[rows, _FACES[face, i]] for i in range(3))
+    ab, bc, ca = (middle[rows, _FACE_EDGES[face, i]] for i in range(3))
+    apex = tets[rows, _OPPOSITE[face]]
+    triangles = _red_triangles(a, b, c, ab, bc, ca)
+    return _orient(np.concatenate([triangles, np.tile(apex, 4)[:, None]], axis=1), xyz)
+
+
+def _close(marked):
+    """mark all edges of the tets whose marked edges aren't a pattern here
+
+    the patterns: none, one edge or two on a face (bisected), the three
+    edges of one face (face split in 4) or all six (split in 8)
+    """
+    count = marked.sum(axis=1)
+    opposite = (marked[:, _OPPOSITE_EDGES[:, 0]] & marked[:, _OPPOSITE_EDGES[:, 1]]).any(axis=1)
+    one_face = marked[:, _FACE_EDGES].all(axis=2).any(axis=1)
+    ok = (count <= 1) | ((count == 2) & ~opposite) | ((count == 3) & one_face) | (count == 6)
+    return ~ok
+
+
+def refine(inside):
+    """split the tetrahedra whose centre is inside the region, and the
+    elements around them as needed to stay conforming
+
+    `inside` maps an (n, 3) array of points to a boolean mask, see
+    near_curve() and cylinder(). returns the no. of tetrahedra split in 8.
+    """
+    # nodes of every entity, and its elements by type
+    entities = model.getEntities()
+    nodes, elements = {}, {}
+    for dim, tag in entities:
+        node_tags, coords, parametric = mesh.getNodes(dim, tag)
+        nodes[dim, tag] = [node_tags.astype(np.int64), coords.reshape(-1, 3), parametric]
+        for element_type, _, element_nodes in zip(*mesh.getElements(dim, tag)):
+            if dim > 0 and element_type not in _EDGES:
+                raise ValueError("local refinement needs a mesh of tetrahedra (got element type %d in "
+                                 "entity %d %d), generate it with Mesh.SubdivisionAlgorithm 0"
+                                 % (element_type, dim, tag))
+            elements[dim, tag, element_type] = element_nodes.astype(np.int64).reshape(-1, _NODES[element_type])
+
+    all_tags = np.concatenate([n[0] for n in nodes.values()])
+    all_coords = np.concatenate([n[1] for n in nodes.values()])
+    base = int(all_tags.max()) + 1
+    where = np.zeros(base, dtype=np.int64)
+    where[all_tags] = np.arange(len(all_tags))
+
+    # mark every edge of the tetrahedra in the region, then of the tets
+    # around them whose marked edges aren't a pattern split here, until all are
+    tets = [(key, value) for key, value in elements.items() if key[2] == 4]
+    if not tets:
+        return 0
+    tet_edges = np.concatenate([_keys(tet[:, _EDGES[4][:, 0]], tet[:, _EDGES[4][:, 1]]) for _, tet in tets])
+    centres = np.concatenate([all_coords[where[tet]].mean(axis=1) for _, tet in tets])
+    universe, tet_edges = np.unique(tet_edges, return_inverse=True)
+    tet_edges = tet_edges.reshape(-1, 6)
+    flags = np.zeros(len(universe), dtype=bool)
+    flags[tet_edges[inside(centres)]] = True
+    while True:
+        bad = _close(flags[tet_edges])
+        if not bad.any():
+            break
+        flags[tet_edges[bad]] = True
+    keys = universe[flags]
+    if not len(keys):
+        return 0
+    a, b = keys >> 32, keys & 0xffffffff
+    middle_coords = (all_coords[where[a]] + all_coords[where[b]]) / 2
+    lengths = np.linalg.norm(all_coords[where[a]] - all_coords[where[b]], axis=1)
+    # longest first, ties by key, the same for every element
+    priority = np.empty(len(keys), dtype=np.int64)
+    priority[np.lexsort((-keys, lengths))] = np.arange(len(keys))
+    middles = base + np.arange(len(keys))
+    xyz = np.zeros((base + len(keys), 3))
+    xyz[all_tags] = all_coords
+    xyz[middles] = middle_coords
+
+    # a new node belongs to the lowest dimensional entity whose elements
+    # have its edge: a curve, a surface or else the volume
+    index = {entity: i for i, entity in enumerate(entities)}
+    owner = np.full(len(keys), -1, dtype=np.int64)
+    for (dim, tag, element_type), element_nodes in sorted(elements.items()):
+        if dim > 0:
+            edges = _EDGES[element_type]
+            pos, found = _find(keys, _keys(element_nodes[:, edges[:, 0]], element_nodes[:, edges[:, 1]]))
+            hit = pos[found]
+            owner[hit[owner[hit] < 0]] = index[dim, tag]
+
+    # split the elements of every entity: all edges marked in 8 (tets) or 4
+    # (triangles), the three edges of one face in 4, else by bisection
+    refined = {}
+    count = 0
+    for (dim, tag, element_type), element_nodes in elements.items():
+        if dim > 0:
+            edges = _EDGES[element_type]
+            pos, found = _find(keys, _keys(element_nodes[:, edges[:, 0]], element_nodes[:, edges[:, 1]]))
+            middle = middles[pos]
+            parts = []
+            if element_type == 4:
+                red = found.all(axis=1)
+                count += int(red.sum())
+                parts.append(_red(element_nodes[red], middle[red], xyz))
+                face = found[:, _FACE_EDGES].all(axis=2)
+                for i in range(4):
+                    rows = face[:, i] & ~red
+                    parts.append(_face_red(element_nodes[rows], middle[rows], i, xyz))
+                rest = ~red & ~face.any(axis=1)
+            elif element_type == 2:
+                red = found.all(axis=1)
+                parts.append(_red_triangles(*element_nodes[red].T, *middle[red].T))
+                rest = ~red
+            else:
+                rest = np.ones(len(element_nodes), dtype=bool)
+            parts.append(_bisect(element_nodes[rest], edges, keys, priority, middles))
+            element_nodes = np.concatenate(parts)
+        refined[dim, tag, element_type] = element_nodes
+
+    # and put it all back, new nodes on curves and surfaces on the geometry
+    mesh.clear()
+    for i, (dim, tag) in enumerate(entities):
+        node_tags, coords, parametric = nodes[dim, tag]
+        rows = np.flatnonzero(owner == i)
+        coords = np.concatenate([coords, middle_coords[rows]])
+        if dim in (1, 2) and len(rows):
+            closest, middle_parametric = model.getClosestPoint(dim, tag, middle_coords[rows].ravel())
+            coords[len(node_tags):] = np.reshape(closest, (-1, 3))
+            # only if every old node has them too
+            parametric = np.concatenate([parametric, middle_parametric]) \
+                if len(parametric) == dim*len(node_tags) else []
+        elif dim == 3:
+            parametric = []
+        mesh.addNodes(dim, tag, np.concatenate([node_tags, middles[rows]]), coords.ravel(), parametric)
+    for (dim, tag, element_type), element_nodes in refined.items():
+        mesh.addElementsByType(tag, element_type, [], element_nodes.ravel())
+    return count
@@ -0,0 +1,276 @@
+# ----------------------------------------------------------------------------- #
+#  LS-DYNA keyword (.k) export of the current mesh, streamed in chunks
+# ----------------------------------------------------------------------------- #
+#
+# the meshes end up in LS-DYNA, but the scripts write gmsh's .msh, which then
+# has to be converted. write() puts the current mesh straight into a keyword
+# file, *NODE and *ELEMENT_SOLID (or *ELEMENT_SHELL for a surface mesh):
+#
+#   lsdyna.write("ustruct-refined.k")
+#
+# and report.write / pipeline.write do that for any path ending in .k, .key or
+# .dyn, so the scripts write one with -setstring format k. an existing mesh
+# is converted with
+#
+#   python -m meshtools.lsdyna convert ustruct-refined.msh
+#
+# nodes and connectivity come out of gmsh as numpy arrays, one entity at a
+# time, and are formatted into fixed width cards by numpy `chunk` rows at a
+# time rather than one python format call per value. on top of gmsh's arrays
+# of the largest entity, memory is bounded by the chunk; the whole file is
+# never held as text. (getElementsByType's task slices would bound those too,
+# but only fill preallocated arrays from C++.) the cards are the standard 8 / 16
+# character fields; node and element tags are gmsh's own. the part id of an
+# element is the physical group of its entity, or the entity tag without
+# one. only the mesh is written: *PART, *SECTION and *MAT belong in the main
+# deck, which includes this file.
+#
+#   python -m meshtools.lsdyna bench ustruct-refined.msh
+#
+# times gmsh.write to ASCII and binary .msh against write() for a mesh.
+
+import argparse
+import os
+import sys
+
+import gmsh
+import numpy as np
+
+model = gmsh.model
+mesh = model.mesh
+
+# nodes or elements formatted at a time
+CHUNK = 100000
+
+# file extensions written as keyword files
+EXTENSIONS = (".k", ".key", ".dyn")
+
+# gmsh element type -> its nodes in LS-DYNA order, as 8 node solids or 4
+# node shells with the usual repeated nodes for the degenerate shapes
+_SOLIDS = {
+    4: [0, 1, 2, 3, 3, 3, 3, 3],            # tetrahedron
+    5: [0, 1, 2, 3, 4, 5, 6, 7],            # hexahedron
+    6: [1, 0, 3, 4, 2, 2, 5, 5],            # prism, quad face 1 0 3 4 and ridge 2 5
+    7: [0, 1, 2, 3, 4, 4, 4, 4],            # pyramid
+}
+_SHELLS = {
+    2: [0, 1, 2, 2],                        # triangle
+    3: [0, 1, 2, 3],                        # quadrangle
+}
+
+# gmsh's running count of each element type (see stats.py)
+_COUNTS = {2: "Mesh.NbTriangles", 3: "Mesh.NbQuadrangles", 4: "Mesh.NbTetrahedra",
+           5: "Mesh.NbHexahedra", 6: "Mesh.NbPrisms", 7: "Mesh.NbPyramids"}
+
+# largest id in an 8 character field
+_MAX_ID = 99999999
+
+# ----------------------------------------------------------------------------- #
+#
+# FIXED WIDTH FIELDS
+
+def _ints(values, width=8, fill=32):
+    """(n, k) non-negative ints as right aligned fields, an (n, k*width) uint8
+    array, padded with spaces (or zeros with fill=48)"""
+    values = np.asarray(values, dtype=np.int64)
+    out = np.empty(values.shape + (width,), dtype=np.uint8)
+    for i in range(width - 1, -1, -1):
+        digit = (48 + values % 10).astype(np.uint8)
+        # leading zeros are spaces, but a 0 is still written
+        out[..., i] = np.where((values > 0) | (i == width - 1), digit, fill)
+        values = values // 10
+    return out.reshape(len(out), -1)
+
+
+def _floats(values):
+    """(n, k) floats as %16.8e fields, an (n, k*16) uint8 array"""
+    values = np.asarray(values, dtype=np.float64)
+    size = np.abs(values)
+    # too small for a two digit exponent is 0 here
+    size[size < 1e-99] = 0
+    exponent = np.floor(np.log10(np.where(size > 0, size, 1))).astype(np.int64)
+    mantissa = np.rint(size / 10.0**exponent * 1e8).astype(np.int64)
+    # log10 and the rounding can be one digit off either way
+    over = mantissa >= 10**9
+    exponent[over] += 1
+    under = (mantissa < 10**8) & (size > 0)
+    exponent[under] -= 1
+    fix = over | under
+    mantissa[fix] = np.rint(size[fix] / 10.0**exponent[fix] * 1e8).astype(np.int64)
+
+    out = np.empty(values.shape + (16,), dtype=np.uint8)
+    out[..., 0] = 32
+    out[..., 1] = np.where(values < 0, 45, 32)
+    out[..., 2] = 48 + mantissa // 10**8
+    out[..., 3] = 46
+    out[..., 4:12] = _ints(mantissa % 10**8, 8, fill=48).reshape(values.shape + (8,))
+    out[..., 12] = 101
+    out[..., 13] = np.where(exponent < 0, 45, 43)
+    out[..., 14] = 48 + np.abs(exponent) // 10
+    out[..., 15] = 48 + np.abs(exponent) % 10
+    return out.reshape(len(out), -1)
+
+
+def _lines(*columns):
+    """the columns side by side as text lines"""
+    newline = np.full((len(columns[0]), 1), 10, dtype=np.uint8)
+    return np.concatenate(columns + (newline,), axis=1).tobytes()
+
+# ----------------------------------------------------------------------------- #
+#
+# WRITE
+
+def _part_ids():
+    """{(dim, entity): part id}, the first physical group of an entity or its tag"""
+    ids = {}
+    for dim, tag in model.getEntities():
+        groups = model.getPhysicalGroupsForEntity(dim, tag)
+        ids[dim, tag] = int(groups[0]) if len(groups) else tag
+    return ids
+
+
+def _element_dim():
+    """3 if there are any solid elements, else 2"""
+    for dim in (3, 2):
+        if any(int(gmsh.option.getNumber(_COUNTS[t])) for t in (_SOLIDS if dim == 3 else _SHELLS)):
+            return dim
+    raise ValueError("no solid or shell elements to write")
+
+
+def write(path, chunk=CHUNK, title=None):
+    """the current mesh as an LS-DYNA keyword file at `path`
+
+    solids when there are any 3D elements, else shells. returns the no. of
+    nodes and elements written.
+    """
+    if mesh.getMaxNodeTag() > _MAX_ID or mesh.getMaxElementTag() > _MAX_ID:
+        raise ValueError("node or element tags above %d don't fit the keyword fields, "
+                         "renumber the mesh (mesh.renumberNodes / renumberElements)" % _MAX_ID)
+    dim = _element_dim()
+    types = _SOLIDS if dim == 3 else _SHELLS
+    part_ids = _part_ids()
+    nodes = elements = 0
+
+    with open(path, "wb") as f:
+        f.write(b"*KEYWORD\n*TITLE\n%s\n" % (title or model.getCurrent() or "gmsh").encode()[:80])
+        f.write(b"$     nid               x               y               z      tc      rc\n*NODE\n")
+        for entity in model.getEntities():
+            tags, coords, _ = mesh.getNodes(*entity, includeBoundary=False, returnParametricCoord=False)
+            coords = coords.reshape(-1, 3)
+            for start in range(0, len(tags), chunk):
+                block = tags[start:start + chunk]
+                f.write(_lines(_ints(block[:, None]), _floats(coords[start:start + chunk])))
+            nodes += len(tags)
+
+        f.write(b"*ELEMENT_SOLID\n" if dim == 3 else b"*ELEMENT_SHELL\n")
+        for element_type, order in types.items():
+            if not int(gmsh.option.getNumber(_COUNTS[element_type])):
+                continue
+            for entity in model.getEntities(dim):
+                tags, node_tags = mesh.getElementsByType(element_type, entity[1])
+                node_tags = node_tags.reshape(len(tags), -1)
+                for start in range(0, len(tags), chunk):
+                    block = tags[start:start + chunk]
+                    ids = np.column_stack([block, np.full(len(block), part_ids[entity])])
+                    f.write(_lines(_ints(ids), _ints(node_tags[start:start + chunk, order])))
+                elements += len(tags)
+        f.write(b"*END\n")
+    return nodes, elements
+
+
+def save(path, line=None):
+    """gmsh.write(path), or write() for a keyword file, .npy arrays in a
+    folder (arrays.py) for path.npy, or a container (container.py) ordered
+    by distance to line l for path.meshz"""
+    if path.lower().endswith(EXTENSIONS):
+        write(path)
+    elif path.lower().endswith(".npy"):
+        from meshtools import arrays
+
+        arrays.save(path)
+    elif path.lower().endswith(".meshz"):
+        from meshtools import container
+
+        container.write(path, line)
+    else:
+        gmsh.write(path)
+
+# ----------------------------------------------------------------------------- #
+#
+# THROUGHPUT
+
+def throughput(repeat=1, outdir="."):
+    """write the current mesh as ASCII .msh, binary .msh and .k, `repeat`
+    times each, and return the fastest run of each with its rate"""
+    from meshtools.report import Report
+
+    writers = [
+        ("msh ascii", "bench-ascii.msh", 0),
+        ("msh binary", "bench-binary.msh", 1),
+        ("k", "bench.k", None),
+    ]
+    count = sum(int(gmsh.option.getNumber(_COUNTS[t])) for t in (_SOLIDS if _element_dim() == 3 else _SHELLS))
+    run_report = Report("lsdyna-bench")
+    binary = gmsh.option.getNumber("Mesh.Binary")
+    try:
+        for name, filename, mode in writers:
+            path = os.path.join(outdir, filename)
+            for _ in range(repeat):
+                if mode is not None:
+                    gmsh.option.setNumber("Mesh.Binary", mode)
+                with run_report.stage(name, file=path):
+                    save(path)
+    finally:
+        gmsh.option.setNumber("Mesh.Binary", binary)
+    run_report.finish(os.devnull, quiet=True)
+
+    results = []
+    for name, filename, _ in writers:
+        path = os.path.join(outdir, filename)
+        row = min((row for row in run_report.stages if row["stage"] == name), key=lambda row: row["wall_s"])
+        mb = os.path.getsize(path) / 2**20
+        wall = max(row["wall_s"], 1e-3)
+        results.append({"format": name, "wall_s": row["wall_s"], "file_mb": round(mb, 1),
+                        "mb_s": round(mb / wall, 1), "elements_s": round(count / wall),
+                        "peak_rss_mb": row["peak_rss_mb"]})
+        os.remove(path)
+    return results
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.lsdyna",
+                                     description="LS-DYNA keyword export of gmsh meshes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    convert_parser = commands.add_parser("convert", help="write a mesh file as a keyword file")
+    convert_parser.add_argument("mesh")
+    convert_parser.add_argument("-o", "--out", help="keyword file (default: the mesh with .k)")
+    convert_parser.add_argument("--chunk", type=int, default=CHUNK, help="nodes / elements per chunk")
+    bench_parser = commands.add_parser("bench", help="time .msh against .k writes of a mesh file")
+    bench_parser.add_argument("mesh")
+    bench_parser.add_argument("-r", "--repeat", type=int, default=3, help="writes per format, the fastest counts")
+    bench_parser.add_argument("-d", "--dir", default=".", help="where the files are written (and removed)")
+    args = parser.parse_args(argv)
+
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    try:
+        gmsh.open(args.mesh)
+        if args.command == "convert":
+            out = args.out or os.path.splitext(args.mesh)[0] + ".k"
+            nodes, elements = write(out, args.chunk)
+            print("%d nodes, %d elements written to %s" % (nodes, elements, out))
+        else:
+            print("%-12s %10s %10s %10s %14s %10s" % ("format", "wall s", "file MB", "MB/s", "elements/s", "peak MB"))
+            for row in throughput(args.repeat, args.dir):
+                print("%(format)-12s %(wall_s)10.2f %(file_mb)10.1f %(mb_s)10.1f %(elements_s)14d "
+                      "%(peak_rss_mb)10.1f" % row)
+    finally:
+        gmsh.finalize()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
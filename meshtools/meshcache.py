@@ -0,0 +1,246 @@
+# ----------------------------------------------------------------------------- #
+#  content-addressed cache of finished meshes, bounded by size on disk
+# ----------------------------------------------------------------------------- #
+#
+# the sweeps and the bench rerun the same targets with the same sizes over and
+# over, and every run meshes, optimises and refines from scratch. the finished
+# mesh is kept instead, as binary .msh, under a hash of everything that went
+# into it:
+#
+#   tags = targets.build("plate", params, report)
+#   key = meshcache.key("plate-ustruct-hex", params)
+#   if not meshcache.load(key, tags, report):
+#       targets.generate(params, report, tags)
+#       meshcache.store(key, tags, report)
+#
+# the key is the name and parameters, the geometry and field definitions of
+# the current model (gmsh's .geo_unrolled of it, with the OCC shapes it
+# merges hashed by content), every option set through meshtools.options, and
+# the gmsh version. so it has to be taken after the geometry and fields are
+# built and the options set, and anything else that changes the mesh (e.g. a
+# size callback or the optimise passes) goes in the parameters.
+#
+# a hit replaces the model by the stored mesh, with its entities and physical
+# groups, and tags["line"] becomes the end points of line l (see verify.py).
+# like pipeline.py checkpoints, an entry is only used if its hash and mesh
+# counts check out.
+#
+# entries live in ~/.cache/meshtools/meshes (or $MESHTOOLS_CACHE). loading an
+# entry marks it as used, and after each store the least recently used ones
+# are removed until the cache is under MAX_MB ($MESHTOOLS_MESH_CACHE_MB):
+#
+#   python -m meshtools.meshcache list
+#   python -m meshtools.meshcache show <key>
+#   python -m meshtools.meshcache prune --max-mb 500 --older-than 30
+#   python -m meshtools.meshcache clear
+
+import argparse
+import datetime
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+
+import gmsh
+
+from meshtools import cache, options, report, stats
+
+model = gmsh.model
+
+# size of the cache on disk, entries beyond it are removed oldest use first
+MAX_MB = float(os.environ.get("MESHTOOLS_MESH_CACHE_MB", 2048))
+
+# ----------------------------------------------------------------------------- #
+#
+# KEYS
+
+def describe():
+    """the geometry and field definitions of the current model as text"""
+    folder = tempfile.mkdtemp(prefix="meshcache")
+    try:
+        path = os.path.join(folder, "model.geo_unrolled")
+        gmsh.write(path)
+        with open(path) as f:
+            text = f.read()
+
+        # OCC shapes are written next to it and merged, by name
+        def merged(match):
+            name = os.path.join(folder, match.group(1))
+            return 'Merge "%s";' % (cache.file_hash(name) if os.path.exists(name) else match.group(1))
+
+        return re.sub(r'Merge "([^"]*)";', merged, text)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+def key(name, params=None):
+    """cache key of the mesh the current model, options and params give"""
+    return cache.key(name, params, describe(), options.snapshot(), gmsh.__version__)
+
+# ----------------------------------------------------------------------------- #
+#
+# ENTRIES
+
+def _path(key):
+    return os.path.join(cache.directory("meshes"), key + ".msh")
+
+
+def entries():
+    """(key, bytes, last used, record) of every entry, least recently used first"""
+    folder = cache.directory("meshes")
+    rows = []
+    for name in os.listdir(folder):
+        if not name.endswith(".msh") or ".tmp" in name:
+            continue
+        path = os.path.join(folder, name)
+        try:
+            size = os.path.getsize(path)
+            used = os.path.getmtime(path)
+            with open(path + ".json") as f:
+                record = json.load(f)
+            size += os.path.getsize(path + ".json")
+        except (OSError, ValueError):
+            # a mesh without its record (yet): counted, removed first
+            record = None
+            if not os.path.exists(path):
+                continue
+            size, used = os.path.getsize(path), 0
+        rows.append((name[:-len(".msh")], size, used, record))
+    return sorted(rows, key=lambda row: row[2])
+
+
+def remove(key):
+    for path in (_path(key), _path(key) + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def prune(max_mb=None, older_than=None):
+    """remove the least recently used entries until the cache is under max_mb,
+    and those not used for `older_than` days; returns the keys removed"""
+    max_mb = MAX_MB if max_mb is None else max_mb
+    rows = entries()
+    total = sum(size for _, size, _, _ in rows)
+    cutoff = time.time() - older_than * 86400 if older_than is not None else None
+    removed = []
+    for entry, size, used, _ in rows:
+        if total <= max_mb * 2**20 and (cutoff is None or used >= cutoff):
+            continue
+        remove(entry)
+        total -= size
+        removed.append(entry)
+    return removed
+
+# ----------------------------------------------------------------------------- #
+#
+# LOAD AND STORE
+
+def load(key, tags=None, run_report=None):
+    """replace the model by the cached mesh of `key`, False on a miss"""
+    path = _path(key)
+    if not (os.path.exists(path) and os.path.exists(path + ".json")):
+        if run_report is not None:
+            run_report.info["mesh_cache"] = "miss"
+        return False
+    with report.stage(run_report, "mesh cache", key=key):
+        with open(path + ".json") as f:
+            record = json.load(f)
+        # check before replacing the model, as pipeline.py does before merging
+        hit = record.get("hash") == cache.file_hash(path)
+        if hit:
+            name = model.getCurrent()
+            model.remove()
+            model.add(name)
+            gmsh.merge(path)
+            if stats.mesh_counts() != record["counts"]:
+                # the geometry is gone by now, so this can't fall back to meshing
+                remove(key)
+                raise RuntimeError("mesh cache entry %s doesn't match its record and was "
+                                   "removed, run again" % key)
+        else:
+            remove(key)
+    if run_report is not None:
+        run_report.info["mesh_cache"] = "hit" if hit else "miss"
+    if not hit:
+        return False
+    # most recently used, for prune()
+    os.utime(path)
+    if tags is not None and record.get("line"):
+        tags["line"] = tuple(tuple(end) for end in record["line"])
+    return True
+
+
+def store(key, tags=None, run_report=None, name=None, params=None):
+    """write the current mesh as the entry of `key`, then prune the cache"""
+    path = _path(key)
+    line = None
+    if tags is not None and "line" in tags:
+        line = tags["line"]
+        if not isinstance(line, (list, tuple)):
+            box = model.getBoundingBox(1, line)
+            line = (tuple(box[:3]), tuple(box[3:]))
+    with report.stage(run_report, "mesh cache store", key=key):
+        binary = gmsh.option.getNumber("Mesh.Binary")
+        gmsh.option.setNumber("Mesh.Binary", 1)
+        try:
+            with cache.atomic(path) as tmp:
+                gmsh.write(tmp)
+        finally:
+            gmsh.option.setNumber("Mesh.Binary", binary)
+        record = {"hash": cache.file_hash(path), "counts": stats.mesh_counts(), "line": line,
+                  "name": name or (run_report.name if run_report is not None else None),
+                  "params": params, "gmsh": gmsh.__version__,
+                  "created": datetime.datetime.now().isoformat(timespec="seconds")}
+        with cache.atomic(path + ".json") as tmp:
+            with open(tmp, "w") as f:
+                json.dump(record, f, default=str)
+        prune()
+    return path
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.meshcache",
+                                     description="inspect and prune the cache of finished meshes")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="entries, least recently used first")
+    show_parser = commands.add_parser("show", help="the record of an entry")
+    show_parser.add_argument("key")
+    prune_parser = commands.add_parser("prune", help="remove the least recently used entries")
+    prune_parser.add_argument("--max-mb", type=float, default=MAX_MB, help="size to prune the cache to")
+    prune_parser.add_argument("--older-than", type=float, help="also remove entries unused for this many days")
+    commands.add_parser("clear", help="remove every entry")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        rows = entries()
+        print("%-20s %10s %10s %20s  %s" % ("key", "MB", "elements", "last used", "name"))
+        for entry, size, used, record in rows:
+            record = record or {}
+            elements = record.get("counts", {}).get("elements", 0)
+            print("%-20s %10.1f %10d %20s  %s" % (
+                entry, size / 2**20, elements,
+                datetime.datetime.fromtimestamp(used).isoformat(sep=" ", timespec="seconds"),
+                record.get("name") or "-"))
+        print("%d entries, %.1f MB of %.0f MB in %s" % (
+            len(rows), sum(row[1] for row in rows) / 2**20, MAX_MB, cache.directory("meshes")))
+    elif args.command == "show":
+        path = _path(args.key)
+        if not os.path.exists(path + ".json"):
+            print("no entry %s" % args.key)
+            return 1
+        with open(path + ".json") as f:
+            print(json.dumps(json.load(f), indent=1))
+    else:
+        removed = prune(0) if args.command == "clear" else prune(args.max_mb, args.older_than)
+        print("removed %d entries" % len(removed))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
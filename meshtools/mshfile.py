@@ -0,0 +1,317 @@
+# ----------------------------------------------------------------------------- #
+#  memory-mapped reader of binary MSH 4.1 files, without gmsh
+# ----------------------------------------------------------------------------- #
+#
+# looking at a finished ustruct-refined.msh used to mean gmsh.open, which
+# builds gmsh's whole model even to count the elements. a binary MSH 4.1
+# file is a few headers around large arrays, so instead the file is mapped
+# into memory, one pass over the sections finds the $Entities, $Nodes and
+# $Elements headers, and every node and element block is a numpy view of
+# the mapped file, nothing is read until it's used:
+#
+#   with mshfile.MshFile("ustruct-refined.msh") as f:
+#       f.counts()                          # from the headers alone
+#       for block in f.element_blocks:      # dim, entity, type, tags, nodes
+#           block.nodes                     # (n, nodes per element) uint64 view
+#       tags, xyz = f.nodes()               # all the nodes, one copy
+#       m = f.arrays()                      # arrays.MeshArrays, as arrays.extract()
+#
+#   python -m meshtools.mshfile info ustruct-refined.msh
+#   python -m meshtools.mshfile dump ustruct-refined.msh        # .npy folder, see arrays.py
+#
+# only binary MSH 4.1 is read (gmsh.option Mesh.Binary 1, as the mesh cache
+# and checkpoints write); for ASCII files, or partitioned ones, use gmsh.
+# the views keep the file mapped, so close() (or the with block) only
+# unmaps it once they are gone.
+
+import argparse
+import mmap
+import sys
+import time
+
+import numpy as np
+
+from meshtools import arrays
+
+# nodes per element of the gmsh element types
+NODES = {1: 2, 2: 3, 3: 4, 4: 4, 5: 8, 6: 6, 7: 5, 8: 3, 9: 6, 10: 9, 11: 10, 12: 27, 13: 18,
+         14: 14, 15: 1, 16: 8, 17: 20, 18: 15, 19: 13, 20: 9, 21: 10, 26: 4, 27: 5, 28: 6,
+         29: 20, 30: 35, 31: 56, 92: 64, 93: 125}
+
+
+class NodeBlock:
+    """the nodes of one entity: tags (n,) and coordinates (n, 3) as views"""
+
+    def __init__(self, dim, entity, tags, coords):
+        self.dim = dim
+        self.entity = entity
+        self.tags = tags
+        self.coords = coords
+
+
+class ElementBlock:
+    """the elements of one type in one entity: tags (n,) and node tags
+    (n, nodes per element) as views"""
+
+    def __init__(self, dim, entity, element_type, tags, nodes):
+        self.dim = dim
+        self.entity = entity
+        self.type = element_type
+        self.tags = tags
+        self.nodes = nodes
+
+
+class MshFile:
+    """a binary MSH 4.1 file mapped into memory, with its node and element
+    blocks as numpy views"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.version = None
+        # {(dim, tag): [physical group tags]}, and {(dim, tag): name} of the groups
+        self.physicals = {}
+        self.physical_names = {}
+        self.node_blocks = []
+        self.element_blocks = []
+        self._scan()
+
+    def close(self):
+        self.node_blocks, self.element_blocks = [], []
+        try:
+            self._map.close()
+        except BufferError:
+            # a view of it is still in use, it's unmapped with the last one
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ---- scan ---- #
+
+    def _line(self, offset):
+        """the text line at offset and the offset after it"""
+        end = self._map.find(b"\n", offset)
+        if end < 0:
+            end = len(self._map)
+        return self._map[offset:end].decode("ascii", "replace").strip(), end + 1
+
+    def _array(self, dtype, count, offset):
+        """count values of dtype at offset as a view, and the offset after them"""
+        dtype = np.dtype(dtype).newbyteorder(self._order)
+        view = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+        return view, offset + view.nbytes
+
+    def _value(self, dtype, offset):
+        view, offset = self._array(dtype, 1, offset)
+        return int(view[0]), offset
+
+    def _scan(self):
+        offset = 0
+        size = len(self._map)
+        while offset < size:
+            name, offset = self._line(offset)
+            if not name:
+                continue
+            if not name.startswith("$"):
+                raise ValueError("%s: expected a section at byte %d, got %r" % (self.path, offset, name[:40]))
+            section = name[1:]
+            if self.version is None and section != "MeshFormat":
+                raise ValueError("%s doesn't start with $MeshFormat" % self.path)
+            if section == "MeshFormat":
+                offset = self._format(offset)
+            elif section == "Entities":
+                offset = self._entities(offset)
+            elif section == "Nodes":
+                offset = self._nodes(offset)
+            elif section == "Elements":
+                offset = self._elements(offset)
+            elif section == "PhysicalNames":
+                offset = self._physical_names(offset)
+            elif section == "PartitionedEntities":
+                raise ValueError("%s is partitioned, read it with gmsh" % self.path)
+            else:
+                # anything else ($Periodic, $NodeData, ...) is skipped
+                end = self._map.find(b"$End" + section.encode(), offset)
+                if end < 0:
+                    raise ValueError("%s: no $End%s" % (self.path, section))
+                offset = end
+            # past the newline ending the binary data and the $End line
+            end, offset = self._line(offset)
+            if not end:
+                end, offset = self._line(offset)
+            if end != "$End" + section:
+                raise ValueError("%s: expected $End%s, got %r" % (self.path, section, end[:40]))
+
+    def _format(self, offset):
+        text, offset = self._line(offset)
+        version, binary, size = text.split()
+        if not version.startswith("4.1"):
+            raise ValueError("%s is MSH %s, only 4.1 is read" % (self.path, version))
+        if binary != "1":
+            raise ValueError("%s is ASCII, write it with Mesh.Binary 1 or read it with gmsh" % self.path)
+        self.version = version
+        self._size = {4: np.uint32, 8: np.uint64}[int(size)]
+        # the int 1, which gives the byte order of the file
+        self._order = "<" if self._map[offset:offset + 4] == b"\x01\x00\x00\x00" else ">"
+        return offset + 4
+
+    def _entities(self, offset):
+        counts, offset = self._array(self._size, 4, offset)
+        for dim, count in enumerate(counts.tolist()):
+            for _ in range(count):
+                tag, offset = self._value(np.int32, offset)
+                # a point has its coordinates, the others their bounding box
+                offset += 8 * (3 if dim == 0 else 6)
+                n, offset = self._value(self._size, offset)
+                groups, offset = self._array(np.int32, n, offset)
+                if n:
+                    self.physicals[dim, tag] = groups.tolist()
+                if dim:
+                    n, offset = self._value(self._size, offset)
+                    offset += 4 * n
+        return offset
+
+    def _nodes(self, offset):
+        header, offset = self._array(self._size, 4, offset)
+        for _ in range(int(header[0])):
+            (dim, entity, parametric), offset = self._array(np.int32, 3, offset)
+            n, offset = self._value(self._size, offset)
+            tags, offset = self._array(self._size, n, offset)
+            # x, y, z and the parametric coordinates (dim of them) of each node
+            width = 3 + (int(dim) if parametric else 0)
+            coords, offset = self._array(np.float64, n * width, offset)
+            self.node_blocks.append(NodeBlock(int(dim), int(entity), tags, coords.reshape(n, width)[:, :3]))
+        return offset
+
+    def _elements(self, offset):
+        header, offset = self._array(self._size, 4, offset)
+        for _ in range(int(header[0])):
+            (dim, entity, element_type), offset = self._array(np.int32, 3, offset)
+            n, offset = self._value(self._size, offset)
+            if int(element_type) not in NODES:
+                raise ValueError("%s: unknown element type %d" % (self.path, element_type))
+            width = 1 + NODES[int(element_type)]
+            data, offset = self._array(self._size, n * width, offset)
+            data = data.reshape(n, width)
+            self.element_blocks.append(ElementBlock(int(dim), int(entity), int(element_type),
+                                                    data[:, 0], data[:, 1:]))
+        return offset
+
+    def _physical_names(self, offset):
+        count, offset = self._line(offset)
+        for _ in range(int(count)):
+            text, offset = self._line(offset)
+            dim, tag, name = text.split(None, 2)
+            self.physical_names[int(dim), int(tag)] = name.strip('"')
+        return offset
+
+    # ---- contents ---- #
+
+    def counts(self):
+        """nodes, and elements by type name, from the block headers"""
+        counts = {"nodes": sum(len(block.tags) for block in self.node_blocks)}
+        for block in self.element_blocks:
+            name = arrays.NAMES.get(block.type, "type%d" % block.type)
+            counts[name] = counts.get(name, 0) + len(block.tags)
+        return counts
+
+    def dim(self):
+        """the highest dimension of the elements"""
+        return max((block.dim for block in self.element_blocks), default=0)
+
+    def nodes(self):
+        """(tags, (n, 3) coordinates) of all the nodes, in file order"""
+        if len(self.node_blocks) == 1:
+            return self.node_blocks[0].tags, self.node_blocks[0].coords
+        tags = np.concatenate([block.tags for block in self.node_blocks])
+        coords = np.concatenate([block.coords for block in self.node_blocks])
+        return tags, coords
+
+    def arrays(self, dim=None, float32=False):
+        """the nodes and the elements of dimension `dim` (default: the
+        highest) as an arrays.MeshArrays with 0-based rows, as
+        arrays.extract() gives them from gmsh"""
+        dim = self.dim() if dim is None else dim
+        node_tags, coords = self.nodes()
+        index = arrays.index_dtype(len(node_tags))
+        rows = np.zeros(int(node_tags.max()) + 1 if len(node_tags) else 1, dtype=index)
+        rows[node_tags] = np.arange(len(node_tags), dtype=index)
+        nodes = coords.astype(np.float32) if float32 else np.ascontiguousarray(coords)
+
+        blocks = {}
+        for block in self.element_blocks:
+            if block.dim == dim:
+                blocks.setdefault(block.type, []).append(block)
+        largest = max((int(block.tags.max()) for parts in blocks.values() for block in parts if len(block.tags)),
+                      default=0)
+        elements, element_tags, entities = {}, {}, {}
+        for element_type, parts in sorted(blocks.items()):
+            name = arrays.NAMES.get(element_type, "type%d" % element_type)
+            total = sum(len(block.tags) for block in parts)
+            connectivity = np.empty((total, NODES[element_type]), dtype=index)
+            tags = np.empty(total, dtype=arrays.tag_dtype(largest))
+            entity = np.empty(total, dtype=np.int32)
+            start = 0
+            for block in parts:
+                end = start + len(block.tags)
+                np.take(rows, block.nodes, out=connectivity[start:end])
+                tags[start:end] = block.tags
+                entity[start:end] = block.entity
+                start = end
+            elements[name], element_tags[name], entities[name] = connectivity, tags, entity
+        physicals = {tag: groups for (d, tag), groups in self.physicals.items() if d == dim}
+        return arrays.MeshArrays(nodes, node_tags.astype(arrays.tag_dtype(int(node_tags.max(initial=0)))),
+                                 elements, element_tags, entities, dim, physicals)
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.mshfile",
+                                     description="binary MSH 4.1 files without gmsh")
+    commands = parser.add_subparsers(dest="command", required=True)
+    info_parser = commands.add_parser("info", help="counts, blocks and bounding box of a mesh file")
+    info_parser.add_argument("mesh")
+    info_parser.add_argument("--blocks", action="store_true", help="list every node and element block")
+    dump_parser = commands.add_parser("dump", help="write a mesh file as .npy arrays (arrays.py)")
+    dump_parser.add_argument("mesh")
+    dump_parser.add_argument("-o", "--out", help="folder (default: the mesh without its extension)")
+    dump_parser.add_argument("--float32", action="store_true", help="float32 coordinates")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    with MshFile(args.mesh) as f:
+        if args.command == "info":
+            counts = f.counts()
+            _, coords = f.nodes()
+            low, high = coords.min(axis=0), coords.max(axis=0)
+            print("MSH %s, %d node blocks, %d element blocks" % (
+                f.version, len(f.node_blocks), len(f.element_blocks)))
+            for name, count in counts.items():
+                print("  %-12s %10d" % (name, count))
+            print("  bounding box  %s - %s" % (" ".join("%g" % v for v in low), " ".join("%g" % v for v in high)))
+            if args.blocks:
+                for block in f.element_blocks:
+                    print("  %dD entity %-6d %-12s %10d" % (block.dim, block.entity,
+                                                         arrays.NAMES.get(block.type, block.type), len(block.tags)))
+            del coords
+        else:
+            import os
+
+            m = f.arrays(float32=args.float32)
+            folder = arrays.dump(m, args.out or os.path.splitext(args.mesh)[0])
+            print("%r written to %s" % (m, folder))
+            del m
+    print("%.3f s" % (time.perf_counter() - start))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
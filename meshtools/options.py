@@ -0,0 +1,50 @@
+# ----------------------------------------------------------------------------- #
+#  gmsh.option that remembers what was set
+# ----------------------------------------------------------------------------- #
+#
+# checkpoints and caches need to know every option a script changed. use
+#
+#   from meshtools.options import option
+#
+# instead of `option = gmsh.option`; it behaves the same but records the name
+# of every option set through it, and snapshot() returns their current values.
+
+import gmsh
+
+
+class Option:
+    """gmsh.option proxy that records the options set through it"""
+
+    def __init__(self):
+        self.names = {}
+
+    def __getattr__(self, name):
+        return getattr(gmsh.option, name)
+
+    def setNumber(self, name, value):
+        gmsh.option.setNumber(name, value)
+        self.names[name] = "number"
+
+    def setString(self, name, value):
+        gmsh.option.setString(name, value)
+        self.names[name] = "string"
+
+    def snapshot(self):
+        """{name: current value} of every option set so far"""
+        values = {}
+        for name, kind in sorted(self.names.items()):
+            if kind == "number":
+                values[name] = gmsh.option.getNumber(name)
+            else:
+                values[name] = gmsh.option.getString(name)
+        return values
+
+    def clear(self):
+        self.names.clear()
+
+
+option = Option()
+
+
+def snapshot():
+    return option.snapshot()
@@ -0,0 +1,236 @@
+# ----------------------------------------------------------------------------- #
+#  meshing as resumable stages with a checkpoint after each one
+# ----------------------------------------------------------------------------- #
+#
+# bullet-core-hex.py spends most of its time in the optimise passes after the
+# mesh is generated (Laplace2D alone is ~30 mins). if a run dies half way, or
+# only the last passes change, everything used to start again from the STEP
+# file. instead the script lists its stages
+#
+#   pipeline = Pipeline("bullet-core-hex", geometry=cache.file_hash(step_file_path))
+#   pipeline.generate(3)
+#   pipeline.optimize("Relocate3D")
+#   pipeline.optimize("Laplace2D", niter=1)
+#   pipeline.refine()
+#   pipeline.write(writeFile)
+#   pipeline.run()
+#
+# and after each stage the mesh is saved as a binary .msh checkpoint. the
+# checkpoint of a stage is named by a hash of everything before it: the
+# pipeline name and key parts (e.g. the geometry hash and mesh sizes), every
+# option set through meshtools.options when run() is called, the gmsh
+# version, and the name and settings of this stage and all earlier ones. so
+# changing an option restarts from scratch, while changing e.g. the last
+# optimise pass resumes from the checkpoint before it.
+#
+# run() expects the geometry to be loaded (checkpoints only hold the mesh,
+# which is merged back onto it) and resumes after the last valid checkpoint.
+# size fields and callbacks are not options, so anything that sets them
+# should go in the key parts.
+#
+# checkpoints live in ~/.cache/meshtools/checkpoints/<name> (or
+# $MESHTOOLS_CACHE); delete the folder to force a full run. resuming from a
+# checkpoint marks it as used, and after each run the least recently used
+# checkpoints of all pipelines are removed until they are under MAX_MB
+# ($MESHTOOLS_CHECKPOINT_MB), as for the mesh cache (meshcache.py). the last
+# checkpoint of the run just finished is always kept, the earlier stages of
+# a run are the first to go once it's over the limit.
+
+import json
+import os
+import time
+
+import gmsh
+
+from meshtools import cache, lsdyna, options, report, stats
+
+mesh = gmsh.model.mesh
+
+# size of all checkpoints on disk, those beyond it are removed oldest use first
+MAX_MB = float(os.environ.get("MESHTOOLS_CHECKPOINT_MB", 4096))
+
+
+class Stage:
+    """one step of a pipeline, func() does the work"""
+
+    def __init__(self, name, func, settings=None, checkpoint=True, output=None):
+        self.name = name
+        self.func = func
+        self.settings = settings or {}
+        self.checkpoint = checkpoint
+        # file the stage writes, if any
+        self.output = output
+
+
+class Pipeline:
+    """ordered meshing stages with a checkpoint after each stage
+
+    `key_parts` are json-able values that identify the input (geometry,
+    sizes, fields, ...) on top of the options.
+    """
+
+    def __init__(self, name, **key_parts):
+        self.name = name
+        self.key_parts = key_parts
+        self.stages = []
+        # (stage name, "ran"/"resumed", seconds) of the last run()
+        self.log = []
+
+    # ---- stages ---- #
+
+    def add(self, name, func, checkpoint=True, output=None, **settings):
+        """add a stage calling func(**settings)"""
+        self.stages.append(Stage(name, lambda: func(**settings), settings, checkpoint, output))
+        return self
+
+    def generate(self, dim=3):
+        return self.add("generate", mesh.generate, dim=dim)
+
+    def optimize(self, method, niter=1, force=False):
+        return self.add("optimize " + method, mesh.optimize,
+                        method=method, niter=niter, force=force)
+
+    def refine(self):
+        return self.add("refine", mesh.refine)
+
+    def write(self, path):
+        # the written file is the result, a checkpoint of it would be a copy
+        # .k / .key / .dyn as an LS-DYNA keyword file (lsdyna.py)
+        return self.add("write", lsdyna.save, checkpoint=False, output=path, path=path)
+
+    # ---- checkpoints ---- #
+
+    def keys(self):
+        """checkpoint key of every stage"""
+        key = cache.key(self.name, self.key_parts, options.snapshot(), gmsh.__version__)
+        keys = []
+        for stage in self.stages:
+            key = cache.key(key, stage.name, stage.settings)
+            keys.append(key)
+        return keys
+
+    def _path(self, key):
+        return os.path.join(cache.directory("checkpoints", self.name), key + ".msh")
+
+    def _save(self, key):
+        path = self._path(key)
+        binary = gmsh.option.getNumber("Mesh.Binary")
+        gmsh.option.setNumber("Mesh.Binary", 1)
+        try:
+            with cache.atomic(path) as tmp:
+                gmsh.write(tmp)
+        finally:
+            gmsh.option.setNumber("Mesh.Binary", binary)
+        # the hash and counts are written last and checked on load, so a
+        # checkpoint without them, or a damaged one, is never used
+        with cache.atomic(path + ".json") as tmp:
+            with open(tmp, "w") as f:
+                json.dump({"hash": cache.file_hash(path), "counts": stats.mesh_counts()}, f)
+
+    def _exists(self, key):
+        path = self._path(key)
+        return os.path.exists(path) and os.path.exists(path + ".json")
+
+    def _load(self, key):
+        """merge a checkpoint onto the geometry, False if it isn't valid"""
+        path = self._path(key)
+        if not self._exists(key):
+            return False
+        with open(path + ".json") as f:
+            record = json.load(f)
+        # check before merging: gmsh doesn't always recover from reading half
+        # a file, even after the mesh is cleared
+        if record.get("hash") != cache.file_hash(path):
+            return False
+        gmsh.merge(path)
+        if stats.mesh_counts() != record["counts"]:
+            mesh.clear()
+            return False
+        # most recently used, for prune()
+        os.utime(path)
+        return True
+
+    # ---- run ---- #
+
+    def run(self, resume=True, run_report=None):
+        """run the stages, starting after the last valid checkpoint
+
+        with a report.Report every stage is recorded, and loading the
+        checkpoint as "resume <stage>"
+        """
+        keys = self.keys()
+        self.log = []
+
+        start = 0
+        if resume:
+            for i in reversed(range(len(self.stages))):
+                if not (self.stages[i].checkpoint and self._exists(keys[i])):
+                    continue
+                start_time = time.perf_counter()
+                with report.stage(run_report, "resume " + self.stages[i].name):
+                    loaded = self._load(keys[i])
+                if loaded:
+                    start = i + 1
+                    self.log.append((self.stages[i].name, "resumed",
+                                     time.perf_counter() - start_time))
+                    print("resumed after stage '%s'" % self.stages[i].name)
+                    break
+
+        for stage, key in zip(self.stages[start:], keys[start:]):
+            start_time = time.perf_counter()
+            with report.stage(run_report, stage.name, **stage.settings):
+                stage.func()
+            if stage.checkpoint:
+                with report.stage(run_report, "checkpoint " + stage.name):
+                    self._save(key)
+            if stage.output and run_report is not None:
+                run_report.outputs.append(stage.output)
+            self.log.append((stage.name, "ran", time.perf_counter() - start_time))
+
+        saved = [key for stage, key in zip(self.stages, keys) if stage.checkpoint]
+        if saved:
+            prune(keep=[self._path(saved[-1])])
+        return self.log
+
+
+def checkpoints():
+    """(path, bytes, last used) of the checkpoints of every pipeline, least
+    recently used first"""
+    root = cache.directory("checkpoints")
+    rows = []
+    for folder in os.listdir(root):
+        folder = os.path.join(root, folder)
+        if not os.path.isdir(folder):
+            continue
+        for name in os.listdir(folder):
+            if not name.endswith(".msh") or ".tmp" in name:
+                continue
+            path = os.path.join(folder, name)
+            try:
+                size, used = os.path.getsize(path), os.path.getmtime(path)
+            except OSError:
+                continue
+            if os.path.exists(path + ".json"):
+                size += os.path.getsize(path + ".json")
+            rows.append((path, size, used))
+    return sorted(rows, key=lambda row: row[2])
+
+
+def prune(max_mb=None, keep=()):
+    """remove the least recently used checkpoints until they are under
+    max_mb, but not those in `keep`; returns the paths removed"""
+    max_mb = MAX_MB if max_mb is None else max_mb
+    rows = checkpoints()
+    total = sum(size for _, size, _ in rows)
+    removed = []
+    for path, size, _ in rows:
+        if total <= max_mb * 2**20:
+            break
+        if path in keep:
+            continue
+        for name in (path, path + ".json"):
+            if os.path.exists(name):
+                os.remove(name)
+        total -= size
+        removed.append(path)
+    return removed
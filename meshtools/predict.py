@@ -0,0 +1,300 @@
+# ----------------------------------------------------------------------------- #
+#  element count, memory and run time of a target before it is meshed
+# ----------------------------------------------------------------------------- #
+#
+# a production run of plate-ustruct-hex.py takes a quarter of an hour, and
+# whether it gives 700k or 7M elements only shows at the end. the scripts now
+# call, before generate:
+#
+#   predict.guard("plate-ustruct-hex", "plate", params, report,
+#                 dry_run=args.number("dry_run", 0), max_memory_mb=..., max_wall_s=...)
+#
+# which prints the predicted elements, nodes, peak memory and wall time, stops
+# there with -setnumber dry_run 1, and refuses to start a run predicted to
+# need more than -setnumber max_memory_mb (default: the memory available now)
+# or -setnumber max_wall_s. from the repository root:
+#
+#   python -m meshtools.predict plate -s lc=0.05
+#   python -m meshtools.predict cylinder -s lc=0.1 -s refine_within=0.01 --max-wall-s 600
+#
+# the element count is the size field integrated over the target: the field
+# chain only depends on the distance to line l, so the volume is a radial
+# profile of rings, each with its area, and the tetrahedra generate(3) makes
+# in a ring are its area / size^2 times the layers through the thickness
+# (at least MIN_LAYERS). the subdivision into hexahedra (SubdivisionAlgorithm
+# 2, 4 per tetrahedron) and every refine (8 per element) multiply that; with
+# refine_within only the rings within that distance are refined.
+#
+# memory and time are linear in the no. of elements, fitted to the history of
+# finished runs of the script (report.py records every run), or to the
+# reports given with -r. only the runs of the same mode (parts, refine_within
+# and symmetry, which change how the mesh is made) are fitted, and for the
+# time only those on the same no. of threads. without two runs of different
+# size among them the fits in MODELS, measured on a single core, are used. the runs that recorded
+# a prediction also correct the element count by their measured / predicted.
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+from meshtools import background, report, targets
+
+# edge of the tetrahedra generate(3) makes / background size
+FOLLOW = 0.84
+
+# tetrahedra per (area / edge^2) and layer through the thickness, and the
+# fewest layers of tetrahedra in a thin target however coarse its surfaces
+TETRAHEDRA = {"plate": 2.8, "cylinder": 2.66}
+MIN_LAYERS = 2
+
+# nodes per element of the final mesh
+NODES = {"hexahedra": 1.12, "tetrahedra": 0.2}
+
+# (MB, MB per element) and (s, s per element) of the scripts on one core
+MODELS = {
+    "plate-ustruct-hex": {"peak_rss_mb": (84, 4.3e-4), "wall_s": (0.0, 4.7e-5)},
+    "ustruc-cyl": {"peak_rss_mb": (84, 4.5e-4), "wall_s": (0.5, 2.3e-5)},
+}
+
+# the most recent runs of the history that are fitted
+HISTORY = 50
+
+# rings of the radial profile
+RINGS = 2000
+
+# ----------------------------------------------------------------------------- #
+#
+# ELEMENT COUNT
+
+def profile(kind, p, rings=RINGS):
+    """radii of rings around line l and the area of the target in each ring"""
+    lo, hi = background.bounds(kind, p)
+    xc, yc = (0, 0) if kind == "cylinder" else (p["l"]/2, p["l"]/2)
+    # the area at each distance from a fine grid over the top face
+    n = 1000
+    x, y = np.meshgrid(np.linspace(lo[0], hi[0], n), np.linspace(lo[1], hi[1], n), indexing="ij")
+    r = np.hypot(x - xc, y - yc).ravel()
+    if kind == "cylinder":
+        r = r[r <= p["rcyl"]]
+    area = (hi[0] - lo[0]) * (hi[1] - lo[1]) * len(r) / n**2
+    counts, edges = np.histogram(r, bins=rings, range=(0, r.max()))
+    return (edges[:-1] + edges[1:]) / 2, area * counts / counts.sum()
+
+
+def field(p, radii):
+    """background size at the radii, within MeshSizeMin / MeshSizeMax"""
+    zeros = np.zeros_like(radii)
+    return np.clip(background.size(p, (0, 0), radii, zeros, zeros), p["lcmin"], p["lcmax"])
+
+
+def subdivision(options, refines=1):
+    """(elements, edge length) of the final mesh per tetrahedron generated,
+    for the subdivision of generate(3) and `refines` refines after it"""
+    count, edge = 1, 1.0
+    if options.get("Mesh.SubdivisionAlgorithm") == 2:
+        count, edge = 4, 0.5
+    return count * 8**refines, edge * 0.5**refines
+
+
+def elements(kind, p, options=None, rings=None, zone=None):
+    """estimated tetrahedra generated, final elements and nodes and, within
+    `zone` of line l, the mean final element size
+
+    `options` are the meshing options (default: targets.RECOMBINE_OPTIONS),
+    `rings` a profile() to reuse
+    """
+    options = targets.RECOMBINE_OPTIONS if options is None else options
+    radii, area = rings if rings is not None else profile(kind, p)
+    edge = FOLLOW * field(p, radii)
+    tetrahedra = TETRAHEDRA[kind] * area / edge**2 * np.maximum(MIN_LAYERS, p["h"] / edge)
+    count, scale = subdivision(options)
+    count, scale = np.full_like(radii, count), np.full_like(radii, scale)
+    if p.get("refine_within") is not None:
+        # the refine only splits the tetrahedra near line l (it comes before
+        # the subdivision into hexahedra, which doesn't change the count)
+        outside = radii > p["refine_within"]
+        count[outside], scale[outside] = subdivision(options, 0)
+    final = tetrahedra * count
+    hexahedra = options.get("Mesh.SubdivisionAlgorithm") == 2
+    result = {"tetrahedra": int(tetrahedra.sum()), "elements": int(final.sum()),
+              "nodes": int(final.sum() * NODES["hexahedra" if hexahedra else "tetrahedra"])}
+    if zone is not None:
+        inside = radii <= zone
+        result["zone_size"] = float((edge * scale * final)[inside].sum() / final[inside].sum())
+    return result
+
+# ----------------------------------------------------------------------------- #
+#
+# MEMORY AND TIME
+
+def history(name):
+    """the recorded runs of a report name, oldest first"""
+    try:
+        with open(report.history_path(name)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def from_report(path):
+    """a history row from a run report json"""
+    with open(path) as f:
+        data = json.load(f)
+    counts = max((row["counts"] for row in data["stages"]), key=lambda c: c["elements"])
+    return {"elements": counts["elements"], "nodes": counts["nodes"],
+            "peak_rss_mb": data["peak_rss_mb"], "wall_s": data["wall_s"], "threads": data["threads"]}
+
+
+def mode(p, parts=0):
+    """what, besides its size, changes how a run meshes"""
+    return {"parts": int(parts), "refine_within": p.get("refine_within") is not None,
+            "symmetry": int(p.get("symmetry", 1))}
+
+
+def fit(name, runs=None, mode=None, threads=None):
+    """linear peak memory and wall time per element, and the measured /
+    predicted element count, from the runs (default: the history of `name`)
+    of `mode`, and for the time on `threads` (None: any)
+
+    returns {"peak_rss_mb": (a, b), "wall_s": (a, b), "elements": factor, "source": text}
+    """
+    runs = history(name) if runs is None else runs
+    if mode is not None:
+        # runs recorded before the mode was are left out
+        runs = [run for run in runs if run.get("mode") == mode]
+    runs = runs[-HISTORY:]
+    model = {"elements": 1.0}
+    checked = [run["elements"] / run["estimate"] for run in runs if run.get("estimate")]
+    if checked:
+        model["elements"] = float(np.median(checked))
+    sources = []
+    for key, what in (("peak_rss_mb", "memory"), ("wall_s", "time")):
+        fitted = runs
+        if key == "wall_s" and threads is not None:
+            fitted = [run for run in runs if run.get("threads") == threads]
+        sizes = np.array([run["elements"] for run in fitted], dtype=float)
+        if len(set(sizes)) >= 2:
+            slope, intercept = np.polyfit(sizes, [run[key] for run in fitted], 1)
+            # a few runs of about the same size can fit a negative slope
+            model[key] = (max(float(intercept), 0.0), max(float(slope), 0.0))
+            sources.append("%s fitted to %d runs" % (what, len(fitted)))
+        elif name in MODELS:
+            model[key] = MODELS[name][key]
+            sources.append("%s from the defaults" % what)
+        else:
+            raise ValueError("no runs of %s to fit and no default model, give reports with -r" % name)
+    model["source"] = "%s of %s" % (", ".join(sources), name)
+    return model
+
+
+def predict(name, kind, p, options=None, runs=None, mode=None, threads=None):
+    """elements, nodes, peak memory and wall time of a run of script `name`,
+    fitted to the runs of `mode` (and `threads` for the time)"""
+    model = fit(name, runs, mode, threads)
+    result = elements(kind, p, options)
+    # the runs compare the element count with this uncorrected estimate
+    result["estimate"] = result["elements"]
+    for key in ("elements", "nodes"):
+        result[key] = int(result[key] * model["elements"])
+    for key in ("peak_rss_mb", "wall_s"):
+        a, b = model[key]
+        result[key] = round(a + b * result["elements"], 1)
+    result["source"] = model["source"]
+    return result
+
+
+def available_mb():
+    """memory available to a new run now, None if unknown"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 2**10
+    except OSError:
+        pass
+    return None
+
+
+def check(prediction, max_memory_mb=None, max_wall_s=None):
+    """the reasons the prediction is over budget, an empty list if it isn't"""
+    reasons = []
+    if max_memory_mb is None:
+        max_memory_mb = available_mb()
+    if max_memory_mb is not None and prediction["peak_rss_mb"] > max_memory_mb:
+        reasons.append("peak memory %.0f MB > %.0f MB" % (prediction["peak_rss_mb"], max_memory_mb))
+    if max_wall_s is not None and prediction["wall_s"] > max_wall_s:
+        reasons.append("wall time %.0f s > %.0f s" % (prediction["wall_s"], max_wall_s))
+    return reasons
+
+
+def line(prediction):
+    return ("predicted: %(elements)d elements, %(nodes)d nodes, %(peak_rss_mb).0f MB peak, "
+            "%(wall_s).0f s (%(source)s)" % prediction)
+
+
+def guard(name, kind, p, run_report=None, dry_run=False, max_memory_mb=None, max_wall_s=None,
+          parts=0):
+    """print the prediction of this run and exit before meshing when it is
+    over budget or a dry run; the prediction and the mode go into the run
+    report, which records them for the next fits"""
+    import gmsh
+
+    options = {key: gmsh.option.getNumber(key) for key in targets.RECOMBINE_OPTIONS}
+    run_mode = mode(p, parts)
+    prediction = predict(name, kind, p, options, mode=run_mode,
+                         threads=int(gmsh.option.getNumber("General.NumThreads")))
+    print(line(prediction))
+    if run_report is not None:
+        run_report.info["prediction"] = prediction
+        run_report.info["mode"] = run_mode
+    reasons = check(prediction, max_memory_mb, max_wall_s)
+    if reasons:
+        sys.exit("rejected before meshing: " + ", ".join(reasons))
+    if dry_run:
+        sys.exit(0)
+    return prediction
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+# the script of each target, whose history is fitted
+SCRIPTS = {"plate": "plate-ustruct-hex", "cylinder": "ustruc-cyl"}
+
+
+def main(argv=None):
+    from meshtools import sweep
+
+    parser = argparse.ArgumentParser(prog="python -m meshtools.predict",
+                                     description="elements, memory and time of a target before meshing")
+    parser.add_argument("kind", choices=sorted(targets.DEFAULTS))
+    parser.add_argument("-s", "--set", action="append", metavar="NAME=V", help="set a parameter")
+    parser.add_argument("--script", help="whose history to fit (default: the target's script)")
+    parser.add_argument("-r", "--reports", nargs="+", metavar="JSON",
+                        help="fit these run reports instead of the history")
+    parser.add_argument("--max-memory-mb", type=float, help="budget (default: the memory available now)")
+    parser.add_argument("--max-wall-s", type=float, help="budget")
+    parser.add_argument("--parts", type=int, default=0, help="sectors of a decomposed plate (default: 0)")
+    parser.add_argument("-t", "--threads", type=int, default=1, help="gmsh threads of the run (default: 1)")
+    args = parser.parse_args(argv)
+
+    p = targets.resolve(args.kind, sweep.parse_overrides(args.set))
+    if args.reports:
+        # the reports given are fitted whatever their mode and threads
+        prediction = predict(args.script or SCRIPTS[args.kind], args.kind, p,
+                             runs=[from_report(path) for path in args.reports])
+    else:
+        prediction = predict(args.script or SCRIPTS[args.kind], args.kind, p,
+                             mode=mode(p, args.parts), threads=args.threads)
+    print(line(prediction))
+    reasons = check(prediction, args.max_memory_mb, args.max_wall_s)
+    if reasons:
+        print("over budget: " + ", ".join(reasons))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
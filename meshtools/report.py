@@ -0,0 +1,259 @@
+# ----------------------------------------------------------------------------- #
+#  per-stage timing, memory and mesh counts as a JSON run report
+# ----------------------------------------------------------------------------- #
+#
+# the scripts used to print one elapsed time for the whole run. a Report
+# splits the run into named stages and records, for each, the wall and CPU
+# time, the peak and final resident memory and the node / element counts by
+# type at the end of it:
+#
+#   report = Report("plate-ustruct-hex")
+#   report.start("geometry")        # ends the previous stage, if any
+#   ...
+#   report.start("fields")
+#   ...
+#   report.generate(3)
+#   report.optimize("Laplace2D", niter=3)
+#   report.refine()
+#   report.verify(line, [0, r2, r1])       # quality and impact zone sizes
+#   report.write("ustruct-refined.msh")     # or .k, see lsdyna.py
+#   report.finish()                 # prints a table, writes the JSON
+#
+# library code uses `with report.stage(name):` instead of start(). the
+# report is written next to the last mesh written through it, as
+# <mesh>-report.json, or to <name>-report.json when nothing was written.
+#
+# finish() also appends the element and node counts, peak memory and wall
+# time of the run to a history per report name in the cache (runs/<name>.jsonl),
+# from which predict.py estimates the memory and time of the next run.
+#
+# a stage also lists the phases gmsh times itself, e.g. "meshing 1D",
+# "meshing 2D", "meshing 3D" and "optimizing mesh" within generate. those are
+# read from gmsh's log rather than by calling generate(1), generate(2),
+# generate(3) in turn, which doesn't always give the same mesh.
+#
+# CPU time is process time, so it includes gmsh's own threads. the peak
+# memory of a stage is sampled from a background thread every `interval`
+# seconds (gmsh releases the GIL while meshing); where the current memory
+# can't be read (macOS without psutil) it is the process high-water mark.
+
+import contextlib
+import datetime
+import json
+import os
+import re
+import threading
+import time
+
+import gmsh
+
+from meshtools import cache, lsdyna, stats, verify
+
+mesh = gmsh.model.mesh
+
+# e.g. "Info: Done meshing 2D (Wall 0.411965s, CPU 0.396851s)"
+_PHASE = re.compile(r"Done (.+?) \(Wall ([-+.\de]+)s, CPU ([-+.\de]+)s\)")
+
+
+class Report:
+    """named stages of a meshing run with their time, memory and mesh counts"""
+
+    def __init__(self, name, interval=0.05, **info):
+        self.name = name
+        self.info = info
+        self.stages = []
+        self.outputs = []
+        self.verification = None
+        # line l of the last verify, which .meshz files are ordered by
+        self.line = None
+        self.started = datetime.datetime.now().isoformat(timespec="seconds")
+        self._current = None
+        self._logging = False
+        self._start_wall = time.perf_counter()
+        self._start_cpu = time.process_time()
+
+        self._peak = 0.0
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._sampler = None
+        if stats.rss_mb() is not None:
+            self._sampler = threading.Thread(target=self._sample, args=(interval,), daemon=True)
+            self._sampler.start()
+
+    def _sample(self, interval):
+        while not self._done.wait(interval):
+            rss = stats.rss_mb()
+            with self._lock:
+                self._peak = max(self._peak, rss)
+
+    # ---- stages ---- #
+
+    def start(self, name, **info):
+        """end the running stage and start a new one"""
+        self.stop()
+        with self._lock:
+            self._peak = stats.rss_mb() or 0.0
+        # a fresh log for this stage's phases
+        if self._logging:
+            gmsh.logger.stop()
+        gmsh.logger.start()
+        self._logging = True
+        self._current = {"stage": name, "info": info, "status": "ok",
+                         "wall": time.perf_counter(), "cpu": time.process_time()}
+
+    def stop(self, status="ok"):
+        """end the running stage, if any"""
+        current, self._current = self._current, None
+        if current is None:
+            return
+        wall = time.perf_counter() - current["wall"]
+        cpu = time.process_time() - current["cpu"]
+        rss = stats.rss_mb()
+        if rss is None:
+            peak = stats.peak_rss_mb()
+        else:
+            with self._lock:
+                peak = max(self._peak, rss)
+        row = {"stage": current["stage"], "status": status,
+               "wall_s": round(wall, 3), "cpu_s": round(cpu, 3),
+               "peak_rss_mb": round(peak, 1),
+               "rss_mb": None if rss is None else round(rss, 1),
+               "counts": stats.mesh_counts()}
+        if current["info"]:
+            row["info"] = current["info"]
+        phases = [match.groups() for match in map(_PHASE.search, gmsh.logger.get()) if match]
+        if phases:
+            row["phases"] = [{"phase": phase, "wall_s": round(float(wall), 3),
+                              "cpu_s": round(float(cpu), 3)} for phase, wall, cpu in phases]
+        self.stages.append(row)
+
+    @contextlib.contextmanager
+    def stage(self, name, **info):
+        self.start(name, **info)
+        try:
+            yield
+        except BaseException:
+            self.stop("failed")
+            raise
+        self.stop()
+
+    # ---- the usual stages ---- #
+
+    def generate(self, dim=3):
+        with self.stage("generate", dim=dim):
+            mesh.generate(dim)
+
+    def optimize(self, method, niter=1, force=False):
+        with self.stage("optimize " + method, niter=niter, force=force):
+            mesh.optimize(method, force=force, niter=niter)
+
+    def refine(self):
+        with self.stage("refine"):
+            mesh.refine()
+
+    def verify(self, line=None, bins=None):
+        """check the mesh (verify.py), print the result and keep it in the report"""
+        self.line = line
+        with self.stage("verify"):
+            self.verification = verify.verify(line, bins)
+        print(verify.table(self.verification))
+        return self.verification
+
+    def write(self, path):
+        # .k / .key / .dyn as an LS-DYNA keyword file (lsdyna.py), .npy as a
+        # folder of numpy arrays (arrays.py), .meshz as a container (container.py)
+        with self.stage("write", file=path):
+            lsdyna.save(path, self.line)
+        self.outputs.append(path)
+
+    # ---- results ---- #
+
+    def as_dict(self):
+        report = {"name": self.name, "info": self.info, "started": self.started,
+                  "gmsh": gmsh.__version__,
+                  "threads": int(gmsh.option.getNumber("General.NumThreads")),
+                  "wall_s": round(time.perf_counter() - self._start_wall, 3),
+                  "cpu_s": round(time.process_time() - self._start_cpu, 3),
+                  "peak_rss_mb": round(self.peak_rss_mb(), 1),
+                  "outputs": self.outputs, "stages": self.stages}
+        if self.verification is not None:
+            report["verification"] = self.verification
+        return report
+
+    def peak_rss_mb(self):
+        """peak memory of the run"""
+        # ru_maxrss starts at the parent's high-water mark in a forked or
+        # exec'd process, so prefer the sampled peaks when there are any
+        if self._sampler is not None and self.stages:
+            return max(row["peak_rss_mb"] for row in self.stages)
+        return stats.peak_rss_mb()
+
+    def path(self):
+        if self.outputs:
+            return os.path.splitext(self.outputs[-1])[0] + "-report.json"
+        return self.name + "-report.json"
+
+    def table(self):
+        width = max([len(row["stage"]) for row in self.stages]
+                    + [len(phase["phase"]) + 2 for row in self.stages for phase in row.get("phases", [])]
+                    + [5])
+        lines = ["%-*s %10s %10s %10s %10s" % (width, "stage", "wall s", "cpu s", "peak MB", "elements")]
+        for row in self.stages:
+            lines.append("%-*s %10.2f %10.2f %10.1f %10d" % (
+                width, row["stage"], row["wall_s"], row["cpu_s"], row["peak_rss_mb"],
+                row["counts"]["elements"]))
+            for phase in row.get("phases", []):
+                lines.append("  %-*s %10.2f %10.2f" % (width - 2, phase["phase"], phase["wall_s"], phase["cpu_s"]))
+        return "\n".join(lines)
+
+    def finish(self, path=None, quiet=False):
+        """end the last stage, write the report and return it as a dict"""
+        self.stop()
+        if self._logging:
+            gmsh.logger.stop()
+            self._logging = False
+        self._done.set()
+        report = self.as_dict()
+        path = path or self.path()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=1)
+        self.record(report)
+        if not quiet:
+            print(self.table())
+            print("Elapsed time: ", report["wall_s"])
+            print("run report: " + path)
+        return report
+
+    def record(self, report):
+        """append the totals of the run to the history of runs of this name,
+        which predict.py fits its memory and time model to"""
+        counts = max((row["counts"] for row in self.stages), key=lambda c: c["elements"], default=None)
+        if not counts or not counts["elements"]:
+            return
+        # a mesh loaded from meshcache.py says nothing about meshing time or memory
+        if self.info.get("mesh_cache") == "hit":
+            return
+        row = {"started": self.started, "elements": counts["elements"], "nodes": counts["nodes"],
+               "peak_rss_mb": report["peak_rss_mb"], "wall_s": report["wall_s"],
+               "threads": report["threads"]}
+        if "prediction" in self.info:
+            row["estimate"] = self.info["prediction"]["estimate"]
+        if "mode" in self.info:
+            row["mode"] = self.info["mode"]
+        with open(history_path(self.name), "a") as f:
+            f.write(json.dumps(row) + "\n")
+
+
+def history_path(name):
+    """the json lines of every finished run of a report name"""
+    return os.path.join(cache.directory("runs"), name + ".jsonl")
+
+
+@contextlib.contextmanager
+def stage(report, name, **info):
+    """report.stage(name), or nothing when report is None"""
+    if report is None:
+        yield
+    else:
+        with report.stage(name, **info):
+            yield
@@ -0,0 +1,321 @@
+# ----------------------------------------------------------------------------- #
+#  mesh size callbacks compiled into native gmsh settings
+# ----------------------------------------------------------------------------- #
+#
+# a python size callback is called from C++ for every single size query while
+# meshing. the callbacks in the scripts only clamp or scale the size, e.g.
+#
+#   max(lc, 0.0001)      max(0.5, lc)      lc / 8
+#
+# and gmsh can do all of that itself. To determine the size it takes the
+# background field, calls the callback, clamps the result to
+# [Mesh.MeshSizeMin, Mesh.MeshSizeMax] and multiplies it by Mesh.MeshSizeFactor.
+# so any expression of the form
+#
+#   min(max(a * lc, lo), hi)      (a > 0)
+#
+# folds exactly into new MeshSizeMin/Max/Factor values. min/max expressions
+# that also use x, y or z are turned into Min/Max fields over the background
+# field and MathEval fields in x, y, z, and anything else falls back to a
+# (counted) python callback:
+#
+#   sizing.apply("max(lc, 0.0001)")                 -> options
+#   sizing.apply("max(lc, 0.002*x)", background=7)  -> Max field of 7 and MathEval
+#   sizing.apply("lc if dim == 3 else lc/2")        -> python callback
+#
+# lc can't go into a MathEval ("F7*2") because a MathEval that reads a field
+# chain containing another MathEval can deadlock gmsh, so in the field version
+# lc may only appear directly as an argument of min or max.
+#
+# call it after Mesh.MeshSizeMin/Max have been set, the folded limits are
+# computed from their current values.
+#
+# to see what compiling saves on a target, mesh it both ways:
+#
+#   python -m meshtools.sizing plate -s lc=0.2 --dim 2
+
+import argparse
+import ast
+import math
+import time
+
+import gmsh
+
+from meshtools.options import option
+
+mesh = gmsh.model.mesh
+
+_INF = float("inf")
+
+# functions allowed in expressions; min and max are also understood by MathEval
+_FUNCTIONS = {"min": min, "max": max, "abs": abs, "sqrt": math.sqrt,
+              "exp": math.exp, "log": math.log}
+_OPERATORS = {ast.Add: "+", ast.Sub: "-", ast.Mult: "*", ast.Div: "/", ast.Pow: "^"}
+
+
+class SizeCallback:
+    """python size callback that counts its calls and the time spent in it"""
+
+    def __init__(self, func):
+        self.func = func
+        self.calls = 0
+        self.seconds = 0.0
+
+    def __call__(self, dim, tag, x, y, z, lc):
+        start = time.perf_counter()
+        try:
+            return self.func(dim, tag, x, y, z, lc)
+        finally:
+            self.calls += 1
+            self.seconds += time.perf_counter() - start
+
+
+class Sizing:
+    """what an expression was compiled to
+
+    mode is "options", "field" or "callback"; `settings` holds the options or
+    the field that replaced the callback and `callback` the counted python
+    callback when it couldn't be compiled.
+    """
+
+    def __init__(self, expression, mode, settings=None, callback=None):
+        self.expression = expression
+        self.mode = mode
+        self.settings = settings or {}
+        self.callback = callback
+
+    @property
+    def calls(self):
+        return self.callback.calls if self.callback else 0
+
+    @property
+    def seconds(self):
+        return self.callback.seconds if self.callback else 0.0
+
+    def summary(self):
+        return {"expression": self.expression, "mode": self.mode,
+                "settings": self.settings, "callback_calls": self.calls,
+                "callback_s": round(self.seconds, 3)}
+
+
+# ----------------------------------------------------------------------------- #
+#
+# COMPILERS
+
+def _constant(node):
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return float(node.value)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = _constant(node.operand)
+        return None if value is None else -value
+    return None
+
+
+def _clamp(node):
+    """(a, lo, hi) so that node == min(max(a*lc, lo), hi), or None"""
+    if isinstance(node, ast.Name) and node.id == "lc":
+        return 1.0, -_INF, _INF
+
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mult, ast.Div)):
+        k = _constant(node.right)
+        inner = node.left
+        if k is None and isinstance(node.op, ast.Mult):
+            k, inner = _constant(node.left), node.right
+        if k is None or k <= 0:
+            return None
+        if isinstance(node.op, ast.Div):
+            k = 1/k
+        clamp = _clamp(inner)
+        if clamp is None:
+            return None
+        a, lo, hi = clamp
+        return a*k, lo*k, hi*k
+
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in ("min", "max") and len(node.args) >= 2 and not node.keywords):
+        constants = [_constant(arg) for arg in node.args]
+        inner = [arg for arg, c in zip(node.args, constants) if c is None]
+        if len(inner) != 1:
+            return None
+        clamp = _clamp(inner[0])
+        if clamp is None:
+            return None
+        a, lo, hi = clamp
+        if node.func.id == "max":
+            c = max(c for c in constants if c is not None)
+            return a, max(lo, c), max(hi, c)
+        c = min(c for c in constants if c is not None)
+        return a, min(lo, c), min(hi, c)
+
+    return None
+
+
+def _mathex(node):
+    """MathEval string of an expression in x, y, z only, or None"""
+    if isinstance(node, ast.Name):
+        return node.id if node.id in ("x", "y", "z") else None
+    value = _constant(node)
+    if value is not None:
+        return repr(value)
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _mathex(node.left), _mathex(node.right)
+        if left is None or right is None:
+            return None
+        return "(%s%s%s)" % (left, _OPERATORS[type(node.op)], right)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = _mathex(node.operand)
+        return None if operand is None else "(-%s)" % operand
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in _FUNCTIONS and not node.keywords):
+        args = [_mathex(arg) for arg in node.args]
+        if not args or None in args:
+            return None
+        return "%s(%s)" % (node.func.id, ",".join(args))
+    return None
+
+
+def _tree(node):
+    """field tree of node: "lc", a MathEval string or ("Min"/"Max", [trees])"""
+    if isinstance(node, ast.Name) and node.id == "lc":
+        return "lc"
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in ("min", "max") and not node.keywords
+            and any(isinstance(n, ast.Name) and n.id == "lc" for n in ast.walk(node))):
+        children = [_tree(arg) for arg in node.args]
+        if None in children:
+            return None
+        return node.func.id.capitalize(), children
+    return _mathex(node)
+
+
+def _add_fields(tree, background):
+    """create the fields of a _tree, returns the tag of its root"""
+    if tree == "lc":
+        return background
+    if isinstance(tree, str):
+        field = mesh.field.add("MathEval")
+        mesh.field.setString(field, "F", tree)
+        return field
+    kind, children = tree
+    field = mesh.field.add(kind)
+    mesh.field.setNumbers(field, "FieldsList", [_add_fields(c, background) for c in children])
+    return field
+
+
+def _python(expression):
+    code = compile(ast.parse(expression, mode="eval"), "<size callback>", "eval")
+    namespace = {"__builtins__": {}}
+    namespace.update(_FUNCTIONS)
+
+    def meshSizeCallback(dim, tag, x, y, z, lc):
+        return eval(code, namespace, {"dim": dim, "tag": tag, "x": x, "y": y, "z": z, "lc": lc})
+
+    return meshSizeCallback
+
+
+def _bound(value, lo, hi):
+    """value clamped the way gmsh clamps a size: max with MeshSizeMin, then
+    min with MeshSizeMax, so MeshSizeMax wins when MeshSizeMin > MeshSizeMax"""
+    return min(max(value, lo), hi)
+
+
+# ----------------------------------------------------------------------------- #
+#
+# APPLY
+
+def apply(expression, background=None, native=True):
+    """replace the size callback `expression` by gmsh settings where possible
+
+    `background` is the tag of the background field, needed to compile
+    expressions of x, y, z. with native=False the expression is always
+    registered as a python callback, e.g. to measure what it costs.
+    """
+    if callable(expression):
+        callback = SizeCallback(expression)
+        mesh.setSizeCallback(callback)
+        return Sizing(getattr(expression, "__name__", "callback"), "callback", callback=callback)
+
+    tree = ast.parse(expression, mode="eval").body
+
+    clamp = _clamp(tree) if native else None
+    if clamp is not None:
+        a, lo, hi = clamp
+        smin = option.getNumber("Mesh.MeshSizeMin")
+        smax = option.getNumber("Mesh.MeshSizeMax")
+        factor = option.getNumber("Mesh.MeshSizeFactor")
+        # factor * clamp(clamp(a*s, lo, hi), smin, smax) == factor*a * clamp(s, L, H)
+        # with L, H = lo, hi clamped into [smin, smax]; lo <= hi, so L <= H
+        # even when smin > smax (bullet-core-tet.py), where both are smax
+        settings = {"Mesh.MeshSizeMin": _bound(lo, smin, smax)/a,
+                    "Mesh.MeshSizeMax": _bound(hi, smin, smax)/a,
+                    "Mesh.MeshSizeFactor": factor*a}
+        for name, value in settings.items():
+            option.setNumber(name, value)
+        mesh.removeSizeCallback()
+        return Sizing(expression, "options", settings)
+
+    fields = _tree(tree) if native and background is not None else None
+    if fields is not None:
+        field = _add_fields(fields, background)
+        mesh.field.setAsBackgroundMesh(field)
+        mesh.removeSizeCallback()
+        return Sizing(expression, "field", {"field": field})
+
+    callback = SizeCallback(_python(expression))
+    mesh.setSizeCallback(callback)
+    return Sizing(expression, "callback", callback=callback)
+
+
+# ----------------------------------------------------------------------------- #
+#
+# COMPARE
+
+def compare(kind, overrides=None, dim=3):
+    """mesh a target with its callback compiled and as python, return both summaries"""
+    from meshtools import stats, targets
+
+    rows = []
+    for native in (True, False):
+        params = targets.resolve(kind, overrides)
+        params["native_sizing"] = native
+        gmsh.initialize()
+        option.setNumber("General.Terminal", 0)
+        try:
+            gmsh.model.add(kind)
+            targets.set_options(targets.RECOMBINE_OPTIONS)
+            tags = targets.build(kind, params)
+            start_time = time.perf_counter()
+            mesh.generate(dim)
+            row = tags["sizing"].summary()
+            row["wall_s"] = round(time.perf_counter() - start_time, 3)
+            row["nodes"] = stats.mesh_counts()["nodes"]
+        finally:
+            gmsh.finalize()
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    from meshtools import sweep, targets
+
+    parser = argparse.ArgumentParser(prog="python -m meshtools.sizing",
+                                     description="time a target's size callback compiled and as python")
+    parser.add_argument("kind", choices=sorted(targets.DEFAULTS))
+    parser.add_argument("-s", "--set", action="append", metavar="NAME=VALUE")
+    parser.add_argument("--dim", type=int, default=3, help="mesh up to this dimension")
+    args = parser.parse_args(argv)
+
+    overrides = sweep.parse_overrides(args.set)
+    native, python = compare(args.kind, overrides, args.dim)
+    print("%-10s %-10s %12s %10s %10s" % ("", "mode", "py calls", "py s", "wall s"))
+    for name, row in (("compiled", native), ("python", python)):
+        print("%-10s %-10s %12d %10.3f %10.3f" % (name, row["mode"], row["callback_calls"],
+                                                  row["callback_s"], row["wall_s"]))
+    print("saved %d callback calls, %.3f s in the callback, %.3f s wall time"
+          % (python["callback_calls"] - native["callback_calls"],
+             python["callback_s"] - native["callback_s"],
+             python["wall_s"] - native["wall_s"]))
+
+
+if __name__ == "__main__":
+    main()
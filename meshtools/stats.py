@@ -0,0 +1,57 @@
+# ----------------------------------------------------------------------------- #
+#  element counts and resource usage of the current gmsh model / process
+# ----------------------------------------------------------------------------- #
+
+import resource
+import sys
+
+import gmsh
+
+# gmsh keeps running statistics of the current mesh as read-only options,
+# which is much cheaper than pulling the elements out through the api
+_COUNTS = {
+    "nodes": "Mesh.NbNodes",
+    "triangles": "Mesh.NbTriangles",
+    "quadrangles": "Mesh.NbQuadrangles",
+    "tetrahedra": "Mesh.NbTetrahedra",
+    "hexahedra": "Mesh.NbHexahedra",
+    "prisms": "Mesh.NbPrisms",
+    "pyramids": "Mesh.NbPyramids",
+}
+
+
+def mesh_counts():
+    """node and element counts by type, plus `elements` = all 3D elements"""
+    counts = {key: int(gmsh.option.getNumber(name)) for key, name in _COUNTS.items()}
+    counts["elements"] = (counts["tetrahedra"] + counts["hexahedra"]
+                          + counts["prisms"] + counts["pyramids"])
+    return counts
+
+
+def rss_mb():
+    """current resident set size of this process in MB, None if unknown"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        pass
+    # no /proc on macOS; psutil knows, if it's installed
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss / 2**20
+
+
+def maxrss_mb(maxrss):
+    """an ru_maxrss value in MB"""
+    # ru_maxrss is in bytes on macOS and in kilobytes on linux
+    if sys.platform == "darwin":
+        return maxrss / 2**20
+    return maxrss / 2**10
+
+
+def peak_rss_mb(children=False):
+    """peak resident set size of this process (or its waited-for children) in MB"""
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    return maxrss_mb(resource.getrusage(who).ru_maxrss)
@@ -0,0 +1,207 @@
+# ----------------------------------------------------------------------------- #
+#  parallel parameter sweep over the refined plate and cylinder targets
+# ----------------------------------------------------------------------------- #
+#
+# instead of hand-editing lcsmaller, lcsmallest, r1, r2 and F and waiting for
+# each run, give a grid of values and let a process pool mesh every
+# combination (one gmsh instance per worker process):
+#
+#   python -m meshtools.sweep plate grid.json -j 32 -o sweep.csv
+#   python -m meshtools.sweep cylinder -s lcsmaller=lc/50,lc/60 -s r1=rcyl/2,rcyl/3
+#
+# grid.json maps parameter names to lists of values, as in the README tables:
+#
+#   {"lcsmaller": ["lc/50", "lc/100"], "lcsmallest": ["lc/100", "lc/200"],
+#    "r1": ["l/5", "l/8"], "r2": ["l/6.66", "l/10"], "F": ["2.5*F1^2"]}
+#
+# every finished run is appended to the csv straight away (params, element
+# and node counts, wall/cpu time, peak memory), so a partial sweep is still
+# useful if the batch is stopped.
+#
+# with --warm each pool process is a worker.Worker that stays up for the
+# whole sweep: gmsh is initialised once per process and the geometry is
+# built once and kept, so a run only adds its fields and meshes. the peak
+# memory of a row is then that of its process so far, not of the run alone.
+
+import argparse
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+import gmsh
+
+from meshtools import stats, targets, verify
+from meshtools.threads import apply as set_threads
+
+COLUMNS = ["run", "kind", "status", "elements", "hexahedra", "nodes",
+           "wall_s", "cpu_s", "peak_rss_mb", "sizing", "callback_calls", "callback_s",
+           "geometry", "setup_s"]
+
+
+def expand(grid):
+    """cartesian product of a {name: [values]} grid as a list of override dicts"""
+    names = list(grid)
+    values = [v if isinstance(v, list) else [v] for v in grid.values()]
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def mesh_once(kind, overrides, threads=1, write=None, zone=None):
+    """mesh one parameter set in a fresh gmsh session and return its csv row
+
+    meant to run in its own process: the peak memory reported is the peak of
+    the whole process. with a `zone`, the row also has the mean element size
+    within that distance of line l (see verify.py).
+    """
+    params = targets.resolve(kind, overrides)
+    row = {"kind": kind, "status": "ok"}
+    row.update({key: params[key] for key in overrides})
+
+    gmsh.initialize()
+    option = gmsh.option
+    option.setNumber("General.Terminal", 0)
+    # several workers share the box, so don't let HXT oversubscribe it
+    set_threads(threads)
+
+    start_time = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        gmsh.model.add(kind)
+        targets.set_options(targets.RECOMBINE_OPTIONS)
+        tags = targets.build(kind, params)
+        targets.generate(params, tags=tags)
+        if write:
+            gmsh.write(write)
+        row.update(stats.mesh_counts())
+        if zone is not None:
+            row["zone_size"] = verify.verify(tags["line"], [0, zone])["zones"][0].get("size_mean")
+        summary = tags["sizing"].summary()
+        row.update({key: summary[key] for key in ("callback_calls", "callback_s")})
+        row["sizing"] = summary["mode"]
+    except Exception:
+        row["status"] = traceback.format_exc(limit=1).strip().splitlines()[-1]
+    finally:
+        row["wall_s"] = round(time.perf_counter() - start_time, 3)
+        row["cpu_s"] = round(time.process_time() - start_cpu, 3)
+        row["peak_rss_mb"] = round(stats.peak_rss_mb(), 1)
+        gmsh.finalize()
+    return row
+
+
+def _work(job):
+    run, kind, overrides, threads, outdir = job
+    write = None
+    if outdir:
+        write = os.path.join(outdir, "%s-%04d.msh" % (kind, run))
+    row = mesh_once(kind, overrides, threads, write)
+    row["run"] = run
+    return row
+
+
+# the worker.Worker of a --warm pool process
+_worker = None
+
+
+def _start_warm(threads):
+    from meshtools import worker
+
+    global _worker
+    _worker = worker.Worker(threads)
+
+
+def _work_warm(job):
+    run, kind, overrides, threads, outdir = job
+    message = {"kind": kind, "params": overrides}
+    if outdir:
+        message["write"] = os.path.join(outdir, "%s-%04d.msh" % (kind, run))
+    row = _worker.run(message)
+    row["run"] = run
+    return row
+
+
+def sweep(kind, grid, out, workers=None, threads=1, outdir=None, warm=False):
+    """mesh every combination in `grid` on a process pool, rows go to `out`"""
+    runs = expand(grid)
+    jobs = [(i, kind, overrides, threads, outdir) for i, overrides in enumerate(runs)]
+    if outdir:
+        os.makedirs(outdir, exist_ok=True)
+
+    fields = COLUMNS[:2] + list(grid) + COLUMNS[2:]
+    with open(out, "w", newline="") as f:
+        writer = csv.DictWriter(f, fields, extrasaction="ignore")
+        writer.writeheader()
+        f.flush()
+        # one task per process so every run starts from a clean gmsh and its
+        # peak memory isn't inflated by the runs before it, unless warm
+        if warm:
+            pool = multiprocessing.Pool(workers, initializer=_start_warm, initargs=(threads,))
+        else:
+            pool = multiprocessing.Pool(workers, maxtasksperchild=1)
+        with pool:
+            for row in pool.imap_unordered(_work_warm if warm else _work, jobs):
+                writer.writerow(row)
+                f.flush()
+                print("run %(run)d: %(status)s, %(wall_s)s s" % row, file=sys.stderr)
+    return out
+
+
+def parse_set(items):
+    """-s name=v1,v2,... options as a grid"""
+    grid = {}
+    for item in items or []:
+        name, _, values = item.partition("=")
+        grid[name] = [_number(v) for v in values.split(",")]
+    return grid
+
+
+def parse_overrides(items):
+    """-s name=value options as a dict (values are not split on commas)"""
+    overrides = {}
+    for item in items or []:
+        name, _, value = item.partition("=")
+        overrides[name] = _number(value)
+    return overrides
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return text
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.sweep",
+                                     description="mesh a grid of target parameters in parallel")
+    parser.add_argument("kind", choices=sorted(targets.DEFAULTS))
+    parser.add_argument("grid", nargs="?", help="json file of {parameter: [values]}")
+    parser.add_argument("-s", "--set", action="append", metavar="NAME=V1,V2",
+                        help="add a parameter axis to the grid")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="worker processes (default: all cores)")
+    parser.add_argument("-t", "--threads", type=int, default=1,
+                        help="gmsh threads per worker (default: 1)")
+    parser.add_argument("-o", "--out", default="sweep.csv")
+    parser.add_argument("-w", "--write", metavar="DIR",
+                        help="also write every mesh to DIR")
+    parser.add_argument("--warm", action="store_true",
+                        help="keep gmsh and the geometry loaded in each worker process (worker.py)")
+    args = parser.parse_args(argv)
+
+    grid = {}
+    if args.grid:
+        with open(args.grid) as f:
+            grid.update(json.load(f))
+    grid.update(parse_set(args.set))
+    if not grid:
+        parser.error("nothing to sweep: give a grid file or -s options")
+
+    sweep(args.kind, grid, args.out, args.workers, args.threads, args.write, args.warm)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+# ----------------------------------------------------------------------------- #
+#  symmetry-reduced targets: mesh a quarter or a half, then mirror it
+# ----------------------------------------------------------------------------- #
+#
+# the plate and the cylinder, their impact line and the refinement fields are
+# all symmetric about the planes x = xc and y = yc through line l, so the
+# tetrahedra, the recombination and the optimise passes only need to see
+# 1 / symmetry of the target:
+#
+#   symmetry = 4: x >= xc, y >= yc      symmetry = 2: y >= yc
+#
+#          +--------+--------+                +-----------------+
+#          |        |        |                |       mesh      |
+#          | mirror |  mesh  |                |                 |
+#          +--------x--------+                +--------x--------+
+#          | mirror | mirror |                |      mirror     |
+#          |        |        |                |                 |
+#          +--------+--------+                +-----------------+
+#
+# the reduced target is an extruded rectangle or circle sector with a vertex
+# on line l, so line l is one of its edges, and gets the same Distance ->
+# MathEval and Cylinder fields. it is built with the built-in kernel: with
+# OpenCascade, or line l embedded in a face, Laplace2D takes minutes. it is
+# generated, optimised and refined as usual, then mirror() copies the mesh
+# into the other quarters (or the other half):
+#
+#   tags = targets.build("plate", dict(params, symmetry=4), report)
+#   ... generate, optimise, refine ...
+#   symmetry.mirror(tags, report)
+#
+# or targets.generate(params, report, tags), which does all of that. the
+# full mesh is a new, discrete model with the volumes, outer surfaces,
+# curves and points of the full target; the mesh entities inside it, on the
+# symmetry planes, are dropped except line l and its end points. a node on a
+# symmetry plane is one node of both images, so there are no duplicate nodes
+# to merge afterwards. msh and LS-DYNA keyword files are written as before.
+# the mesh is symmetric, which a mesh of the full target generally isn't.
+
+import math
+
+import gmsh
+import numpy as np
+
+from meshtools import report
+
+model = gmsh.model
+geo = model.geo
+mesh = model.mesh
+
+# reduced domains, as the signs (x - xc, y - yc) of the copies of the mesh
+# they are mirrored to; the first copy is the mesh itself
+IMAGES = {
+    2: [(1, 1), (1, -1)],
+    4: [(1, 1), (-1, 1), (1, -1), (-1, -1)],
+}
+
+# node order of each linear element type with its orientation reversed, for
+# the copies that are reflections
+FLIP = {
+    1: [0, 1],                          # line
+    2: [0, 2, 1],                       # triangle
+    3: [0, 3, 2, 1],                    # quadrangle
+    4: [0, 2, 1, 3],                    # tetrahedron
+    5: [0, 3, 2, 1, 4, 7, 6, 5],        # hexahedron
+    6: [0, 2, 1, 3, 5, 4],              # prism
+    7: [0, 3, 2, 1, 4],                 # pyramid
+    15: [0],                            # point
+}
+
+
+def check(symmetry):
+    if symmetry not in IMAGES:
+        raise ValueError("symmetry is 2 (half) or 4 (quarter), got %r" % symmetry)
+
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY
+
+def _extrude(curves, centre, h, symmetry):
+    """the face bounded by `curves` extruded through h, line l is the edge
+    extruded from its vertex at the centre"""
+    bottom = geo.addPlaneSurface([geo.addCurveLoop(curves)])
+    extruded = geo.extrude([(2, bottom)], 0, 0, h)
+    geo.synchronize()
+    xc, yc = centre
+    eps = 1e-3 * h
+    line = model.getEntitiesInBoundingBox(xc - eps, yc - eps, -eps, xc + eps, yc + eps, h + eps, 1)[0][1]
+    return {"volume": extruded[1][1], "line": line, "centre": centre, "symmetry": symmetry}
+
+
+def build_plate(p, symmetry):
+    """the x >= l/2, y >= l/2 quarter (or y >= l/2 half) of targets.build_plate"""
+    lc, h, l = p["lc"], p["h"], p["l"]
+    ll = l/2
+    if symmetry == 4:
+        outline = [(ll, ll), (l, ll), (l, l), (ll, l)]
+    else:
+        outline = [(ll, ll), (l, ll), (l, l), (0, l), (0, ll)]
+    points = [geo.addPoint(x, y, 0, lc) for x, y in outline]
+    lines = [geo.addLine(points[i], points[(i + 1) % len(points)]) for i in range(len(points))]
+    return _extrude(lines, (ll, ll), h, symmetry)
+
+
+def build_cylinder(p, symmetry):
+    """the x >= 0, y >= 0 quarter (or y >= 0 half) of targets.build_cylinder"""
+    lc, h, rcyl = p["lc"], p["h"], p["rcyl"]
+    # the centre of the arcs is a vertex of the sector, not a stray point
+    centre = geo.addPoint(0, 0, 0, lc)
+    angles = [0, math.pi/2] if symmetry == 4 else [0, math.pi/2, math.pi]
+    rim = [geo.addPoint(rcyl * math.cos(a), rcyl * math.sin(a), 0, lc) for a in angles]
+    arcs = [geo.addCircleArc(rim[i], centre, rim[i + 1]) for i in range(len(rim) - 1)]
+    curves = [geo.addLine(centre, rim[0])] + arcs + [geo.addLine(rim[-1], centre)]
+    return _extrude(curves, (0, 0), h, symmetry)
+
+
+BUILDERS = {"plate": build_plate, "cylinder": build_cylinder}
+
+# ----------------------------------------------------------------------------- #
+#
+# MIRROR
+
+def _entities(centre, cut, eps):
+    """(dim, tag, where, node tags, coordinates) of each entity of the mesh,
+    volumes first
+
+    `where` is the images the entity is copied to: "all" for volumes and the
+    entities off the cut planes, "first" for line l and its end points, and
+    "none" for the rest of the entities in a cut plane, inside the target
+    """
+    entities = []
+    for dim, tag in sorted(model.getEntities(), key=lambda entity: -entity[0]):
+        box = model.getBoundingBox(dim, tag)
+        on = [abs(box[i] - centre[i]) < eps and abs(box[i + 3] - centre[i]) < eps for i in (0, 1)]
+        if dim == 3 or not ((on[0] and cut[0]) or (on[1] and cut[1])):
+            where = "all"
+        elif on[0] and on[1]:
+            where = "first"
+        else:
+            where = "none"
+        node_tags, coords, _ = mesh.getNodes(dim, tag)
+        entities.append((dim, tag, where, node_tags.astype(np.int64), coords.reshape(-1, 3)))
+    return entities
+
+
+def mirror(tags, run_report=None):
+    """replace the mesh of the reduced target by the mesh of the full target
+
+    the reduced mesh is copied into the other quarters (or half) in a new
+    discrete model. tags["line"] becomes the end points of line l (see
+    verify.py)
+    """
+    images = IMAGES[tags["symmetry"]]
+    centre = tags["centre"]
+    cut = [any(sign[i] < 0 for sign in images) for i in (0, 1)]
+    with report.stage(run_report, "mirror", symmetry=tags["symmetry"]):
+        box = model.getBoundingBox(-1, -1)
+        eps = 1e-6 * max(box[3] - box[0], box[4] - box[1], box[5] - box[2])
+        entities = _entities(centre, cut, eps)
+        line_ends = model.getBoundingBox(1, tags["line"])
+        elements = {(dim, tag): [(t, n.reshape(len(e), -1)) for t, e, n in zip(*mesh.getElements(dim, tag))]
+                    for dim, tag, where, _, _ in entities if where != "none"}
+
+        node_tags = np.concatenate([n for _, _, _, n, _ in entities])
+        coords = np.concatenate([x for _, _, _, _, x in entities])
+        on = [cut[i] & (np.abs(coords[:, i] - centre[i]) < eps) for i in (0, 1)]
+        offset = int(node_tags.max()) + 1
+
+        # only the full mesh is in memory from here
+        name = model.getCurrent()
+        model.remove()
+        model.add(name)
+
+        # the image of sign (sx, sy), as index[sx < 0, sy < 0]
+        index = np.zeros((2, 2), dtype=np.int64)
+        for k, (sx, sy) in enumerate(images):
+            index[int(sx < 0), int(sy < 0)] = k
+
+        for k, (sx, sy) in enumerate(images):
+            # a node on a cut plane is the node of the image on its positive side
+            owner = index[((sx < 0) & ~on[0]).astype(int), ((sy < 0) & ~on[1]).astype(int)]
+            tag_map = np.zeros(offset, dtype=np.int64)
+            tag_map[node_tags] = node_tags + owner * offset
+            image = coords.copy()
+            image[:, 0] = centre[0] + sx * (coords[:, 0] - centre[0])
+            image[:, 1] = centre[1] + sy * (coords[:, 1] - centre[1])
+
+            # the nodes this image owns go to the copies of their entities,
+            # those of the dropped entities to the volume
+            start, volume, copies = 0, None, []
+            for dim, tag, where, entity_nodes, _ in entities:
+                end = start + len(entity_nodes)
+                target = volume
+                if where == "all" or (where == "first" and k == 0):
+                    copy = model.addDiscreteEntity(dim)
+                    copies.append((dim, tag, copy))
+                    target = (dim, copy)
+                    if volume is None:
+                        volume = target
+                new = np.flatnonzero(owner[start:end] == k) + start
+                if len(new):
+                    mesh.addNodes(target[0], target[1], node_tags[new] + k * offset, image[new].ravel())
+                start = end
+
+            for dim, tag, copy in copies:
+                for element_type, element_nodes in elements[dim, tag]:
+                    if sx * sy < 0:
+                        if element_type not in FLIP:
+                            raise ValueError("can't mirror elements of type %d" % element_type)
+                        element_nodes = element_nodes[:, FLIP[element_type]]
+                    mesh.addElementsByType(copy, element_type, [], tag_map[element_nodes].ravel())
+
+        mesh.renumberNodes()
+        mesh.renumberElements()
+
+    tags["line"] = (tuple(line_ends[:3]), tuple(line_ends[3:]))
+    return tags
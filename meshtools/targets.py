@@ -0,0 +1,629 @@
+# ----------------------------------------------------------------------------- #
+#  refined target plate and cylinder models for ballistic impact sims
+# ----------------------------------------------------------------------------- #
+#
+# the geometry, refinement fields and meshing options of plate-ustruct-hex.py
+# and ustruc-cyl.py, written as functions so the scripts, the sweep runner and
+# the other tools in meshtools all build exactly the same model.
+#
+# parameters are plain dicts. numeric values may be given as strings relative
+# to the parameters before them (e.g. "lc/50" or "l/8"), just like the tables
+# in the README. `F` is the MathEval term in the distance to line l, i.e.
+# the field is "F + lcsmallest".
+#
+# a Target builds the geometry and fields of one target once and meshes it
+# again after changes to its sizing parameters, updating only the field
+# values they affect (e.g. for sweeps run in one process):
+#
+#   plate = Target("plate", lc=0.2)
+#   plate.mesh()
+#   plate.lcsmallest = "lc/200"         # field 2's F and field 5's VIn
+#   plate.mesh()
+#   print(plate.table())                # the setup and every run, timed apart
+
+import itertools
+import time
+
+import gmsh
+
+from meshtools import background, geocache, localrefine, report, sizing, stats, symmetry
+from meshtools.options import option
+
+model = gmsh.model
+mesh = model.mesh
+
+# ----------------------------------------------------------------------------- #
+#
+# MESHING OPTIONS
+
+# recombination tet -> hex options shared by the unstructured hex scripts
+RECOMBINE_OPTIONS = {
+    # 1: MeshAdapt, 2: Automatic, 3: Initial mesh only, 5: Delaunay, 6: Frontal-Delaunay,
+    # 7: BAMG, 8: Frontal-Delaunay for Quads, 9: Packing of Parallelograms, 11: Quasi-structured Quad
+    # 5 and 8 are ok - 5 handles mesh gradients better. 1 decides for itself
+    "Mesh.Algorithm": 1,
+    # 1: Delaunay, 3: Initial mesh only, 4: Frontal, 7: MMG3D, 9: R-tree, 10: HXT
+    "Mesh.Algorithm3D": 10,
+    # 0: simple, 1: blossom, 2: simple full-quad, 3: blossom full-quad
+    "Mesh.RecombinationAlgorithm": 0,
+    # 0: none, 1: all quadrangles, 2: all hexahedra, 3: barycentric
+    "Mesh.SubdivisionAlgorithm": 2,
+    "Mesh.RecombineNodeRepositioning": 0,
+    # turn on recombination:
+    "Mesh.RecombineAll": 1,
+    "Mesh.Recombine3DAll": 1,
+    # 0: hex, 1: hex+prisms, 2: hex+prism+pyramids
+    "Mesh.Recombine3DLevel": 0,
+    # topological optimization passes of recombined surface meshes (default 5)
+    "Mesh.RecombineOptimizeTopology": 10,
+    # default 0.01
+    "Mesh.RecombineMinimumQuality": 10,
+    # 0: nonconforming, 1: trihedra, 2: pyramids+trihedra,
+    # 3:pyramids+hexSplit+trihedra, 4:hexSplit+trihedra
+    "Mesh.Recombine3DConformity": 4,
+    "Mesh.SecondOrderLinear": 1,
+    # 0: default (all),100: pattern-based CAD faces,010: disk quadrangulation remeshing,
+    # 001: cavity remeshing,xxx: combination of multiple methods (e.g. 111 for all)
+    "Mesh.QuadqsTopologyOptimizationMethods": 111,
+    # from 0 (no quality decrease during remeshing) to 1 (default 0.66)
+    "Mesh.QuadqsRemeshingBoldness": 0.5,
+    # 3: from background mesh (e.g. sizes in current triangulation)
+    "Mesh.QuadqsSizemapMethod": 3,
+    # apply an elliptic smoother to the grid to have a more regular mesh:
+    "Mesh.Smoothing": 100,
+    "Mesh.SmoothNormals": 1,
+    "Mesh.SmoothCrossField": 1,
+    "Mesh.ElementOrder": 1,
+    # when the element size is fully specified by a mesh size field, set:
+    "Mesh.MeshSizeExtendFromBoundary": 0,
+    "Mesh.MeshSizeFromPoints": 0,
+    "Mesh.MeshSizeFromCurvature": 0,
+}
+
+
+def set_options(options):
+    for name, value in options.items():
+        option.setNumber(name, value)
+
+
+# ----------------------------------------------------------------------------- #
+#
+# PARAMETERS
+
+# mesh size definitions
+#   lc = generic mesh size
+#   lcmin = minimum refined mesh size
+#   lcmax = max refined mesh size
+#   lcsmaller = outer cylinder of semi-refined mesh size
+#   lcsmallest = inner cylinder of fully refined mesh size
+#   r1 = radius of semi-refined outer cylinder
+#   r2 = radius of refined inner cylinder
+#   F = quadratic term of the size function around line l
+#   callback = size callback expression in lc (and x, y, z), see sizing.py
+#   native_sizing = compile the callback into gmsh settings instead of calling python
+#   optimize = mesh.optimize passes as (method, niter) pairs
+#   background = "fields" for the gmsh field chain, "sampled" to evaluate it
+#                once in numpy on a cached grid (see background.py)
+#   spacing = grid spacing of the sampled background (default lcsmallest/2)
+#   cache_geometry = load the OCC cylinder from the geometry cache (geocache.py)
+#   refine_within = refine only the elements within this distance of line l
+#                   instead of all of them (None, see localrefine.py)
+#   symmetry = 1 for the whole target, 2 or 4 to mesh a half or a quarter of
+#              it and mirror the mesh (see symmetry.py)
+#
+# geometry definitions
+#   h = height; l = plate length; rcyl = cylinder radius
+
+# plate-ustruct-hex.py
+PLATE = {
+    "lc": 1e-1,
+    "lcsmaller": "lc/50",
+    "lcsmallest": "lc/100",
+    "lcmin": "lc/200",
+    "lcmax": 1,
+    "h": 0.005,
+    "l": 0.1,
+    "r1": "l/8",
+    "r2": "l/10",
+    "F": "2.5*F1^2",
+    "callback": "max(lc, 0.0001)",
+    "native_sizing": True,
+    "optimize": [("Relocate3D", 1), ("Netgen", 1), ("Laplace2D", 3)],
+    "background": "fields",
+    "spacing": None,
+    "refine_within": None,
+    "symmetry": 1,
+}
+
+# ustruc-cyl.py
+CYLINDER = {
+    "lc": 1e-1,
+    "lcsmaller": "lc/60",
+    "lcsmallest": "lc/140",
+    "lcmin": 0.00005,
+    "lcmax": 1,
+    "h": 0.005,
+    "rcyl": 0.03025,
+    "cache_geometry": True,
+    "r1": "rcyl/2",
+    "r2": "rcyl/3",
+    "F": "8.8*F1^2",
+    "callback": "max(lc, 0.0001)",
+    "native_sizing": True,
+    "optimize": [("Laplace2D", 3)],
+    "background": "fields",
+    "spacing": None,
+    "refine_within": None,
+    "symmetry": 1,
+}
+
+DEFAULTS = {"plate": PLATE, "cylinder": CYLINDER}
+
+# keys that are passed through as they are instead of being evaluated
+_VERBATIM = ("F", "callback", "optimize", "background")
+
+# the parameters each geometry is built from; the others only change the
+# fields, size limits and passes
+GEOMETRY = {"plate": ("h", "l", "symmetry"), "cylinder": ("h", "rcyl", "cache_geometry", "symmetry")}
+
+
+def resolve(kind, overrides=None):
+    """defaults for `kind` updated with `overrides`, strings evaluated to numbers"""
+    params = dict(DEFAULTS[kind])
+    params.update(overrides or {})
+    return evaluate(params)
+
+
+def evaluate(params):
+    """the string values of params evaluated in the parameters before them"""
+    resolved = {}
+    for key, value in params.items():
+        if isinstance(value, str) and key not in _VERBATIM:
+            value = eval(value, {"__builtins__": {}}, dict(resolved))
+        resolved[key] = value
+    return resolved
+
+
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY
+
+def build_plate(p):
+    """l x l x h box with the impact line l embedded through its centre"""
+    lc, h, l = p["lc"], p["h"], p["l"]
+    ll = l/2
+
+    # add points; lower square plane
+    A = model.geo.addPoint(0, 0, 0, lc)
+    B = model.geo.addPoint(l, 0, 0, lc)
+    C = model.geo.addPoint(l, l, 0, lc)
+    D = model.geo.addPoint(0, l, 0, lc)
+
+    # upper square plane
+    E = model.geo.addPoint(0, 0, h, lc)
+    F = model.geo.addPoint(l, 0, h, lc)
+    G = model.geo.addPoint(l, l, h, lc)
+    H = model.geo.addPoint(0, l, h, lc)
+
+    # connect points with lines; lower square plane
+    model.geo.addLine(A, B, 1)
+    model.geo.addLine(C, B, 2)
+    model.geo.addLine(C, D, 3)
+    model.geo.addLine(D, A, 4)
+
+    # upper square plane
+    model.geo.addLine(E, F, 5)
+    model.geo.addLine(G, F, 6)
+    model.geo.addLine(G, H, 7)
+    model.geo.addLine(H, E, 8)
+
+    # connect square planes
+    model.geo.addLine(1, 5, 9)
+    model.geo.addLine(2, 6, 10)
+    model.geo.addLine(3, 7, 11)
+    model.geo.addLine(4, 8, 12)
+
+    # connect lines with loops
+    model.geo.addCurveLoop([4, 1, -2, 3], 101)
+    model.geo.addCurveLoop([8, 5, -6, 7], 102)
+    model.geo.addCurveLoop([12, 8, -9, -4], 103)
+    model.geo.addCurveLoop([5, -10, -1, 9], 104)
+    model.geo.addCurveLoop([-6, -11, 2, 10], 105)
+    model.geo.addCurveLoop([11, 7, -12, -3], 106)
+
+    # create surfaces on the loops
+    model.geo.addPlaneSurface([101], 201)
+    model.geo.addPlaneSurface([102], 202)
+    model.geo.addPlaneSurface([103], 203)
+    model.geo.addPlaneSurface([104], 204)
+    model.geo.addPlaneSurface([105], 205)
+    model.geo.addPlaneSurface([106], 206)
+
+    model.geo.synchronize()
+
+    # create volume between the surfaces
+    model.geo.addSurfaceLoop([201, 202, 203, 204, 205, 206], 128)
+    model.geo.addVolume([128], 1)
+
+    model.geo.synchronize()
+
+    # define a line via two points around which to refine the mesh
+    ps = model.geo.addPoint(ll, ll, 0, lc)
+    pf = model.geo.addPoint(ll, ll, h, lc)
+    line = model.geo.addLine(ps, pf)
+
+    model.geo.synchronize()
+
+    # embed new points and line into the surfaces and volume
+    # (a boundary point must be embedded in the surface as well as the volume)
+    mesh.embed(0, [ps], 2, 201)
+    mesh.embed(0, [ps], 3, 1)
+    mesh.embed(0, [pf], 2, 202)
+    mesh.embed(0, [pf], 3, 1)
+    mesh.embed(1, [line], 3, 1)
+
+    return {"volume": 1, "line": line, "centre": (ll, ll), "bottom": 201, "top": 202}
+
+
+def build_cylinder(p):
+    """OpenCascade disc of radius rcyl and height h with line l on its axis"""
+    lc, h, rcyl = p["lc"], p["h"], p["rcyl"]
+
+    def occ_geometry():
+        # add lower and upper circles
+        C1 = model.occ.addCircle(0, 0, 0, rcyl)
+        C2 = model.occ.addCircle(0, 0, h, rcyl)
+
+        # add circle curve loops
+        model.occ.addCurveLoop([C1], 101)
+        model.occ.addCurveLoop([C2], 102)
+
+        # circle surfaces
+        model.occ.addPlaneSurface([101], 201)
+        model.occ.addPlaneSurface([102], 202)
+
+        # join circles and make volume
+        model.occ.addThruSections([101, 102], 301, makeSolid=True, smoothing=True)
+
+        model.occ.synchronize()
+
+        # define a line via two points around which to refine the mesh
+        ps = model.occ.addPoint(0, 0, 0, lc)
+        pf = model.occ.addPoint(0, 0, h, lc)
+        line = model.occ.addLine(ps, pf)
+
+        model.occ.synchronize()
+
+        # embed line into the volume
+        model.occ.fragment([(1, line)], [(3, 301)])
+
+        model.occ.synchronize()
+
+        return {"volume": (3, 301), "line": (1, line)}
+
+    if p["cache_geometry"]:
+        # the point sizes aren't kept in the BREP, but the targets never
+        # take the mesh size from points (Mesh.MeshSizeFromPoints = 0)
+        entities = geocache.build("cylinder", {"rcyl": rcyl, "h": h}, occ_geometry)
+    else:
+        entities = occ_geometry()
+
+    return {"volume": entities["volume"][1], "line": entities["line"][1], "centre": (0, 0)}
+
+
+BUILDERS = {"plate": build_plate, "cylinder": build_cylinder}
+
+
+# ----------------------------------------------------------------------------- #
+#
+# MESH REFINEMENT
+
+def add_impact_fields(p, line, centre, dim=1):
+    """Distance -> MathEval and two Cylinder fields around line l, combined by Min
+
+    with dim=0, `line` is a point on the impact axis instead (for a surface
+    mesh in the xy plane). returns the tag of the Min field, which is set as
+    the background mesh
+    """
+    xc, yc = centre
+
+    # define a distance field for mesh refinement around line l
+    mesh.field.add("Distance", 1)
+    mesh.field.setNumbers(1, "CurvesList" if dim == 1 else "PointsList", [line])
+
+    # math eval to determine the mesh size (quadratic depending on distance to line l)
+    mesh.field.add("MathEval", 2)
+    mesh.field.setString(2, "F", size_function(p))
+
+    # define two cylinder fields
+    # inside and outside of which mesh size is determined
+    for tag, radius, size in ((4, p["r1"], p["lcsmaller"]), (5, p["r2"], p["lcsmallest"])):
+        mesh.field.add("Cylinder", tag)
+        mesh.field.setNumber(tag, "Radius", radius)
+        mesh.field.setNumber(tag, "VIn", size)
+        mesh.field.setNumber(tag, "VOut", p["lc"])
+        mesh.field.setNumber(tag, "XAxis", 0)
+        mesh.field.setNumber(tag, "XCenter", xc)
+        mesh.field.setNumber(tag, "YAxis", 0)
+        mesh.field.setNumber(tag, "YCenter", yc)
+        mesh.field.setNumber(tag, "ZCenter", 0)
+        mesh.field.setNumber(tag, "ZAxis", 1)
+
+    # define a field that mandates the minimum element size of all fields
+    mesh.field.add("Min", 7)
+    mesh.field.setNumbers(7, "FieldsList", [2, 4, 5])
+
+    mesh.field.setAsBackgroundMesh(7)
+
+    return 7
+
+
+def size_function(p):
+    """the MathEval of field 2"""
+    return p["F"] + " +" + str(p["lcsmallest"])
+
+
+def set_size_limits(p, field=None):
+    """MeshSizeMin/Max and the size callback, returns the sizing.Sizing"""
+    option.setNumber("Mesh.MeshSizeMax", p["lcmax"])
+    option.setNumber("Mesh.MeshSizeMin", p["lcmin"])
+
+    # mesh constraints
+    # the callback removes any elements that are too small. it is folded into
+    # the limits above when possible, which saves a python call per size query
+    return sizing.apply(p["callback"], field, native=p["native_sizing"])
+
+
+def build(kind, p, run_report=None):
+    """geometry, refinement fields and size limits of a `kind` target
+
+    with a report.Report, the geometry and the fields are timed as stages.
+    with p["symmetry"] 2 or 4 it is only the half or quarter that is meshed,
+    see symmetry.py
+    """
+    return build_fields(kind, p, build_geometry(kind, p, run_report), run_report)
+
+
+def build_geometry(kind, p, run_report=None):
+    """the geometry alone, returns its tags"""
+    with report.stage(run_report, "geometry"):
+        if p["symmetry"] == 1:
+            return BUILDERS[kind](p)
+        symmetry.check(p["symmetry"])
+        return symmetry.BUILDERS[kind](p, p["symmetry"])
+
+
+def build_fields(kind, p, tags, run_report=None):
+    """refinement fields and size limits on the geometry of build_geometry(),
+    added to `tags` (worker.py adds them to a geometry kept from an earlier job)"""
+    with report.stage(run_report, "fields"):
+        if p["background"] == "sampled":
+            tags["field"], tags["background"] = background.apply(kind, p, tags["centre"])
+        else:
+            tags["field"] = add_impact_fields(p, tags["line"], tags["centre"])
+        tags["sizing"] = set_size_limits(p, tags["field"])
+    return tags
+
+
+# ----------------------------------------------------------------------------- #
+#
+# GENERATE MESH
+
+def optimize(passes, run_report=None):
+    for step in passes:
+        method, niter = step[0], step[1] if len(step) > 1 else 1
+        # untangling only does anything when forced
+        force = method == "UntangleMeshGeometry"
+        if run_report is None:
+            mesh.optimize(method, force=force, niter=niter)
+        else:
+            run_report.optimize(method, niter=niter, force=force)
+
+
+def generate(p, run_report=None, tags=None):
+    """the generate -> optimise -> refine sequence of the scripts
+
+    with p["refine_within"] only the elements near line l are refined, and
+    with p["symmetry"] the mesh is mirrored at the end, which both need the
+    tags from build()
+    """
+    if tags is None and (p["refine_within"] is not None or p["symmetry"] != 1):
+        raise ValueError("refine_within and symmetry need the tags of the target, "
+                         "generate(p, run_report, tags)")
+    if p["refine_within"] is not None:
+        generate_local(p, tags["line"], run_report)
+    elif run_report is None:
+        mesh.generate(3)
+        optimize(p["optimize"])
+        mesh.refine()
+    else:
+        run_report.generate(3)
+        optimize(p["optimize"], run_report)
+        run_report.refine()
+    if p["symmetry"] != 1:
+        symmetry.mirror(tags, run_report)
+
+
+# tetrahedra only while generating for the local refinement; set with
+# gmsh.option so the checkpoint keys still see the options of the run
+_TETRAHEDRA = {"Mesh.SubdivisionAlgorithm": 0, "Mesh.RecombineAll": 0, "Mesh.Recombine3DAll": 0}
+
+# optimise passes that run on the tetrahedra before they are split: on the
+# refined hexahedra Relocate3D inverts elements and takes several times as long
+_TETRAHEDRA_PASSES = ("Relocate3D",)
+
+
+def generate_local(p, line, run_report=None):
+    """generate tetrahedra, split those within p["refine_within"] of line l
+    (localrefine.py), subdivide into hexahedra and optimise
+
+    Netgen only optimises tetrahedra and crashes on these, so like the other
+    passes it runs on the hexahedra, where it does nothing as in generate()
+    """
+    saved = {name: gmsh.option.getNumber(name) for name in _TETRAHEDRA}
+    try:
+        for name, value in _TETRAHEDRA.items():
+            gmsh.option.setNumber(name, value)
+        with report.stage(run_report, "generate", dim=3):
+            mesh.generate(3)
+    finally:
+        for name, value in saved.items():
+            gmsh.option.setNumber(name, value)
+    optimize([step for step in p["optimize"] if step[0] in _TETRAHEDRA_PASSES], run_report)
+    with report.stage(run_report, "refine local", within=p["refine_within"]):
+        localrefine.refine(localrefine.near_curve(line, p["refine_within"]))
+    # mesh.refine() turns each tet into 4 hexahedra with SubdivisionAlgorithm 2
+    if saved["Mesh.SubdivisionAlgorithm"]:
+        with report.stage(run_report, "subdivide"):
+            mesh.refine()
+    optimize([step for step in p["optimize"] if step[0] not in _TETRAHEDRA_PASSES], run_report)
+
+# ----------------------------------------------------------------------------- #
+#
+# REUSABLE TARGET
+
+# the Cylinder fields of add_impact_fields: tag, radius and size inside
+_CYLINDERS = ((4, "r1", "lcsmaller"), (5, "r2", "lcsmallest"))
+
+# parameters that set the size limits and callback (set_size_limits)
+_LIMITS = {"lcmin", "lcmax", "callback", "native_sizing"}
+
+# parameters that only change the passes of generate()
+_PASSES = {"optimize", "refine_within"}
+
+_names = itertools.count(1)
+
+
+class Target:
+    """a `kind` target whose geometry and fields are built once, meshed
+    again by mesh() after changes to its parameters
+
+    parameters are attributes, given as for resolve(): strings such as
+    "lc/50" are evaluated again when the parameters before them change, as
+    in a fresh run with the same overrides. the geometry parameters
+    (GEOMETRY) can't change, and neither can symmetry, as mirroring replaces
+    the model. the meshing options are gmsh's, set them as for build().
+    """
+
+    def __init__(self, kind, run_report=None, **overrides):
+        spec = dict(DEFAULTS[kind])
+        spec.update(overrides)
+        p = evaluate(spec)
+        if p["symmetry"] != 1:
+            raise ValueError("a mirrored target replaces its model, use build() and generate()")
+        start_time = time.perf_counter()
+        self.__dict__.update(kind=kind, spec=spec, p=p, changed=set(), runs=[])
+        self.name = "%s-%d" % (kind, next(_names))
+        model.add(self.name)
+        tags = build_geometry(kind, p, run_report)
+        # sizing.apply scales the factor, so every apply starts from this one
+        self.factor = option.getNumber("Mesh.MeshSizeFactor")
+        self.tags = build_fields(kind, p, tags, run_report)
+        self.setup_s = round(time.perf_counter() - start_time, 3)
+
+    def __getattr__(self, name):
+        p = self.__dict__.get("p")
+        if p is not None and name in p:
+            return p[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        if name not in DEFAULTS[self.kind]:
+            object.__setattr__(self, name, value)
+            return
+        if name in GEOMETRY[self.kind]:
+            raise AttributeError("%s is a parameter of the geometry, make a new Target" % name)
+        spec = dict(self.spec)
+        spec[name] = value
+        p = evaluate(spec)
+        self.changed.update(key for key in p if p[key] != self.p[key])
+        self.spec, self.p = spec, p
+
+    def update(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    # ---- fields ---- #
+
+    def _rebuild(self):
+        """every field and the size limits again"""
+        for field in mesh.field.list():
+            mesh.field.remove(field)
+        if "background" in self.tags:
+            gmsh.view.remove(self.tags.pop("background")["view"])
+        option.setNumber("Mesh.MeshSizeFactor", self.factor)
+        build_fields(self.kind, self.p, self.tags)
+
+    def _limits(self):
+        """the size limits and callback again, without the fields a compiled
+        callback added after the background field"""
+        for field in mesh.field.list():
+            if field > self.tags["field"]:
+                mesh.field.remove(field)
+        mesh.field.setAsBackgroundMesh(self.tags["field"])
+        option.setNumber("Mesh.MeshSizeFactor", self.factor)
+        self.tags["sizing"] = set_size_limits(self.p, self.tags["field"])
+
+    def _apply(self):
+        """set what the changed parameters affect, returns a list of it"""
+        changed, p = self.changed, self.p
+        self.changed = set()
+        if not changed - _PASSES:
+            return []
+        if "lc" in changed:
+            # only used with Mesh.MeshSizeFromPoints, but as a fresh build would have them
+            mesh.setSize(model.getEntities(0), p["lc"])
+        if p["background"] == "sampled" or "background" in changed:
+            # the whole size function is sampled on one grid
+            self._rebuild()
+            return ["fields"]
+
+        applied = []
+        if changed & {"F", "lcsmallest"}:
+            mesh.field.setString(2, "F", size_function(p))
+            applied.append("2 F")
+        for tag, radius, size in _CYLINDERS:
+            for option_name, key in (("Radius", radius), ("VIn", size), ("VOut", "lc")):
+                if key in changed:
+                    mesh.field.setNumber(tag, option_name, p[key])
+                    applied.append("%d %s" % (tag, option_name))
+        if changed & _LIMITS:
+            self._limits()
+            applied.append("size limits")
+        return applied
+
+    # ---- meshing ---- #
+
+    def mesh(self, run_report=None):
+        """clear the mesh, apply the changes since the last run and generate,
+        returns the timings and counts of the run (update_s is the clearing
+        and the field updates, mesh_s generate() and its passes)"""
+        model.setCurrent(self.name)
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+        changed = sorted(self.changed)
+        mesh.clear()
+        applied = self._apply()
+        update_s = time.perf_counter() - start_time
+        generate(self.p, run_report, self.tags)
+        row = {"run": len(self.runs) + 1, "changed": changed, "applied": applied,
+               "update_s": round(update_s, 4), "mesh_s": round(time.perf_counter() - start_time - update_s, 3),
+               "wall_s": round(time.perf_counter() - start_time, 3),
+               "cpu_s": round(time.process_time() - start_cpu, 3)}
+        row.update(stats.mesh_counts())
+        self.runs.append(row)
+        return row
+
+    def remove(self):
+        """remove the model of the target"""
+        model.setCurrent(self.name)
+        model.remove()
+
+    def table(self):
+        lines = ["%s: geometry and fields in %.3f s" % (self.name, self.setup_s),
+                 "%4s %10s %10s %10s %10s  %s" % ("run", "update s", "mesh s", "wall s", "elements", "changed")]
+        for row in self.runs:
+            lines.append("%4d %10.4f %10.2f %10.2f %10d  %s" % (
+                row["run"], row["update_s"], row["mesh_s"], row["wall_s"], row["elements"],
+                ", ".join(row["changed"]) or "-"))
+        return "\n".join(lines)
@@ -0,0 +1,289 @@
+# ----------------------------------------------------------------------------- #
+#  thread scaling study and automatic thread count for a run
+# ----------------------------------------------------------------------------- #
+#
+# HXT (Mesh.Algorithm3D 10) and the 2D meshers run on General.NumThreads
+# threads, capped per dimension by Mesh.MaxNumThreads1D/2D/3D. gmsh starts
+# with one thread, and giving every job all the cores oversubscribes a node
+# that runs several of them. only 3D is threaded unless a curve says
+# otherwise: the MeshAdapt + recombine 2D meshing of the plates segfaults in
+# ~5-10% of runs on 2 threads, and never on one.
+#
+# the scaling study meshes one benchmark case (see bench.py) at 1..N threads,
+# each run in a fresh process, and stores the speedup curve of the whole run
+# and of each meshing phase gmsh times ("meshing 2D", "meshing 3D", ...):
+#
+#   python -m meshtools.threads scale bullet-core-hex --size medium --max 8
+#   python -m meshtools.threads choose bullet-core-hex     # what a run would use now
+#   python -m meshtools.threads jobs                       # running meshtools jobs
+#
+# a script then calls, after gmsh.initialize(sys.argv):
+#
+#   threads.auto("bullet-core-hex")
+#
+# which takes the cores not used by other jobs on the host (the meshtools jobs
+# that registered here and the load average, whichever is more), and of the
+# thread counts that fit picks the smallest one within SLACK of the best
+# measured speedup, for the run and for each dimension. without a curve it
+# uses one thread, as gmsh does. -nt <n> on the command line (gmsh's own
+# option) skips all that and is used as given, for 3D.
+#
+# the curves are per machine, in ~/.cache/meshtools/threads (or
+# $MESHTOOLS_CACHE). the thread count is set with gmsh.option directly, not
+# through options.option, so it isn't part of the checkpoint keys.
+
+import argparse
+import atexit
+import datetime
+import json
+import os
+import sys
+
+import gmsh
+
+from meshtools import cache
+
+# a thread count is good enough if its speedup is within SLACK of the best one
+SLACK = 0.1
+
+# gmsh's phases for each dimension, as they appear in the run report
+PHASES = {1: "meshing 1D", 2: "meshing 2D", 3: "meshing 3D"}
+
+# dimensions kept on one thread unless a curve gives them a count
+SERIAL = (1, 2)
+
+# ----------------------------------------------------------------------------- #
+#
+# SCALING STUDY
+
+def counts(maximum):
+    """1, 2, 4, ... up to and including maximum"""
+    result = [1]
+    while result[-1]*2 < maximum:
+        result.append(result[-1]*2)
+    if maximum > 1:
+        result.append(maximum)
+    return result
+
+
+def _curve_path(case):
+    return os.path.join(cache.directory("threads"), case + ".json")
+
+
+def scale(case, size="medium", thread_counts=None, repeat=1):
+    """run a bench case at each thread count, store and return the curve"""
+    from meshtools import bench
+
+    thread_counts = thread_counts or counts(os.cpu_count() or 1)
+    curve = {"case": case, "size": size, "cpus": os.cpu_count(), "gmsh": gmsh.__version__,
+             "measured": datetime.datetime.now().isoformat(timespec="seconds"),
+             "threads": [], "wall_s": [], "phases": {},
+             # the runs use -nt, which leaves the SERIAL dimensions on one thread
+             "threaded": [dim for dim in PHASES if dim not in SERIAL]}
+    for n in thread_counts:
+        result = bench.best([bench.run(case, size, threads=n) for _ in range(repeat)])
+        if result["status"] != "ok":
+            print("%3d threads: FAILED (exit %s)" % (n, result.get("returncode")), flush=True)
+            continue
+        curve["threads"].append(n)
+        curve["wall_s"].append(result["wall_s"])
+        for phase, wall in result.get("phases", {}).items():
+            curve["phases"].setdefault(phase, {})[n] = wall
+        print("%3d threads: %8.2f s" % (n, result["wall_s"]), flush=True)
+    # phases as lists along curve["threads"]
+    curve["phases"] = {phase: [walls.get(n) for n in curve["threads"]]
+                       for phase, walls in curve["phases"].items()}
+    if curve["threads"]:
+        with cache.atomic(_curve_path(case)) as tmp:
+            with open(tmp, "w") as f:
+                json.dump(curve, f, indent=1)
+    return curve
+
+
+def load(case):
+    """the stored curve of a case, or None"""
+    try:
+        with open(_curve_path(case)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def speedup(threads, walls):
+    """{threads: speedup over the smallest thread count}"""
+    points = [(n, wall) for n, wall in zip(threads, walls) if wall]
+    if not points:
+        return {}
+    base = points[0][1]
+    return {n: base / wall for n, wall in points}
+
+
+def table(curve):
+    phases = [phase for phase in PHASES.values() if phase in curve["phases"]]
+    lines = ["%7s %10s %8s %6s" % ("threads", "wall s", "speedup", "eff")
+             + "".join(" %12s" % phase for phase in phases)]
+    total = speedup(curve["threads"], curve["wall_s"])
+    per_phase = {phase: speedup(curve["threads"], curve["phases"][phase]) for phase in phases}
+    for n, wall in zip(curve["threads"], curve["wall_s"]):
+        lines.append("%7d %10.2f %8.2f %6.2f" % (n, wall, total[n], total[n] / n)
+                     + "".join(" %11.2fx" % per_phase[phase].get(n, float("nan")) for phase in phases))
+    return "\n".join(lines)
+
+# ----------------------------------------------------------------------------- #
+#
+# OTHER JOBS ON THE HOST
+
+def _job_dir():
+    return cache.directory("jobs")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def jobs():
+    """running meshtools jobs that registered a thread count (stale entries are removed)"""
+    running = []
+    for name in sorted(os.listdir(_job_dir())):
+        path = os.path.join(_job_dir(), name)
+        try:
+            with open(path) as f:
+                job = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if job["pid"] == os.getpid():
+            continue
+        if _alive(job["pid"]):
+            running.append(job)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return running
+
+
+def register(name, n):
+    """record this process as a job using n threads, until it exits"""
+    path = os.path.join(_job_dir(), "%d.json" % os.getpid())
+    with cache.atomic(path) as tmp:
+        with open(tmp, "w") as f:
+            json.dump({"pid": os.getpid(), "name": name, "threads": n,
+                       "started": datetime.datetime.now().isoformat(timespec="seconds")}, f)
+    atexit.register(lambda: os.path.exists(path) and os.remove(path))
+
+
+def free_cpus():
+    """cores not used by other jobs, at least 1"""
+    cpus = os.cpu_count() or 1
+    busy = sum(job["threads"] for job in jobs())
+    # the load average also sees jobs that aren't ours, but lags behind a
+    # job that has just started, which the registrations don't
+    if hasattr(os, "getloadavg"):
+        busy = max(busy, round(os.getloadavg()[0]))
+    return max(1, cpus - busy)
+
+# ----------------------------------------------------------------------------- #
+#
+# CHOOSING
+
+def _pick(points, limit):
+    """smallest thread count <= limit within SLACK of the best speedup"""
+    fits = {n: s for n, s in points.items() if n <= limit}
+    if not fits:
+        return 1
+    best = max(fits.values())
+    return min(n for n, s in fits.items() if s >= (1 - SLACK)*best)
+
+
+def choose(case, free=None):
+    """(threads, {dim: threads}, reason) for a run of case"""
+    free = free_cpus() if free is None else free
+    curve = load(case)
+    if not curve or not curve["threads"]:
+        return 1, {}, "no scaling curve for %s" % case
+    n = _pick(speedup(curve["threads"], curve["wall_s"]), free)
+    per_dim = {}
+    threaded = curve.get("threaded", [dim for dim in PHASES if dim not in SERIAL])
+    for dim, phase in PHASES.items():
+        # a phase measured on one thread says nothing about more
+        if phase in curve["phases"] and dim in threaded:
+            per_dim[dim] = _pick(speedup(curve["threads"], curve["phases"][phase]), free)
+    n = max([n] + list(per_dim.values()))
+    return n, per_dim, "scaling curve of %s, %d free cores" % (case, free)
+
+
+def apply(n, per_dim=None):
+    """set General.NumThreads and Mesh.MaxNumThreads<dim>D, SERIAL
+    dimensions on one thread unless per_dim has them"""
+    gmsh.option.setNumber("General.NumThreads", n)
+    for dim in PHASES:
+        default = 1 if dim in SERIAL else 0
+        gmsh.option.setNumber("Mesh.MaxNumThreads%dD" % dim, (per_dim or {}).get(dim, default))
+
+
+def auto(case):
+    """pick and set the thread count of this run, returns it"""
+    if "-nt" in sys.argv:
+        n, reason = int(gmsh.option.getNumber("General.NumThreads")), "-nt on the command line"
+        apply(n)
+    else:
+        n, per_dim, reason = choose(case)
+        apply(n, per_dim)
+        if per_dim:
+            reason += " (%s)" % ", ".join("%dD: %d" % item for item in sorted(per_dim.items()))
+    register(case, n)
+    print("using %d thread%s: %s" % (n, "" if n == 1 else "s", reason))
+    return n
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    from meshtools import bench
+
+    parser = argparse.ArgumentParser(prog="python -m meshtools.threads",
+                                     description="thread scaling study and thread count selection")
+    commands = parser.add_subparsers(dest="command", required=True)
+    scale_parser = commands.add_parser("scale", help="mesh a case at 1..N threads and store the curve")
+    scale_parser.add_argument("case", choices=list(bench.CASES))
+    scale_parser.add_argument("--size", default="medium", choices=bench.SIZES)
+    scale_parser.add_argument("--max", type=int, default=os.cpu_count() or 1,
+                              help="largest thread count (default: all cores)")
+    scale_parser.add_argument("--threads", help="comma separated thread counts instead of 1, 2, 4 .. max")
+    scale_parser.add_argument("-r", "--repeat", type=int, default=1, help="runs per count, the fastest counts")
+    choose_parser = commands.add_parser("choose", help="the thread count a run would use now")
+    choose_parser.add_argument("case")
+    commands.add_parser("jobs", help="running meshtools jobs and their threads")
+    args = parser.parse_args(argv)
+
+    if args.command == "scale":
+        thread_counts = [int(n) for n in args.threads.split(",")] if args.threads else counts(args.max)
+        curve = scale(args.case, args.size, thread_counts, args.repeat)
+        if not curve["threads"]:
+            return 1
+        print(table(curve))
+        print("curve saved to " + _curve_path(args.case))
+    elif args.command == "choose":
+        curve = load(args.case)
+        if curve:
+            print(table(curve))
+        n, per_dim, reason = choose(args.case)
+        print("%d threads: %s" % (n, reason))
+        for dim, count in sorted(per_dim.items()):
+            print("  Mesh.MaxNumThreads%dD = %d" % (dim, count))
+    else:
+        for job in jobs():
+            print("%8d %-28s %3d threads  since %s" % (job["pid"], job["name"], job["threads"], job["started"]))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+# ----------------------------------------------------------------------------- #
+#  mesh quality and impact zone element size check of the current mesh
+# ----------------------------------------------------------------------------- #
+#
+# the README says to check the element size in the impact zone in LS-PrePost
+# after every run. verify() does that check on the mesh in gmsh, right after
+# generate / refine:
+#
+#   result = verify.verify(line=tags["line"], bins=[0, r2, r1])
+#   print(verify.table(result))
+#
+# or, in a script with a run report, report.verify(tags["line"], [0, r2, r1]),
+# which also puts the result in the report json. for a mesh file:
+#
+#   python -m meshtools.verify ustruct-refined.msh --axis 0.05,0.05,0,0.05,0.05,0.005 \
+#       --bins 0,0.01,0.0125
+#
+# the elements of the highest dimension are checked:
+#
+#   minSICN          gmsh's quality measure, from getElementQualities
+#   scaled jacobian  smallest over the corners of each element (1 for a
+#                    cube or a regular tet, <= 0 inverted); quads and
+#                    triangles take gmsh's minSJ instead
+#   aspect ratio     longest / shortest edge of each element
+#   size             mean edge length of each element
+#
+# and the size is binned by the distance of the element centre to line l
+# (the zones start at the given bin edges, the last one runs to the edge of
+# the mesh). everything is computed with numpy on the node and element
+# arrays, `chunk` elements at a time, so a few million elements take seconds.
+
+import argparse
+import json
+import sys
+
+import gmsh
+import numpy as np
+
+from meshtools import localrefine
+
+model = gmsh.model
+mesh = model.mesh
+
+# elements at a time
+CHUNK = 50000
+
+# percentiles of minSICN and the scaled jacobian that are reported
+PERCENTILES = [0, 1, 5, 50]
+
+# the edges of each gmsh element type as pairs of local nodes
+_EDGES = {
+    2: [(0, 1), (1, 2), (2, 0)],
+    3: [(0, 1), (1, 2), (2, 3), (3, 0)],
+    4: [(0, 1), (1, 2), (2, 0), (0, 3), (1, 3), (2, 3)],
+    5: [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 7), (7, 4), (0, 4), (1, 5), (2, 6), (3, 7)],
+    6: [(0, 1), (1, 2), (2, 0), (3, 4), (4, 5), (5, 3), (0, 3), (1, 4), (2, 5)],
+    7: [(0, 1), (1, 2), (2, 3), (3, 0), (0, 4), (1, 4), (2, 4), (3, 4)],
+}
+
+# the corners of the solids as (corner, three neighbours in right hand order)
+_CORNERS = {
+    4: [(0, 1, 2, 3), (1, 2, 0, 3), (2, 0, 1, 3), (3, 0, 2, 1)],
+    5: [(0, 1, 3, 4), (1, 2, 0, 5), (2, 3, 1, 6), (3, 0, 2, 7),
+        (4, 7, 5, 0), (5, 4, 6, 1), (6, 5, 7, 2), (7, 6, 4, 3)],
+    6: [(0, 1, 2, 3), (1, 2, 0, 4), (2, 0, 1, 5), (3, 5, 4, 0), (4, 3, 5, 1), (5, 4, 3, 2)],
+    7: [(0, 1, 3, 4), (1, 2, 0, 4), (2, 3, 1, 4), (3, 0, 2, 4)],
+}
+
+# a regular tet's corners have a scaled jacobian of 1/sqrt(2)
+_JACOBIAN_SCALE = {4: np.sqrt(2)}
+
+_NAMES = {2: "triangles", 3: "quadrangles", 4: "tetrahedra", 5: "hexahedra", 6: "prisms", 7: "pyramids"}
+
+# ----------------------------------------------------------------------------- #
+#
+# CHECK
+
+def _coordinates():
+    """node coordinates indexed by node tag"""
+    tags, coords, _ = mesh.getNodes(returnParametricCoord=False)
+    xyz = np.zeros((int(tags.max()) + 1 if len(tags) else 0, 3))
+    xyz[tags] = coords.reshape(-1, 3)
+    return xyz
+
+
+def _measures(points, element_type):
+    """shortest, longest and mean edge, smallest scaled jacobian (or None) and
+    centre of (n, nodes, 3) element points
+
+    one edge or corner of all the elements at a time, on the coordinate
+    components as flat arrays: much faster than numpy on (n, 8, 3, 3) arrays
+    """
+    p = np.ascontiguousarray(points.transpose(1, 2, 0))
+    low = np.full(len(points), np.inf)
+    high = np.zeros(len(points))
+    total = np.zeros(len(points))
+    for i, j in _EDGES[element_type]:
+        d = p[j] - p[i]
+        length = np.sqrt(d[0]*d[0] + d[1]*d[1] + d[2]*d[2])
+        np.minimum(low, length, out=low)
+        np.maximum(high, length, out=high)
+        total += length
+    jacobian = None
+    if element_type in _CORNERS:
+        jacobian = np.full(len(points), np.inf)
+        for c, i, j, k in _CORNERS[element_type]:
+            a, b, e = p[i] - p[c], p[j] - p[c], p[k] - p[c]
+            det = (a[0]*(b[1]*e[2] - b[2]*e[1]) + a[1]*(b[2]*e[0] - b[0]*e[2])
+                   + a[2]*(b[0]*e[1] - b[1]*e[0]))
+            norms = np.sqrt((a*a).sum(axis=0) * (b*b).sum(axis=0) * (e*e).sum(axis=0))
+            np.minimum(jacobian, det / np.maximum(norms, 1e-300), out=jacobian)
+        jacobian = np.minimum(jacobian * _JACOBIAN_SCALE.get(element_type, 1), 1)
+    return low, high, total / len(_EDGES[element_type]), jacobian, p.mean(axis=0).T
+
+
+def _percentiles(values):
+    return {"p%d" % p: round(float(v), 4) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+
+def verify(line=None, bins=None, chunk=CHUNK):
+    """quality, jacobian, aspect ratio and element size statistics of the
+    current mesh, and the size binned by distance to line l
+
+    `line` is a curve tag or a pair of end points; without it there are no
+    zones. `bins` are the distances the zones start at, by default 0 and
+    1/64 .. 1/2 of the largest distance.
+    """
+    dim = 3 if any(mesh.getElementTypes(3)) else 2
+    types = [t for t in mesh.getElementTypes(dim) if t in _EDGES]
+    if not types:
+        raise ValueError("no linear elements of dimension %d to check" % dim)
+    if line is not None:
+        a, b = localrefine.curve_ends(line) if np.isscalar(line) else map(np.asarray, line)
+    xyz = _coordinates()
+
+    quality, jacobian, aspect, size, shortest, longest, distance = ([] for _ in range(7))
+    counts = {}
+    for element_type in types:
+        tags, node_tags = mesh.getElementsByType(element_type)
+        node_tags = node_tags.reshape(len(tags), -1)
+        counts[_NAMES[element_type]] = len(tags)
+        quality.append(mesh.getElementQualities(tags, "minSICN").astype(np.float32))
+        if element_type not in _CORNERS:
+            jacobian.append(mesh.getElementQualities(tags, "minSJ").astype(np.float32))
+        for start in range(0, len(tags), chunk):
+            low, high, mean, corners, centres = _measures(xyz[node_tags[start:start + chunk]], element_type)
+            if corners is not None:
+                jacobian.append(corners.astype(np.float32))
+            shortest.append(low.min())
+            longest.append(high.max())
+            aspect.append((high / np.maximum(low, 1e-300)).astype(np.float32))
+            size.append(mean.astype(np.float32))
+            if line is not None:
+                distance.append(localrefine.segment_distance(centres, a, b).astype(np.float32))
+    quality, jacobian, aspect, size = map(np.concatenate, (quality, jacobian, aspect, size))
+
+    result = {
+        "dim": dim, "elements": int(len(size)), "types": counts,
+        "minSICN": dict(_percentiles(quality), mean=round(float(quality.mean()), 4)),
+        "scaled_jacobian": dict(_percentiles(jacobian), mean=round(float(jacobian.mean()), 4),
+                                inverted=int((jacobian <= 0).sum())),
+        "aspect_ratio": {"mean": round(float(aspect.mean()), 3),
+                         "p95": round(float(np.percentile(aspect, 95)), 3),
+                         "p99": round(float(np.percentile(aspect, 99)), 3),
+                         "max": round(float(aspect.max()), 3)},
+        "edge": {"min": float(min(shortest)), "mean": float(size.mean()), "max": float(max(longest))},
+    }
+    if line is not None:
+        distance = np.concatenate(distance)
+        if bins is None:
+            bins = [0] + [float(distance.max()) / 2**k for k in range(6, 0, -1)]
+        bins = sorted(bins)
+        zone = np.searchsorted(bins, distance, side="right") - 1
+        result["zones"] = []
+        for i, start in enumerate(bins):
+            inside = zone == i
+            row = {"from": start, "to": bins[i + 1] if i + 1 < len(bins) else None,
+                   "elements": int(inside.sum())}
+            if row["elements"]:
+                row.update(size_min=float(size[inside].min()), size_mean=float(size[inside].mean()),
+                           size_max=float(size[inside].max()), minSICN_min=round(float(quality[inside].min()), 4))
+            result["zones"].append(row)
+    return result
+
+
+def inverted(chunk=CHUNK):
+    """no. of elements of the highest dimension with a scaled jacobian <= 0,
+    the inverted count of verify() without the rest of its statistics"""
+    dim = 3 if any(mesh.getElementTypes(3)) else 2
+    xyz = _coordinates()
+    count = 0
+    for element_type in mesh.getElementTypes(dim):
+        if element_type not in _EDGES:
+            continue
+        tags, node_tags = mesh.getElementsByType(element_type)
+        if element_type not in _CORNERS:
+            count += int((mesh.getElementQualities(tags, "minSJ") <= 0).sum())
+            continue
+        node_tags = node_tags.reshape(len(tags), -1)
+        for start in range(0, len(tags), chunk):
+            jacobian = _measures(xyz[node_tags[start:start + chunk]], element_type)[3]
+            count += int((jacobian <= 0).sum())
+    return count
+
+
+def table(result):
+    """the result of verify() as text"""
+    counts = ", ".join("%d %s" % (n, name) for name, n in result["types"].items())
+    q, j, r, e = result["minSICN"], result["scaled_jacobian"], result["aspect_ratio"], result["edge"]
+    lines = [
+        "verify: " + counts,
+        "  minSICN          min %.3f  p1 %.3f  p5 %.3f  p50 %.3f  mean %.3f"
+        % (q["p0"], q["p1"], q["p5"], q["p50"], q["mean"]),
+        "  scaled jacobian  min %.3f  p1 %.3f  p5 %.3f  p50 %.3f  mean %.3f  inverted %d"
+        % (j["p0"], j["p1"], j["p5"], j["p50"], j["mean"], j["inverted"]),
+        "  aspect ratio     mean %.2f  p95 %.2f  p99 %.2f  max %.2f" % (r["mean"], r["p95"], r["p99"], r["max"]),
+        "  edge length      min %.3g  mean %.3g  max %.3g" % (e["min"], e["mean"], e["max"]),
+    ]
+    if "zones" in result:
+        lines.append("  %-21s %10s %10s %10s %10s %8s" % ("distance to line l", "elements", "size min",
+                                                          "mean", "max", "minSICN"))
+        for row in result["zones"]:
+            span = "%.3g - %s" % (row["from"], "" if row["to"] is None else "%.3g" % row["to"])
+            if row["elements"]:
+                lines.append("  %-21s %10d %10.3g %10.3g %10.3g %8.3f" % (
+                    span, row["elements"], row["size_min"], row["size_mean"], row["size_max"], row["minSICN_min"]))
+            else:
+                lines.append("  %-21s %10d" % (span, 0))
+    return "\n".join(lines)
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def _floats(text):
+    return [float(value) for value in text.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m meshtools.verify",
+                                     description="quality and impact zone element size of a mesh file")
+    parser.add_argument("mesh")
+    line = parser.add_mutually_exclusive_group()
+    line.add_argument("--curve", type=int, help="tag of line l in the mesh file")
+    line.add_argument("--axis", type=_floats, metavar="X0,Y0,Z0,X1,Y1,Z1", help="end points of line l")
+    parser.add_argument("--bins", type=_floats, help="comma separated distances the zones start at")
+    parser.add_argument("--json", help="also write the result here")
+    args = parser.parse_args(argv)
+
+    gmsh.initialize()
+    gmsh.option.setNumber("General.Terminal", 0)
+    try:
+        gmsh.open(args.mesh)
+        line = args.curve if args.curve is not None else (
+            (args.axis[:3], args.axis[3:]) if args.axis else None)
+        result = verify(line, args.bins)
+    finally:
+        gmsh.finalize()
+    print(table(result))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=1)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,323 @@
+# ----------------------------------------------------------------------------- #
+#  long-lived gmsh process that keeps the target geometries loaded
+# ----------------------------------------------------------------------------- #
+#
+# every run of a script, and every run of a sweep, pays for starting python,
+# importing gmsh, gmsh.initialize and building (or loading) the geometry
+# before it meshes anything, which is most of the time of a small-lc run. a
+# worker does that once and then meshes jobs until it's stopped:
+#
+#   python -m meshtools.worker serve                    # json lines on stdin / stdout
+#   python -m meshtools.worker serve --socket [path]    # or on a unix socket
+#
+#   python -m meshtools.worker submit plate -s lcsmaller=lc/60 -O Mesh.Algorithm=5 -w plate.msh
+#   python -m meshtools.worker status
+#   python -m meshtools.worker stop
+#
+# a job is one line of json, the reply is one line of json per job:
+#
+#   {"kind": "plate", "params": {"lcsmaller": "lc/60"}, "options": {"Mesh.Algorithm": 5},
+#    "write": "plate.msh", "zone": 0.005, "id": 7}
+#   {"id": 7, "kind": "plate", "status": "ok", "geometry": "warm", "setup_s": 0.001,
+#    "elements": 52340, ..., "wall_s": 1.2}
+#
+# params are overrides of targets.DEFAULTS as for the sweep runner, options
+# are gmsh options set on top of the target's (targets.RECOMBINE_OPTIONS).
+# {"command": "status"} and {"command": "stop"} are the other messages.
+#
+# the geometry of each target (by kind and its geometry parameters,
+# targets.GEOMETRY) is kept in its own gmsh model, up to MAX_MODELS of
+# them. a job switches to its model, clears the mesh, the fields and the
+# size callback the previous job left (mesh.clear, not a new model), resets
+# every option to gmsh's default plus the target's, and adds its own fields.
+# a job with symmetry 2 or 4 replaces its model by the mirrored mesh, so that
+# geometry is built again for the next one.
+#
+# the sweep runner uses workers with `--warm` (see sweep.py).
+
+import argparse
+import collections
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+import gmsh
+
+from meshtools import cache, stats, targets, threads, verify
+from meshtools.options import option
+
+model = gmsh.model
+mesh = model.mesh
+
+# geometries kept loaded, the least recently used is removed first
+MAX_MODELS = 8
+
+# unix socket of `serve --socket` when no path is given
+SOCKET = os.path.join(cache.ROOT, "worker.sock")
+
+
+class Worker:
+    """gmsh initialised once, meshing job after job on kept geometries"""
+
+    def __init__(self, threads=1, max_models=MAX_MODELS):
+        self.threads = threads
+        self.max_models = max_models
+        # geometry key -> (model name, tags)
+        self.models = collections.OrderedDict()
+        self.jobs = 0
+        self.started = time.perf_counter()
+        gmsh.initialize()
+        self._reset_options()
+
+    def close(self):
+        gmsh.finalize()
+
+    def _reset_options(self, overrides=None):
+        """gmsh's defaults, then the target options, then `overrides`"""
+        gmsh.option.restoreDefaults()
+        option.clear()
+        gmsh.option.setNumber("General.Terminal", 0)
+        threads.apply(self.threads)
+        targets.set_options(targets.RECOMBINE_OPTIONS)
+        for name, value in (overrides or {}).items():
+            if isinstance(value, str):
+                option.setString(name, value)
+            else:
+                option.setNumber(name, value)
+
+    # ---- geometries ---- #
+
+    def geometry(self, kind, p):
+        """switch to the model of the geometry of `p`, building it if it isn't
+        loaded; returns (key, tags, warm)"""
+        key = cache.key(kind, {name: p[name] for name in targets.GEOMETRY[kind]})
+        if key in self.models:
+            self.models.move_to_end(key)
+            name, tags = self.models[key]
+            model.setCurrent(name)
+            # only used with Mesh.MeshSizeFromPoints, but as a fresh build would have them
+            mesh.setSize(model.getEntities(0), p["lc"])
+            return key, dict(tags), True
+
+        while len(self.models) >= self.max_models:
+            self.forget(next(iter(self.models)))
+        name = "%s-%s" % (kind, key[:12])
+        model.add(name)
+        tags = targets.build_geometry(kind, p)
+        self.models[key] = (name, dict(tags))
+        return key, tags, False
+
+    def forget(self, key):
+        """remove a kept geometry"""
+        name, _ = self.models.pop(key)
+        model.setCurrent(name)
+        model.remove()
+
+    def _clear(self):
+        """what the last job on the current model left: mesh, fields, size
+        callback and the views of sampled backgrounds"""
+        mesh.clear()
+        for field in mesh.field.list():
+            mesh.field.remove(field)
+        mesh.removeSizeCallback()
+        for view in gmsh.view.getTags():
+            gmsh.view.remove(view)
+
+    # ---- jobs ---- #
+
+    def run(self, job):
+        """mesh one job and return its result row"""
+        kind = job.get("kind", "plate")
+        overrides = job.get("params") or {}
+        row = {"id": job.get("id"), "kind": kind, "status": "ok"}
+        start_time = time.perf_counter()
+        start_cpu = time.process_time()
+        key = None
+        try:
+            p = targets.resolve(kind, overrides)
+            row.update({name: p[name] for name in overrides})
+            self._reset_options(job.get("options"))
+            key, tags, warm = self.geometry(kind, p)
+            self._clear()
+            tags = targets.build_fields(kind, p, tags)
+            row["geometry"] = "warm" if warm else "built"
+            row["setup_s"] = round(time.perf_counter() - start_time, 3)
+
+            targets.generate(p, tags=tags)
+            if job.get("write"):
+                gmsh.write(job["write"])
+            row.update(stats.mesh_counts())
+            if job.get("zone") is not None:
+                row["zone_size"] = verify.verify(tags["line"], [0, job["zone"]])["zones"][0].get("size_mean")
+            summary = tags["sizing"].summary()
+            row.update({name: summary[name] for name in ("callback_calls", "callback_s")})
+            row["sizing"] = summary["mode"]
+            # the mirrored mesh replaced the geometry in its model
+            if p["symmetry"] != 1:
+                self.forget(key)
+        except Exception:
+            row["status"] = traceback.format_exc(limit=1).strip().splitlines()[-1]
+            # don't mesh on whatever state a failed job left
+            if key in self.models:
+                self.forget(key)
+        finally:
+            self.jobs += 1
+            row["wall_s"] = round(time.perf_counter() - start_time, 3)
+            row["cpu_s"] = round(time.process_time() - start_cpu, 3)
+            # of the worker so far, not of this job
+            row["peak_rss_mb"] = round(stats.peak_rss_mb(), 1)
+            row["rss_mb"] = round(stats.rss_mb() or 0.0, 1)
+        return row
+
+    def status(self):
+        return {"status": "ok", "jobs": self.jobs, "models": [name for name, _ in self.models.values()],
+                "threads": self.threads, "rss_mb": round(stats.rss_mb() or 0.0, 1),
+                "up_s": round(time.perf_counter() - self.started, 1)}
+
+    def handle(self, message):
+        """the reply to one message, and whether to stop"""
+        command = message.get("command", "mesh")
+        if command == "mesh":
+            return self.run(message), False
+        if command == "status":
+            return self.status(), False
+        if command == "stop":
+            return {"status": "stopped", "jobs": self.jobs}, True
+        return {"id": message.get("id"), "status": "unknown command %r" % command}, False
+
+# ----------------------------------------------------------------------------- #
+#
+# SERVING
+
+def serve_stream(worker, lines, out):
+    """answer the json lines of `lines` on `out`, True if told to stop"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            message = json.loads(line)
+        except ValueError as error:
+            reply, stop = {"status": "bad json: %s" % error}, False
+        else:
+            reply, stop = worker.handle(message)
+        out.write(json.dumps(reply) + "\n")
+        out.flush()
+        if stop:
+            return True
+    return False
+
+
+def serve(worker, path=None):
+    """jobs from stdin, or from the connections to a unix socket at `path`,
+    one connection at a time"""
+    if path is None:
+        # replies go to the real stdout, anything gmsh prints to stderr
+        out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+        serve_stream(worker, sys.stdin, out)
+        return
+
+    if os.path.exists(path):
+        try:
+            socket.socket(socket.AF_UNIX).connect(path)
+        except OSError:
+            # left by a worker that didn't stop cleanly
+            os.unlink(path)
+        else:
+            raise RuntimeError("a worker is already listening on " + path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen()
+    print("worker listening on " + path, file=sys.stderr)
+    try:
+        stop = False
+        while not stop:
+            connection, _ = server.accept()
+            with connection, connection.makefile("r") as lines, connection.makefile("w") as out:
+                try:
+                    stop = serve_stream(worker, lines, out)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+    finally:
+        server.close()
+        os.unlink(path)
+
+
+def request(messages, path=SOCKET):
+    """send messages to the worker at `path`, yields the replies in order"""
+    with socket.socket(socket.AF_UNIX) as connection:
+        connection.connect(path)
+        with connection.makefile("r") as lines, connection.makefile("w") as out:
+            for message in messages:
+                out.write(json.dumps(message) + "\n")
+                out.flush()
+                reply = lines.readline()
+                if not reply:
+                    raise ConnectionError("the worker at %s closed the connection" % path)
+                yield json.loads(reply)
+
+# ----------------------------------------------------------------------------- #
+#
+# COMMAND LINE
+
+def main(argv=None):
+    from meshtools import sweep
+
+    parser = argparse.ArgumentParser(prog="python -m meshtools.worker",
+                                     description="mesh jobs in a long-lived gmsh process")
+    commands = parser.add_subparsers(dest="command", required=True)
+    serve_parser = commands.add_parser("serve", help="mesh jobs from stdin or a unix socket")
+    serve_parser.add_argument("--socket", nargs="?", const=SOCKET, metavar="PATH",
+                              help="listen on a unix socket (default path: %s)" % SOCKET)
+    serve_parser.add_argument("-t", "--threads", type=int, default=1, help="gmsh threads (default: 1)")
+    serve_parser.add_argument("--max-models", type=int, default=MAX_MODELS,
+                              help="geometries kept loaded (default: %d)" % MAX_MODELS)
+    submit_parser = commands.add_parser("submit", help="mesh one job on a running worker")
+    submit_parser.add_argument("kind", choices=sorted(targets.DEFAULTS))
+    submit_parser.add_argument("-s", "--set", action="append", metavar="NAME=VALUE",
+                               help="target parameter, as for the sweep runner")
+    submit_parser.add_argument("-O", "--option", action="append", metavar="NAME=VALUE",
+                               help="gmsh option, e.g. Mesh.Algorithm=5")
+    submit_parser.add_argument("-w", "--write", help="write the mesh to this file")
+    submit_parser.add_argument("--zone", type=float, help="also the mean element size within this distance of line l")
+    for name, text in (("status", "what a running worker holds"), ("stop", "stop a running worker")):
+        commands.add_parser(name, help=text)
+    for sub in commands.choices.values():
+        if sub is not serve_parser:
+            sub.add_argument("--socket", default=SOCKET, metavar="PATH", help="(default: %s)" % SOCKET)
+    args = parser.parse_args(argv)
+
+    if args.command == "serve":
+        worker = Worker(args.threads, args.max_models)
+        try:
+            serve(worker, args.socket)
+        except KeyboardInterrupt:
+            pass
+        except RuntimeError as error:
+            print(error, file=sys.stderr)
+            return 1
+        finally:
+            worker.close()
+        return 0
+
+    if args.command == "submit":
+        message = {"kind": args.kind, "params": sweep.parse_overrides(args.set),
+                   "options": sweep.parse_overrides(args.option)}
+        if args.write:
+            message["write"] = os.path.abspath(args.write)
+        if args.zone is not None:
+            message["zone"] = args.zone
+    else:
+        message = {"command": args.command}
+    reply = next(request([message], args.socket))
+    print(json.dumps(reply, indent=1))
+    return 0 if reply["status"] in ("ok", "stopped") else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
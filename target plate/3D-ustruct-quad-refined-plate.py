@@ -10,6 +10,11 @@ import sys
 import os
 import numpy as np
 
+# time, memory and mesh counts of each stage are written to a JSON run report
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, background
+from meshtools.report import Report
+
 gmsh.initialize(sys.argv)
 
 model = gmsh.model 
@@ -18,6 +23,8 @@ option = gmsh.option
 
 model.add("t6")
 
+report = Report("3D-ustruct-quad-refined-plate")
+
 # ----------------------------------------------------------------------------- #
 # 
 # MESHING OPTIONS
@@ -94,6 +101,8 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # mesh size definitions
 #   lc = generic mesh size
 #   lcmin = minimum refined mesh size
@@ -183,6 +192,8 @@ model.geo.synchronize()
 # 
 # MESH REFINEMENT 
 
+report.start("fields")
+
 # define a line via two points around which to refine the mesh
 ps = model.geo.addPoint(ll, ll, 0, lc)
 pf = model.geo.addPoint(ll, ll, h, lc)
@@ -234,7 +245,15 @@ mesh.field.setNumber(5, "ZAxis", 1)
 mesh.field.add("Min", 7)
 mesh.field.setNumbers(7, "FieldsList", [2, 4, 5])
 
-mesh.field.setAsBackgroundMesh(7)  
+# -setstring background sampled evaluates this Min field once in numpy on a
+# cached grid and uses that as the background mesh instead (meshtools/background.py).
+# l is line l by now, the plate is 2*ll wide
+if args.string("background", "fields") == "sampled":
+    info = background.apply("plate", dict(
+        lc=lc, lcsmaller=lc1, lcsmallest=lc2, r1=r1, r2=r2, F="2.5*F1^2", h=h, l=2*ll), (ll, ll))[1]
+    report.info["background"] = info
+else:
+    mesh.field.setAsBackgroundMesh(7)
 
 model.geo.synchronize()
 
@@ -243,17 +262,20 @@ model.geo.synchronize()
 # GENERATE MESH AND WRITE TO FILE 
 
 # generate 3D mesh
-mesh.generate(3)
+report.generate(3)
 
 # optimise and refine the mesh
-mesh.optimize("UntangleMeshGeometry", force=True, niter=1)
+report.optimize("UntangleMeshGeometry", force=True, niter=1)
 # mesh.optimize("QuadCavityRemeshing", force=True)
 # mesh.optimize("QuadQuasiStructured", force=True, niter=3)
 
-mesh.refine()
+report.refine()
 
 thepath = "/Users/adminuser/meshes"; os.chdir(thepath)
-gmsh.write("ustruct-refined.msh")
+report.write("ustruct-refined.msh")
+
+# print the time per stage and write it all to ustruct-refined-report.json
+report.finish()
 
 # # launch the GUI to see the results:
 # if '-nopopup' not in sys.argv:
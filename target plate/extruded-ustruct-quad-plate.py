@@ -4,67 +4,79 @@
 #                  refined and extruded 3D mesh for ballistic impact
 # ------------------------------------------------------------------------------
 
-# In addition to specifying target mesh sizes at the points of the geometry (see
-# `t1.py') or using a background mesh (see `t7.py'), you can use general mesh
-# size "Fields".
+# the bottom face of the plate is meshed in quadrangles with the same
+# refinement around the impact point as plate-ustruct-hex.py (Distance ->
+# MathEval and two Cylinder fields), and extruded through the thickness in
+# graded layers. there is no 3D meshing or recombination, and every element
+# is a hexahedron.
 
 import gmsh
 import sys
 import os
 
+# the surface, fields and extrusion are in meshtools/extrude.py, the time,
+# memory and mesh counts of each stage go to a JSON run report
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, extrude
+from meshtools.report import Report
+
 gmsh.initialize(sys.argv)
 
 gmsh.model.add("t10")
 
-# Let's create a simple rectangular geometry:
-lc = .15
-gmsh.model.geo.addPoint(0.0, 0.0, 0, lc, 1)
-gmsh.model.geo.addPoint(1, 0.0, 0, lc, 2)
-gmsh.model.geo.addPoint(1, 1, 0, lc, 3)
-gmsh.model.geo.addPoint(0, 1, 0, lc, 4)
-gmsh.model.geo.addPoint(0.5, .5, 0, lc, 5)
-
-gmsh.model.geo.addLine(1, 2, 1)
-gmsh.model.geo.addLine(2, 3, 2)
-gmsh.model.geo.addLine(3, 4, 3)
-gmsh.model.geo.addLine(4, 1, 4)
-
-gmsh.model.geo.addCurveLoop([1, 2, 3, 4], 5)
-
-gmsh.model.geo.addPlaneSurface([5], 6)
-
-gmsh.model.geo.mesh.setRecombine(2, 6)
-
-# We could also combine MathEval with values coming from other fields. For
-# example, let's define a `Distance' field around point 5
-gmsh.model.mesh.field.add("Distance", 4)
-gmsh.model.mesh.field.setNumbers(4, "PointsList", [5])
-
-# We can then create a `MathEval' field with a function that depends on the
-# return value of the `Distance' field 4, i.e., depending on the distance to
-# point 5 (here using a cubic law, with minimum element size = lc / 100)
-gmsh.model.mesh.field.add("MathEval", 5)
-gmsh.model.mesh.field.setString(5, "F", "F4^2 +" + str(lc / 10))
+report = Report("extruded-ustruct-quad-plate")
 
-
-# Let's use the minimum of all the fields as the mesh size field:
-gmsh.model.mesh.field.add("Min", 7)
-gmsh.model.mesh.field.setNumbers(7, "FieldsList", [5])
-
-gmsh.model.mesh.field.setAsBackgroundMesh(7)
-
-# The API also allows to set a global mesh size callback, which is called each
-# time the mesh size is queried
-def meshSizeCallback(dim, tag, x, y, z, lc):
-    return lc / 8
-
-gmsh.model.mesh.setSizeCallback(meshSizeCallback)
-
-# -clmin value -might need these
-# Set minimum mesh element size (Mesh.MeshSizeMin)
-
-# -clmax value
-# Set maximum mesh element size (Mesh.MeshSizeMax)
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY AND MESH REFINEMENT
+
+# mesh size definitions, as in plate-ustruct-hex.py
+#   lc = generic mesh size
+#   lcmin = minimum refined mesh size
+#   lcmax = max refined mesh size
+#   lcsmaller = outer cylinder of semi-refined mesh size
+#   lcsmallest = inner cylinder of fully refined mesh size
+#   r1 = radius of semi-refined outer cylinder
+#   r2 = radius of refined inner cylinder
+#   F = size function of the distance F1 to the impact point (lcsmallest is added to it)
+#
+# layer definitions
+#   layers = elements through the thickness (0: h / lcsmallest), or their relative thicknesses
+#   layer_growth = thickness ratio of neighbouring layers from the top face down
+#
+# plate geometry definitions
+#   h = height; l = length
+
+# (-setnumber lc <value> on the command line overrides it, see meshtools/args.py)
+lc = args.number("lc", 1e-1)
+lcsmaller = lc/50
+lcsmallest= lc/100
+lcmin = lc/200
+lcmax = 1
+
+h = 0.005
+l = 0.1
+
+r1 = l/8
+r2 = l/10
+
+F = "2.5*F1^2"
+
+# -setnumber layers <n> / layer_growth <ratio>, or a list of layer thicknesses
+# in proportion, bottom up, e.g. -setstring layers 4,2,1,1
+layers = args.string("layers", "")
+if "," in layers:
+    layers = [float(t) for t in layers.split(",")]
+else:
+    layers = int(args.number("layers", float(layers or 0))) or None
+layer_growth = args.number("layer_growth", 1.2)
+
+params = extrude.resolve(dict(
+    lc=lc, lcsmaller=lcsmaller, lcsmallest=lcsmallest, lcmin=lcmin, lcmax=lcmax,
+    h=h, l=l, r1=r1, r2=r2, F=F, layers=layers, layer_growth=layer_growth,
+    # size callback, removes any elements that are too small
+    callback="max(lc, 0.0001)",
+))
 
 # To determine the size of mesh elements, Gmsh locally computes the minimum of
 #
@@ -78,56 +90,31 @@ gmsh.model.mesh.setSizeCallback(meshSizeCallback)
 #
 # The value can then be further modified by the mesh size callback, if any,
 # before being constrained in the interval [`Mesh.MeshSizeMin',
-# `Mesh.MeshSizeMax'] and multiplied by `Mesh.MeshSizeFactor'.  In addition,
-# boundary mesh sizes are interpolated inside surfaces and/or volumes depending
-# on the value of `Mesh.MeshSizeExtendFromBoundary' (which is set by default).
-#
-# When the element size is fully specified by a mesh size field (as it is in
-# this example), it is thus often desirable to set
-
-gmsh.option.setNumber("Mesh.MeshSizeExtendFromBoundary", 0)
-gmsh.option.setNumber("Mesh.MeshSizeFromPoints", 0)
-gmsh.option.setNumber("Mesh.MeshSizeFromCurvature", 0)
-
-# This will prevent over-refinement due to small mesh sizes on the boundary.
-
-# Finally, while the default "Frontal-Delaunay" 2D meshing algorithm
-# (Mesh.Algorithm = 6) usually leads to the highest quality meshes, the
-# "Delaunay" algorithm (Mesh.Algorithm = 5) will handle complex mesh size fields
-# better - in particular size fields with large element size gradients:
-
-gmsh.option.setNumber("Mesh.Algorithm", 5)
+# `Mesh.MeshSizeMax'] and multiplied by `Mesh.MeshSizeFactor'. The size is
+# fully specified by the fields here, so extrude.OPTIONS turns off the sizes
+# from the boundary, points and curvature.
 
-# Extrude the mesh
-h = 0.1
-ov = gmsh.model.geo.extrude([(2, 6)], 0, 0, h, [10], [1], recombine=True)
+tags = extrude.build_plate(params, report)
 
-gmsh.model.geo.synchronize()
-
-gmsh.model.geo.mesh.setTransfiniteCurve(22, 20,  meshType="Bump", coef=2)
-gmsh.model.geo.mesh.setTransfiniteCurve(18, 20,  meshType="Bump", coef=2)
-gmsh.model.geo.mesh.setTransfiniteCurve(13, 20, meshType="Bump", coef=2)
-gmsh.model.geo.mesh.setTransfiniteCurve(14, 20, meshType="Bump", coef=2)
-
-# gmsh.model.geo.mesh.setTransfiniteSurface(1, "Left", [1, 2, 3, 4])
-
-gmsh.model.geo.mesh.setTransfiniteVolume(1, [1, 2, 3, 4, 6, 7, 15, 11])
-
-# gmsh.model.mesh.embed(1, tl, 3, 1)
-
-# gmsh.model.mesh.recombine()
+# ----------------------------------------------------------------------------- #
+#
+# GENERATE MESH AND WRITE TO FILE
 
-gmsh.model.geo.synchronize()
+# the quadrangles of the bottom face, then the layers of hexahedra
+report.generate(3)
 
-gmsh.option.setNumber("Mesh.Smoothing", 100)
+# element size by distance to the impact axis (see meshtools/verify.py)
+report.verify(tags["line"], bins=[0, r2/2, r2, r1, 2*r1])
 
-gmsh.model.mesh.generate(3)
+thepath = args.string("outdir", "/Users/adminuser/meshes"); os.chdir(thepath)
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+report.write("extrude." + args.string("format", "msh"))
 
-thepath = "/Users/adminuser/meshes"; os.chdir(thepath)
-gmsh.write("extrude.msh")
+# print the time per stage and write it all to extrude-report.json
+report.finish()
 
 # # Launch the GUI to see the results:
 # if '-nopopup' not in sys.argv:
 #     gmsh.fltk.run()
 
-# gmsh.finalize()
\ No newline at end of file
+# gmsh.finalize()
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------- #
+#  multi-block structured all-hex plate with a graded impact block
+# ----------------------------------------------------------------------------- #
+
+import gmsh
+import sys
+import os
+
+# the blocks, their grading and the extrusion are in meshtools/blocks.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, blocks
+from meshtools.report import Report
+
+gmsh.initialize(sys.argv)
+
+model = gmsh.model
+mesh = model.mesh
+
+model.add("multiblock")
+
+# time, memory and mesh counts of each stage (meshtools/report.py)
+report = Report("multiblock-hex-plate")
+
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY AND BLOCKS
+
+# mesh size definitions
+#   lc = generic mesh size
+#   lcsmallest = element size in the centre block, around the impact axis
+#   lcedge = largest element size, at the plate edges
+#   growth = largest size ratio of neighbouring elements in the graded blocks
+#   layers = elements through the thickness (0: h / lcsmallest)
+#
+# plate geometry definitions
+#   h = height; l = length; r2 = half width of the centre block
+
+# (-setnumber lc <value> on the command line overrides it, see meshtools/args.py)
+lc = args.number("lc", 1e-1)
+lcsmallest = lc/100
+lcedge = lc/20
+growth = 1.2
+layers = int(args.number("layers", 0))
+
+h = 0.005
+l = 0.1
+
+r2 = l/10
+
+params = blocks.resolve(dict(lc=lc, lcsmallest=lcsmallest, lcedge=lcedge, growth=growth,
+                             layers=layers or None, h=h, l=l, r2=r2))
+
+with report.stage("geometry"):
+    tags = blocks.build_plate(params)
+
+# ----------------------------------------------------------------------------- #
+#
+# GENERATE MESH AND WRITE TO FILE
+
+# the blocks are transfinite and extruded, so this is all hexahedra straight away
+report.generate(3)
+
+# element size in the centre block and the graded blocks (see meshtools/verify.py)
+report.verify(tags["line"], bins=[0, r2, l/2])
+
+thepath = args.string("outdir", "/Users/adminuser/meshes"); os.chdir(thepath)
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+report.write("multiblock." + args.string("format", "msh"))
+
+# print the time per stage and write it all to multiblock-report.json
+report.finish()
+
+# # launch the GUI to see the results:
+# if '-nopopup' not in sys.argv:
+#     gmsh.fltk.run()
+# gmsh.finalize()
@@ -0,0 +1,76 @@
+# ----------------------------------------------------------------------------- #
+#  O-grid structured all-hex cylinder with radial grading to the impact axis
+# ----------------------------------------------------------------------------- #
+
+import gmsh
+import sys
+import os
+
+# the O-grid blocks, their grading and the extrusion are in meshtools/blocks.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, blocks
+from meshtools.report import Report
+
+gmsh.initialize(sys.argv)
+
+model = gmsh.model
+mesh = model.mesh
+
+model.add("ogrid")
+
+# time, memory and mesh counts of each stage (meshtools/report.py)
+report = Report("ogrid-hex-cyl")
+
+# ----------------------------------------------------------------------------- #
+#
+# GEOMETRY AND BLOCKS
+
+# mesh size definitions
+#   lc = generic mesh size
+#   lcsmallest = element size in the centre block, around the impact axis
+#   lcedge = largest radial element size, at the rim (at most the size along it)
+#   growth = largest radial size ratio of neighbouring elements in the curved blocks
+#   layers = elements through the thickness (0: h / lcsmallest)
+#
+# cylinder geometry definitions, as in ustruc-cyl.py
+#   h = height; rcyl = radius; r2 = half width of the centre block
+
+# (-setnumber lc <value> on the command line overrides it, see meshtools/args.py)
+lc = args.number("lc", 1e-1)
+lcsmallest = lc/140
+lcedge = lc/20
+growth = 1.2
+layers = int(args.number("layers", 0))
+
+h = 0.005
+rcyl = 0.03025
+
+r2 = rcyl/3
+
+params = blocks.resolve(dict(lc=lc, lcsmallest=lcsmallest, lcedge=lcedge, growth=growth,
+                             layers=layers or None, h=h, rcyl=rcyl, r2=r2), "cylinder")
+
+with report.stage("geometry"):
+    tags = blocks.build_cylinder(params)
+
+# ----------------------------------------------------------------------------- #
+#
+# GENERATE MESH AND WRITE TO FILE
+
+# the blocks are transfinite and extruded, so this is all hexahedra straight away
+report.generate(3)
+
+# element size in the centre block and the curved blocks (see meshtools/verify.py)
+report.verify(tags["line"], bins=[0, r2, rcyl])
+
+thepath = args.string("outdir", "/Users/adminuser/meshes"); os.chdir(thepath)
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+report.write("ogrid." + args.string("format", "msh"))
+
+# print the time per stage and write it all to ogrid-report.json
+report.finish()
+
+# # launch the GUI to see the results:
+# if '-nopopup' not in sys.argv:
+#     gmsh.fltk.run()
+# gmsh.finalize()
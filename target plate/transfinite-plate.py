@@ -10,6 +10,11 @@ import math
 import sys
 import os
 
+# time, memory and mesh counts of each stage are written to a JSON run report
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args
+from meshtools.report import Report
+
 gmsh.initialize(sys.argv)
 
 model = gmsh.model 
@@ -19,6 +24,8 @@ option = gmsh.option
 
 model.add("t6")
 
+report = Report("transfinite-plate")
+
 # ----------------------------------------------------------------------------- #
 # 
 # MESHING OPTIONS
@@ -43,6 +50,8 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # occmetry size definitions
 lc = 1e-1
 h = 0.05
@@ -51,8 +60,9 @@ l = 0.5
 ll = l/2
 
 # mesh size definitions
-nh = 3
-nl = 20
+# (-setnumber nh <value> on the command line overrides it, see meshtools/args.py)
+nh = int(args.number("nh", 3))
+nl = int(args.number("nl", 20))
 
 # CREATE occMETRY
 
@@ -124,6 +134,8 @@ occ.synchronize()
 # 
 #  MESH REFINEMENT
 
+report.start("fields")
+
 # embed a points around which to refine the mesh
 ps = model.occ.addPoint(ll, ll, 0, lc)
 pf = model.occ.addPoint(ll, ll, h, lc)
@@ -195,6 +207,8 @@ occ.synchronize()
 # 
 # SET UP TRANSFINITE INTERPOLATION
 
+report.start("transfinite")
+
 num_nodes = nl+1
 for curve in [1, 2, 3, 4, 5, 6, 7, 8]:
     mesh.setTransfiniteCurve(curve, num_nodes, "Bump", coef=-20)
@@ -214,11 +228,16 @@ occ.synchronize()
 
 # GENERATE MESH AND WRITE TO FILE
 
-mesh.generate(3)
+report.generate(3)
+report.start("recombine")
 mesh.recombine()
 
-thepath = "/Users/adminuser/meshes"; os.chdir(thepath)
-gmsh.write("transfinite.msh")
+thepath = args.string("outdir", "/Users/adminuser/meshes"); os.chdir(thepath)
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+report.write("transfinite." + args.string("format", "msh"))
+
+# print the time per stage and write it all to transfinite-report.json
+report.finish()
 
 # # launch the GUI to see the results:
 # if '-nopopup' not in sys.argv:
@@ -5,11 +5,13 @@
 # -------------------------------------------------------------------------------------- #
 
 import gmsh
-import math
 import sys
 import os
-import numpy as np
-import time
+
+# geometry, fields and options are shared with the sweep runner (meshtools/targets.py)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, meshcache, predict, targets, threads
+from meshtools.report import Report
 
 gmsh.initialize(sys.argv)
 
@@ -19,84 +21,27 @@ option = gmsh.option
 
 model.add("t6")
 
-# Start timer
-start_time = time.perf_counter()
+# time, memory and mesh counts of each stage (meshtools/report.py)
+report = Report("ustruc-cyl")
+
+# thread count from the measured scaling curve and the other jobs on the host
+# (-nt <n> on the command line overrides it, see meshtools/threads.py)
+threads.auto("ustruc-cyl")
 
 # ----------------------------------------------------------------------------- #
 # 
 # MESHING OPTIONS
 
-# recombination tet -> hex algorithm specification
-# 5 and 8 are ok - 5 handles mesh gradients better. 1 decides for itself
-option.setNumber("Mesh.Algorithm", 1)
-# 1: MeshAdapt, 2: Automatic, 3: Initial mesh only, 5: Delaunay, 6: Frontal-Delaunay, 
-# 7: BAMG, 8: Frontal-Delaunay for Quads, 9: Packing of Parallelograms, 11: Quasi-structured Quad
-
-option.setNumber("Mesh.Algorithm3D", 10)
-# 1: Delaunay, 3: Initial mesh only, 4: Frontal, 7: MMG3D, 9: R-tree, 10: HXT
-
-option.setNumber("Mesh.RecombinationAlgorithm", 0)
-# 0: simple, 1: blossom, 2: simple full-quad, 3: blossom full-quad
-
-option.setNumber("Mesh.SubdivisionAlgorithm", 2)
-# 0: none, 1: all quadrangles, 2: all hexahedra, 3: barycentric
-
-option.setNumber("Mesh.RecombineNodeRepositioning", 0)
-
-# turn on recombination:
-option.setNumber("Mesh.RecombineAll", 1)
-option.setNumber("Mesh.Recombine3DAll", 1)
-
-option.setNumber('Mesh.Recombine3DLevel', 0)
-# 0: hex, 1: hex+prisms, 2: hex+prism+pyramids
-
-option.setNumber("Mesh.RecombineOptimizeTopology", 10)
-# Number of topological optimization passes (removal of diamonds, ...) of recombined surface meshes
-# Default value: 5 
-
-option.setNumber("Mesh.RecombineMinimumQuality", 10)
-# Default value: 0.01
+# recombination tet -> hex algorithm specification, see targets.RECOMBINE_OPTIONS
+# for the full list and what each value means
+targets.set_options(targets.RECOMBINE_OPTIONS)
 
-option.setNumber("Mesh.Recombine3DConformity", 4)
-# 0: nonconforming, 1: trihedra, 2: pyramids+trihedra, 
-# 3:pyramids+hexSplit+trihedra, 4:hexSplit+trihedra
-
-option.setNumber('Mesh.SecondOrderLinear', 1)
-
-option.setNumber('Mesh.QuadqsTopologyOptimizationMethods', 111)
-# 0: default (all),100: pattern-based CAD faces,010: disk quadrangulation remeshing,
-# 001: cavity remeshing,xxx: combination of multiple methods (e.g. 111 for all)
-
-option.setNumber('Mesh.QuadqsRemeshingBoldness', 0.5)
-# From 0 (no quality decrease during remeshing) to 1 (quality can tend to 0 during remeshing).
-# Default value: 0.66
-
-option.setNumber('Mesh.QuadqsSizemapMethod', 3)
-# 0: default, 1: cross-field,2: cross-field + CAD small features adaptation,
-# 3: from background mesh (e.g. sizes in current triangulation),
-# 4: cross-field + CAD small features adaptation (clamped by background mesh)
 # option.setNumber('Mesh.SmoothCrossField', 2) 
-
-# apply an elliptic smoother to the grid to have a more regular mesh:
-option.setNumber("Mesh.Smoothing", 100)
-option.setNumber("Mesh.SmoothNormals", 1)
-option.setNumber("Mesh.SmoothCrossField", 1)
-
-option.setNumber("Mesh.ElementOrder", 1)
 # option.setNumber("Mesh.HighOrderOptimize", 1)
 
-# when the element size is fully specified by a mesh size field, set:
-option.setNumber("Mesh.MeshSizeExtendFromBoundary", 0)
-# 0: never; 1: for surfaces and volumes; 2: for surfaces and volumes, 
-# but use smallest surface element edge length instead of longest length in 3D Delaunay; 
-# -2: only for surfaces; -3: only for volumes
-
-option.setNumber("Mesh.MeshSizeFromPoints", 0)
-option.setNumber("Mesh.MeshSizeFromCurvature", 0)
-
 # ----------------------------------------------------------------------------- #
 # 
-# GEOMETRY
+# GEOMETRY AND MESH REFINEMENT
 
 # mesh size definitions
 #   lc = generic mesh size
@@ -106,105 +51,49 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 #   lcsmallest = inner cylinder of fully refined mesh size
 #   r1 = radius of semi-refined outer cylinder
 #   r2 = radius of refined inner cylinder
+#   F = size function of the distance F1 to line l (lcsmallest is added to it)
 # 
 # plate geometry definitions
 #   h = height; rcyl = radius
 
-lc = 1e-1
+# (-setnumber lc <value> on the command line overrides it, see meshtools/args.py)
+lc = args.number("lc", 1e-1)
 lcsmaller = lc/60
 lcsmallest= lc/140
 lcmin = 0.00005
 lcmax = 1
 
 h = 0.005
-hh = h/2
 rcyl = 0.03025
-rrcyl = rcyl/2
 
 r1 = rcyl/2
 r2 = rcyl/3
 
-# mesh size constraints
-option.setNumber("Mesh.MeshSizeMax", lcmax)
-option.setNumber("Mesh.MeshSizeMin", lcmin)
-
-# add lower and upper circles
-# label = model.occ.addCircle(x, y, z, radius)
-C1 = model.occ.addCircle(0, 0, 0, rcyl)
-C2 = model.occ.addCircle(0, 0, h, rcyl)
-
-# add circle curve loops
-model.occ.addCurveLoop([C1], 101)
-model.occ.addCurveLoop([C2], 102)
-
-# circle surfaces
-model.occ.addPlaneSurface([101], 201)
-model.occ.addPlaneSurface([102], 202)
-
-# join circles and make volume
-model.occ.addThruSections([101, 102], 301, makeSolid=True, smoothing=True)
-
-model.occ.synchronize()
-
-# ----------------------------------------------------------------------------- #
-# 
-# MESH REFINEMENT 
-
-# define a line via two points around which to refine the mesh
-ps = model.occ.addPoint(0, 0, 0, lc)
-pf = model.occ.addPoint(0, 0, h, lc)
-l = model.occ.addLine(ps, pf)
-
-model.occ.synchronize()
-
-# embed line into the volume
-model.occ.fragment([(1, l)], [(3, 301)])
-
-model.occ.synchronize()
-
-# define a distance field for mesh refinement around line l
-mesh.field.add("Distance", 1)
-mesh.field.setNumbers(1, "CurvesList", [l])
-
-# math eval to determine the mesh size (quadratic depending on distance to line l)
-mesh.field.add("MathEval", 2)
-mesh.field.setString(2, "F", "8.8*F1^2 +" + str(lcsmallest))
-
-# define two cylinder fields
-# inside and outside of which mesh size is determined
-mesh.field.add("Cylinder", 4)
-mesh.field.setNumber(4, "Radius", r1)
-mesh.field.setNumber(4, "VIn", lcsmaller) 
-mesh.field.setNumber(4, "VOut", lc) 
-mesh.field.setNumber(4, "XAxis", 0) 
-mesh.field.setNumber(4, "XCenter", 0) 
-mesh.field.setNumber(4, "YAxis", 0) 
-mesh.field.setNumber(4, "YCenter", 0) 
-mesh.field.setNumber(4, "ZCenter", 0) 
-mesh.field.setNumber(4, "ZAxis", 1)
-
-mesh.field.add("Cylinder", 5)
-mesh.field.setNumber(5, "Radius", r2)
-mesh.field.setNumber(5, "VIn", lcsmallest) 
-mesh.field.setNumber(5, "VOut", lc) 
-mesh.field.setNumber(5, "XAxis", 0) 
-mesh.field.setNumber(5, "XCenter", 0) 
-mesh.field.setNumber(5, "YAxis", 0) 
-mesh.field.setNumber(5, "YCenter", 0) 
-mesh.field.setNumber(5, "ZCenter", 0) 
-mesh.field.setNumber(5, "ZAxis", 1)
-
-# define a field that mandates the minimum element size of all fields
-mesh.field.add("Min", 7)
-mesh.field.setNumbers(7, "FieldsList", [2, 4, 5])
-
-mesh.field.setAsBackgroundMesh(7)  
-
-# mesh constraints
-def meshSizeCallback(dim, tag, x, y, z, lc):
-    return max(lc, 0.0001)
-
-gmsh.model.mesh.setSizeCallback(meshSizeCallback)
+F = "8.8*F1^2"
+
+params = targets.resolve("cylinder", dict(
+    lc=lc, lcsmaller=lcsmaller, lcsmallest=lcsmallest, lcmin=lcmin, lcmax=lcmax,
+    h=h, rcyl=rcyl, r1=r1, r2=r2, F=F,
+    # size callback, removes any elements that are too small. compiled into
+    # MeshSizeMin/Max when possible (native_sizing=False calls python instead)
+    callback="max(lc, 0.0001)",
+    # "fields" lets gmsh evaluate the field chain, "sampled" evaluates it once
+    # in numpy on a cached grid and loads it as the background mesh
+    background="fields",
+    # optimise passes run after generate(3)
+    optimize=[("Laplace2D", 3)],
+    # ("Relocate3D", 1), ("Netgen", 1), ("UntangleMeshGeometry", 1)
+    # -setnumber refine_within <d> refines only the elements within d of line l
+    # instead of all of them (see meshtools/localrefine.py)
+    refine_within=args.number("refine_within", None),
+    # -setnumber symmetry 4 (2) meshes a quarter (half) of the cylinder and mirrors
+    # it into the whole target (see meshtools/symmetry.py)
+    symmetry=int(args.number("symmetry", 1)),
+))
+
+# OpenCascade cylinder with line l fragmented into it, Distance -> MathEval
+# and two Cylinder fields
+tags = targets.build("cylinder", params, report)
 
 model.occ.synchronize()
 
@@ -212,27 +101,51 @@ model.occ.synchronize()
 # 
 # GENERATE MESH AND WRITE TO FILE 
 
-# generate 3D mesh
-mesh.generate(3)
-
-# optimise and refine the mesh
-# mesh.optimize("Relocate3D")
-# mesh.optimize("Netgen")
-mesh.optimize("Laplace2D", niter=3)
-# mesh.optimize("UntangleMeshGeometry", force=True, niter=1)
-# mesh.optimize("QuadCavityRemeshing", force=True)
-# mesh.optimize("QuadQuasiStructured", force=True, niter=3)
-
-mesh.refine()
-
-thepath = "/Users/adminuser/meshes"; os.chdir(thepath)
-gmsh.write("ustruct-cylinder.msh")
-
-# End timer
-end_time = time.perf_counter()
-# Calculate elapsed time
-elapsed_time = end_time - start_time
-print("Elapsed time: ", elapsed_time)
+# -setnumber mesh_cache 0 always meshes, otherwise the mesh of an earlier run
+# with the same geometry, fields, options and parameters is loaded from the
+# cache (see meshtools/meshcache.py)
+use_cache = bool(args.number("mesh_cache", 1))
+dry_run = args.number("dry_run", 0)
+cache_key = meshcache.key("ustruc-cyl", params) if use_cache else None
+cached = use_cache and not dry_run and meshcache.load(cache_key, tags, report)
+
+# predicted elements, nodes, peak memory and time of a run that meshes. -setnumber
+# dry_run 1 stops here, and a run over -setnumber max_memory_mb (default: the
+# memory available) or max_wall_s is refused before meshing (meshtools/predict.py)
+if not cached:
+    predict.guard("ustruc-cyl", "cylinder", params, report, dry_run=dry_run,
+                  max_memory_mb=args.number("max_memory_mb", None), max_wall_s=args.number("max_wall_s", None))
+
+if cached:
+    print("mesh loaded from the cache: " + cache_key)
+elif params["refine_within"] is not None or params["symmetry"] != 1:
+    # tetrahedra, split near line l, subdivided into hexahedra and optimised,
+    # and the half or quarter mirrored into the whole target
+    targets.generate(params, report, tags)
+else:
+    # generate 3D mesh
+    report.generate(3)
+
+    # optimise and refine the mesh
+    targets.optimize(params["optimize"], report)
+    # mesh.optimize("QuadCavityRemeshing", force=True)
+    # mesh.optimize("QuadQuasiStructured", force=True, niter=3)
+
+    report.refine()
+
+if use_cache and not cached:
+    meshcache.store(cache_key, tags, report, params=params)
+
+# element quality and the element size by distance to line l, the check that
+# used to be done in LS-PrePost (see meshtools/verify.py)
+report.verify(tags["line"], bins=[0, r2/2, r2, r1, 2*r1])
+
+thepath = args.string("outdir", "/Users/adminuser/meshes"); os.chdir(thepath)
+# (-setstring format k writes an LS-DYNA keyword file instead, see meshtools/lsdyna.py)
+report.write("ustruct-cylinder." + args.string("format", "msh"))
+
+# print the time per stage and write it all to ustruct-cylinder-report.json
+report.finish()
 
 # # launch the GUI to see the results:
 # if '-nopopup' not in sys.argv:
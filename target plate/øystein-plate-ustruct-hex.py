@@ -9,7 +9,12 @@ import math
 import sys
 import os
 import numpy as np
-import time
+
+# size callbacks are compiled into native gmsh settings by meshtools/sizing.py,
+# the time, memory and mesh counts of each stage go to a JSON run report
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, background, sizing
+from meshtools.report import Report
 
 gmsh.initialize(sys.argv)
 
@@ -19,8 +24,8 @@ option = gmsh.option
 
 model.add("t6")
 
-# Start timer
-start_time = time.perf_counter()
+# time, memory and mesh counts of each stage (meshtools/report.py)
+report = Report("øystein-plate-ustruct-hex")
 
 # ----------------------------------------------------------------------------- #
 # 
@@ -97,6 +102,8 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # mesh size definitions
 #   lc = generic mesh size
 #   lcmin = minimum refined mesh size
@@ -182,6 +189,8 @@ model.geo.synchronize()
 # 
 # MESH REFINEMENT 
 
+report.start("fields")
+
 # define a line via two points around which to refine the mesh
 ps = model.geo.addPoint(ll, ll, 0, lc)
 pf = model.geo.addPoint(ll, ll, h, lc)
@@ -233,18 +242,25 @@ mesh.field.setNumber(5, "ZAxis", 1)
 mesh.field.add("Min", 7)
 mesh.field.setNumbers(7, "FieldsList", [2, 4, 5])
 
-mesh.field.setAsBackgroundMesh(7)  
+# -setstring background sampled evaluates this Min field once in numpy on a
+# cached grid and uses that as the background mesh instead (meshtools/background.py).
+# l is line l by now, the plate is 2*ll wide
+if args.string("background", "fields") == "sampled":
+    background_field, info = background.apply("plate", dict(
+        lc=lc, lcsmaller=lcsmaller, lcsmallest=lcsmallest, r1=r1, r2=r2, F="0.8*F1^2", h=h, l=2*ll), (ll, ll))
+    report.info["background"] = info
+else:
+    background_field = 7
+    mesh.field.setAsBackgroundMesh(7)
 
 # mesh constraints
-# model.mesh.setSizeCallback(3, 1, ll, ll, hh, 0.001)
-def meshSizeCallback(dim, tag, x, y, z, lc):
-    return max(lc, 0.005)
-
-gmsh.model.mesh.setSizeCallback(meshSizeCallback)
-
 option.setNumber("Mesh.MeshSizeMax", lcmax)
 option.setNumber("Mesh.MeshSizeMin", lcmin)
 
+# model.mesh.setSizeCallback(3, 1, ll, ll, hh, 0.001)
+# the callback is compiled against the limits above, so it has to come after them
+sizing.apply("max(lc, 0.005)", background=background_field)
+
 model.geo.synchronize()
 
 # ----------------------------------------------------------------------------- #
@@ -252,23 +268,20 @@ model.geo.synchronize()
 # GENERATE MESH AND WRITE TO FILE 
 
 # generate 3D mesh
-mesh.generate(3)
+report.generate(3)
 
 # optimise and refine the mesh
-mesh.optimize("UntangleMeshGeometry", force=True, niter=1)
+report.optimize("UntangleMeshGeometry", force=True, niter=1)
 # mesh.optimize("QuadCavityRemeshing", force=True)
 # mesh.optimize("QuadQuasiStructured", force=True, niter=3)
 
-mesh.refine()
+report.refine()
 
 thepath = "/Users/adminuser/meshes"; os.chdir(thepath)
-gmsh.write("øystein-ustruct-refined.msh")
+report.write("øystein-ustruct-refined.msh")
 
-# End timer
-end_time = time.perf_counter()
-# Calculate elapsed time
-elapsed_time = end_time - start_time
-print("Elapsed time: ", elapsed_time)
+# print the time per stage and write it all to øystein-ustruct-refined-report.json
+report.finish()
 
 # # launch the GUI to see the results:
 # if '-nopopup' not in sys.argv:
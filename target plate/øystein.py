@@ -9,7 +9,11 @@ import math
 import sys
 import os
 import numpy as np
-import time
+
+# time, memory and mesh counts of each stage are written to a JSON run report
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import args, background
+from meshtools.report import Report
 
 gmsh.initialize(sys.argv)
 
@@ -19,8 +23,8 @@ option = gmsh.option
 
 model.add("t6")
 
-# Start timer
-start_time = time.perf_counter()
+# time, memory and mesh counts of each stage (meshtools/report.py)
+report = Report("øystein")
 
 # ----------------------------------------------------------------------------- #
 # 
@@ -98,6 +102,8 @@ option.setNumber("Mesh.MeshSizeFromCurvature", 0)
 # 
 # GEOMETRY
 
+report.start("geometry")
+
 # mesh size definitions
 #   lc = generic mesh size
 #   lcmin = minimum refined mesh size
@@ -187,6 +193,8 @@ model.geo.synchronize()
 # 
 # MESH REFINEMENT 
 
+report.start("fields")
+
 # define a line via two points around which to refine the mesh
 ps = model.geo.addPoint(ll, ll, 0, lc)
 pf = model.geo.addPoint(ll, ll, h, lc)
@@ -237,7 +245,15 @@ mesh.field.setNumber(5, "ZAxis", 1000)
 mesh.field.add("Min", 7)
 mesh.field.setNumbers(7, "FieldsList", [2, 4, 5])
 
-mesh.field.setAsBackgroundMesh(7)  
+# -setstring background sampled evaluates this Min field once in numpy on a
+# cached grid and uses that as the background mesh instead (meshtools/background.py).
+# l is line l by now, the plate is 2*ll wide
+if args.string("background", "fields") == "sampled":
+    info = background.apply("plate", dict(
+        lc=lc, lcsmaller=lcsmaller, lcsmallest=lcsmallest, r1=r1, r2=r2, F="0.000003*F1^3", h=h, l=2*ll, zaxis=1000), (ll, ll))[1]
+    report.info["background"] = info
+else:
+    mesh.field.setAsBackgroundMesh(7)
 
 model.geo.synchronize()
 
@@ -246,26 +262,23 @@ model.geo.synchronize()
 # GENERATE MESH AND WRITE TO FILE 
 
 # generate 3D mesh
-mesh.generate(3)
+report.generate(3)
 
 # optimise and refine the mesh
-mesh.optimize("Relocate3D")
-mesh.optimize("Netgen")
-mesh.optimize("Laplace2D")
+report.optimize("Relocate3D")
+report.optimize("Netgen")
+report.optimize("Laplace2D")
 # mesh.optimize("UntangleMeshGeometry")
 # mesh.optimize("QuadCavityRemeshing", force=True, niter=1)
 # mesh.optimize("QuadQuasiStructured", force=True, niter=1)
 
-mesh.refine()
+report.refine()
 
 thepath = "/Users/adminuser/meshes"; os.chdir(thepath)
-gmsh.write("ustruct-100mm.msh")
+report.write("ustruct-100mm.msh")
 
-# End timer
-end_time = time.perf_counter()
-# Calculate elapsed time
-elapsed_time = end_time - start_time
-print("Elapsed time: ", elapsed_time)
+# print the time per stage and write it all to ustruct-100mm-report.json
+report.finish()
 
 # # launch the GUI to see the results:
 # if '-nopopup' not in sys.argv:
@@ -0,0 +1,42 @@
+# pipeline checkpoints (meshtools/pipeline.py) are pruned least recently used
+# first, never the last one of the run just finished
+
+import os
+import sys
+
+import gmsh
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import cache, pipeline
+
+
+def run_box(lc):
+    """mesh and refine a box as a pipeline, returns its log and checkpoint paths"""
+    gmsh.initialize()
+    try:
+        gmsh.option.setNumber("General.Terminal", 0)
+        gmsh.model.occ.addBox(0, 0, 0, 1, 1, 1)
+        gmsh.model.occ.synchronize()
+        gmsh.model.mesh.setSize(gmsh.model.getEntities(0), lc)
+        stages = pipeline.Pipeline("box", lc=lc).generate(3).optimize("Netgen").refine()
+        log = stages.run()
+        return log, [stages._path(key) for key in stages.keys()]
+    finally:
+        gmsh.finalize()
+
+
+def test_prune_keeps_last_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(cache, "ROOT", str(tmp_path))
+    monkeypatch.setattr(pipeline, "MAX_MB", 1e6)
+    log, paths = run_box(0.5)
+    assert [how for _, how, _ in log] == ["ran"] * 3
+    assert all(os.path.exists(path) for path in paths)
+
+    # a run under a tight limit removes the older checkpoints, its last stays
+    monkeypatch.setattr(pipeline, "MAX_MB", 0)
+    log, paths = run_box(0.4)
+    assert [path for path, _, _ in pipeline.checkpoints()] == [paths[-1]]
+
+    # and is resumed from
+    log, _ = run_box(0.4)
+    assert log[0][:2] == ("refine", "resumed")
@@ -0,0 +1,40 @@
+# compiled size callbacks (meshtools/sizing.py) must mesh exactly like the
+# python callbacks they replace
+
+import os
+import sys
+
+import gmsh
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from meshtools import sizing
+
+
+def line_nodes(expression, native, size_min, size_max):
+    """nodes of a 1D mesh of a line of length 4 with the callback applied"""
+    gmsh.initialize()
+    try:
+        gmsh.option.setNumber("General.Terminal", 0)
+        gmsh.model.geo.addPoint(0, 0, 0)
+        gmsh.model.geo.addPoint(4, 0, 0)
+        gmsh.model.geo.addLine(1, 2)
+        gmsh.model.geo.synchronize()
+        gmsh.option.setNumber("Mesh.MeshSizeMin", size_min)
+        gmsh.option.setNumber("Mesh.MeshSizeMax", size_max)
+        mode = sizing.apply(expression, native=native).mode
+        gmsh.model.mesh.generate(1)
+        return len(gmsh.model.mesh.getNodes()[0]), mode
+    finally:
+        gmsh.finalize()
+
+
+@pytest.mark.parametrize("expression", ["max(lc, 0.0001)", "max(0.5, lc)", "lc/8",
+                                        "min(max(2*lc, 0.1), 0.2)"])
+@pytest.mark.parametrize("size_min, size_max", [(0.1, 0.3), (0.25, 0.15), (0.95, 0.75)])
+def test_compiled_matches_python(expression, size_min, size_max):
+    # MeshSizeMin > MeshSizeMax (as bullet-core-tet.py sets them): gmsh lets
+    # MeshSizeMax win, and so must the folded limits
+    nodes, mode = line_nodes(expression, True, size_min, size_max)
+    assert mode == "options"
+    assert nodes == line_nodes(expression, False, size_min, size_max)[0]